@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""Synthetic data and helpers of the benchmarks (they require pytest-benchmark)."""
+
+import os
+import tracemalloc
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel.tck import TckWriter
+from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+
+# grid of the reference images (2 mm isotropic, centered on the origin)
+SHAPE = (80, 96, 80)
+AFFINE = np.array([[2., 0., 0., -80.],
+                   [0., 2., 0., -96.],
+                   [0., 0., 2., -80.],
+                   [0., 0., 0., 1.]])
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('trampolino')
+    group.addoption('--streamlines', default='10000,100000',
+                    help='Sizes (number of streamlines) of the synthetic tractograms, '
+                         'e.g. 10000,100000,1000000,10000000')
+    group.addoption('--rounds', type=int, default=3,
+                    help='Number of timed runs of each benchmark')
+    group.addoption('--data_dir',
+                    help='Directory of the synthetic data (by default, in the pytest cache)')
+
+
+def pytest_generate_tests(metafunc):
+    if 'nb_streamlines' in metafunc.fixturenames:
+        sizes = [int(s) for s in metafunc.config.getoption('streamlines').split(',')]
+        metafunc.parametrize('nb_streamlines', sizes, scope='session')
+
+
+def synthetic_tractogram(filename, nb_streamlines, seed=0, step=1., chunk_size=100000):
+    """Writes smooth random walks (20 to 100 points, `step` mm apart) inside the grid.
+
+    The streamlines are generated and written chunk by chunk, so that any
+    size fits in memory.
+    """
+
+    rng = np.random.RandomState(seed)
+    low = AFFINE[:3, 3]
+    high = low + np.array(SHAPE) * np.diag(AFFINE)[:3]
+    with TckWriter(filename) as writer:
+        for start in range(0, nb_streamlines, chunk_size):
+            n = min(chunk_size, nb_streamlines - start)
+            lengths = rng.randint(20, 101, size=n)
+            owner = np.repeat(np.arange(n), lengths)
+            direction = rng.normal(size=(n, 3))
+            direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+            steps = direction[owner] + rng.normal(scale=0.2, size=(len(owner), 3))
+            steps *= step / np.linalg.norm(steps, axis=1, keepdims=True)
+            first = np.cumsum(lengths) - lengths
+            steps[first] = rng.uniform(low + 40, high - 40, size=(n, 3))
+            # cumulative sum restarted at the first point of each streamline
+            points = np.cumsum(steps, axis=0)
+            points -= np.repeat(points[first] - steps[first], lengths, axis=0)
+            writer.append(np.clip(points, low, high - 1e-3).astype(np.float32), lengths)
+
+
+def reference_images(data_dir):
+    """Writes the reference images: a white matter density (also used as a
+    single-volume FOD), a parcellation of 64 regions and two spherical ROIs."""
+
+    files = {name: os.path.join(data_dir, name + '.nii.gz')
+             for name in ('wm', 'parc', 'roi_a', 'roi_b')}
+    if all(os.path.exists(f) for f in files.values()):
+        return files
+
+    grid = np.stack(np.meshgrid(*[np.arange(s) for s in SHAPE], indexing='ij'), axis=-1)
+    center = (np.array(SHAPE) - 1) / 2.
+    radius = np.linalg.norm((grid - center) / center, axis=-1)
+    wm = np.clip(1.2 - radius, 0, 1).astype(np.float32)
+    nib.save(nib.Nifti1Image(wm, AFFINE), files['wm'])
+    blocks = np.minimum(grid * 4 // np.array(SHAPE), 3)
+    parc = (1 + blocks[..., 0] * 16 + blocks[..., 1] * 4 + blocks[..., 2]) * (radius < 1)
+    nib.save(nib.Nifti1Image(parc.astype(np.int16), AFFINE), files['parc'])
+    for name, offset in (('roi_a', -15), ('roi_b', 15)):
+        roi = np.linalg.norm(grid - center - [offset, 0, 0], axis=-1) < 10
+        nib.save(nib.Nifti1Image(roi.astype(np.uint8), AFFINE), files[name])
+    return files
+
+
+@pytest.fixture(scope='session')
+def data_dir(request):
+    """Directory of the synthetic data, kept across runs."""
+    data_dir = request.config.getoption('data_dir')
+    if data_dir:
+        os.makedirs(data_dir, exist_ok=True)
+        return data_dir
+    return str(request.config.cache.mkdir('trampolino_benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def images(data_dir):
+    return reference_images(data_dir)
+
+
+@pytest.fixture(scope='session')
+def tractogram(data_dir, images, nb_streamlines):
+    """Synthetic tractogram of `nb_streamlines`, in .tck and .trk."""
+    tck = os.path.join(data_dir, 'synthetic_{}.tck'.format(nb_streamlines))
+    trk = os.path.splitext(tck)[0] + '.trk'
+    if not os.path.exists(tck):
+        synthetic_tractogram(tck, nb_streamlines)
+    if not os.path.exists(trk):
+        tck2trk(tck, images['wm'], trk, chunk_size=100000)
+    return {'tck': tck, 'trk': trk, 'nb_streamlines': nb_streamlines}
+
+
+def peak_memory(function):
+    """Peak of the memory allocated (in MB) while running a function.
+
+    The memory-mapped tractograms are not counted, only the allocations
+    (including the numpy arrays) made by the function.
+    """
+
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 2. ** 20
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture
+def measure(benchmark, request, tmpdir):
+    """Times a function on a tractogram and records its throughput and peak memory.
+
+    The function runs in a temporary directory, emptied before each run
+    (unless another `setup` is given), so that no index or output of a
+    previous run is reused. The throughput (streamlines per second) and the
+    peak memory are saved with the timings, so that they are kept in the
+    history of the runs (--benchmark-autosave).
+    """
+
+    def clean():
+        for f in tmpdir.listdir():
+            f.remove(rec=1)
+
+    def run(function, nb_streamlines, setup=clean):
+        tmpdir.chdir()
+        result = benchmark.pedantic(function, setup=setup, iterations=1,
+                                    rounds=request.config.getoption('rounds'))
+        benchmark.extra_info['nb_streamlines'] = nb_streamlines
+        benchmark.extra_info['streamlines_per_s'] = nb_streamlines / benchmark.stats.stats.mean
+        setup()
+        benchmark.extra_info['peak_memory_mb'] = peak_memory(function)
+        return result
+
+    return run
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the conversion and the merge of tractograms."""
+
+import pytest
+
+from trampolino.workflows.interfaces.nibabel import (Tck2Trk, Trk2Tck, Tck2Tcz, Tcz2Tck,
+                                                     MergeTractograms)
+
+
+def whole(chunk_size, nb_streamlines):
+    """The whole tractogram is loaded in memory only up to a million streamlines."""
+    if chunk_size == 0 and nb_streamlines > 1000000:
+        pytest.skip('whole tractogram conversion of more than 1M streamlines')
+
+
+@pytest.mark.parametrize('chunk_size', [0, 100000])
+def test_tck2trk(measure, tractogram, images, chunk_size):
+    n = tractogram['nb_streamlines']
+    whole(chunk_size, n)
+    measure(Tck2Trk(input_tck=tractogram['tck'], input_ref=images['wm'],
+                    chunk_size=chunk_size).run, n)
+
+
+@pytest.mark.parametrize('chunk_size', [0, 100000])
+def test_trk2tck(measure, tractogram, chunk_size):
+    n = tractogram['nb_streamlines']
+    whole(chunk_size, n)
+    measure(Trk2Tck(input_trk=tractogram['trk'], chunk_size=chunk_size).run, n)
+
+
+def test_tck2tcz(measure, tractogram):
+    measure(Tck2Tcz(input_tck=tractogram['tck']).run, tractogram['nb_streamlines'])
+
+
+def test_tcz2tck(measure, tractogram, tmpdir_factory):
+    tcz = Tck2Tcz(input_tck=tractogram['tck'])
+    tcz.inputs.output_tcz = str(tmpdir_factory.mktemp('tcz').join('track.tcz'))
+    tcz.run()
+    measure(Tcz2Tck(input_tcz=tcz.inputs.output_tcz).run, tractogram['nb_streamlines'])
+
+
+@pytest.mark.parametrize('ext', ['tck', 'trk'])
+def test_merge(measure, tractogram, ext):
+    """Merge of four members (copies of the tractogram)."""
+    measure(MergeTractograms(in_files=[tractogram[ext]] * 4).run,
+            4 * tractogram['nb_streamlines'])
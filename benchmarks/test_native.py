@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks of the native filters, maps and connectomes."""
+
+import pytest
+
+from trampolino.workflows.interfaces.nibabel import (SampleTractogram, QueryTractogram,
+                                                     FilterStreamlines, ResampleStreamlines,
+                                                     EstimateWeights, TrackDensity,
+                                                     ComputeConnectome, ExtractEndpoints)
+
+
+def test_index_sample(measure, tractogram):
+    """Index of the tractogram and random sample of a tenth of its streamlines."""
+    n = tractogram['nb_streamlines']
+    measure(SampleTractogram(in_file=tractogram['tck'], nb_streamlines=n // 10, seed=0).run, n)
+
+
+def test_roi_query(measure, tractogram, images):
+    """Spatial index of the tractogram and query of the streamlines between two ROIs."""
+    measure(QueryTractogram(in_file=tractogram['tck'], ref=images['wm'],
+                            include=[images['roi_a'], images['roi_b']]).run,
+            tractogram['nb_streamlines'])
+
+
+def test_shape_filter(measure, tractogram):
+    measure(FilterStreamlines(in_file=tractogram['tck'], min_length=30, max_curvature=0.5,
+                              max_tortuosity=2).run, tractogram['nb_streamlines'])
+
+
+@pytest.mark.parametrize('mode', ['step', 'linearize'])
+def test_resample(measure, tractogram, mode):
+    resample = ResampleStreamlines(in_file=tractogram['tck'])
+    if mode == 'step':
+        resample.inputs.step = 2.
+    else:
+        resample.inputs.tolerance = 0.1
+    measure(resample.run, tractogram['nb_streamlines'])
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_native_sift2(measure, tractogram, images, workers):
+    measure(EstimateWeights(in_file=tractogram['tck'], in_fod=images['wm'], iterations=20,
+                            workers=workers).run, tractogram['nb_streamlines'])
+
+
+@pytest.mark.parametrize('contrast', ['count', 'length'])
+@pytest.mark.parametrize('workers', [1, 4])
+def test_native_tdi(measure, tractogram, images, contrast, workers):
+    measure(TrackDensity(in_file=tractogram['tck'], reference=images['wm'],
+                         contrast=contrast, workers=workers).run,
+            tractogram['nb_streamlines'])
+
+
+def test_endpoints(measure, tractogram):
+    measure(ExtractEndpoints(in_file=tractogram['trk']).run, tractogram['nb_streamlines'])
+
+
+@pytest.mark.parametrize('lengths', [True, False])
+def test_native_connectome(measure, tractogram, images, lengths):
+    measure(ComputeConnectome(in_file=tractogram['trk'], in_parc=images['parc'],
+                              lengths=lengths).run, tractogram['nb_streamlines'])
+
+
+def test_native_connectome_sidecar(measure, tractogram, images, tmpdir_factory):
+    """Connectome from the endpoints sidecar, without reading the tractogram."""
+    sidecar = str(tmpdir_factory.mktemp('endpoints').join('track_endpoints.npy'))
+    ExtractEndpoints(in_file=tractogram['trk'], out_file=sidecar).run()
+    measure(ComputeConnectome(in_file=tractogram['trk'], in_parc=images['parc'],
+                              endpoints=sidecar).run, tractogram['nb_streamlines'])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the results cache shared across experiments."""
+
+import os
+
+from nipype.interfaces.base import (BaseInterface, BaseInterfaceInputSpec,
+                                    TraitedSpec, File)
+from nipype.pipeline import engine as pe
+
+from trampolino.utils.cache import CachedNode, ResultCache, enable_cache
+
+
+class UpperInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True)
+
+
+class UpperOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+
+
+class Upper(BaseInterface):
+    input_spec = UpperInputSpec
+    output_spec = UpperOutputSpec
+    runs = 0
+
+    def _run_interface(self, runtime):
+        Upper.runs += 1
+        with open(self.inputs.in_file) as f, open('upper.txt', 'w') as out:
+            out.write(f.read().upper())
+        return runtime
+
+    def _list_outputs(self):
+        return {'out_file': os.path.abspath('upper.txt')}
+
+
+def test_cache_across_experiments(tmpdir):
+    """A second experiment fetches the result instead of recomputing it."""
+    tmpdir.chdir()
+    tmpdir.join('in.txt').write('trampolino')
+    cache = ResultCache(str(tmpdir.join('cache')), max_size_gb=1)
+    outputs = []
+    for name in ['first', 'second']:
+        wf = pe.Workflow(name=name, base_dir=str(tmpdir))
+        node = CachedNode(Upper(), name='upper')
+        node.inputs.in_file = str(tmpdir.join('in.txt'))
+        wf.add_nodes([node])
+        enable_cache(wf, cache)
+        graph = wf.run()
+        outputs.append(list(graph.nodes())[0].result.outputs.out_file)
+    assert Upper.runs == 1
+    assert outputs[1] == str(tmpdir.join('second', 'upper', 'upper.txt'))
+    with open(outputs[1]) as f:
+        assert f.read() == 'TRAMPOLINO'
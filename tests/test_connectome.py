@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the native connectome builder."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import connectome
+from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+
+
+@pytest.fixture(params=['.tck', '.trk'])
+def tractogram(request, tmpdir):
+    """Random streamlines over a parcellation of 4 regions (x and y halves) on a 2 mm grid."""
+    rng = np.random.RandomState(7)
+    streamlines = [rng.uniform(-1, 21, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(2, 20, size=60)]
+    affine = np.diag([2., 2., 2., 1.])
+    labels = np.zeros((10, 10, 10), dtype=np.int16)
+    labels[:5, :5] = 1
+    labels[5:, :5] = 2
+    labels[:5, 5:] = 3
+    labels[5:, 5:] = 4
+    labels[:, :, 8:] = 0
+    parc = os.path.join(str(tmpdir), 'parc.nii.gz')
+    nib.save(nib.Nifti1Image(labels, affine), parc)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    if request.param == '.trk':
+        trk = os.path.join(str(tmpdir), 'track.trk')
+        tck2trk(tck, parc, trk)
+        tck = trk
+    return tck, parc, streamlines
+
+
+def label_of(point, parc):
+    img = nib.load(parc)
+    vox = np.rint(nib.affines.apply_affine(np.linalg.inv(img.affine), point)).astype(int)
+    if np.any(vox < 0) or np.any(vox >= img.shape):
+        return 0
+    return int(img.get_fdata()[tuple(vox)])
+
+
+@pytest.mark.parametrize('lengths', [True, False])
+def test_build_connectome(tractogram, lengths):
+    """Matrices match a streamline by streamline computation."""
+    filename, parc, streamlines = tractogram
+    img = nib.load(parc)
+    weights = np.linspace(0.1, 2, len(streamlines))
+    result = connectome.build_connectome(filename, np.asarray(img.dataobj), img.affine,
+                                         weights, chunk_size=7, lengths=lengths)
+    count, length, weight = np.zeros((5, 5)), np.zeros((5, 5)), np.zeros((5, 5))
+    for s, w in zip(streamlines, weights):
+        a, b = label_of(s[0], parc), label_of(s[-1], parc)
+        for i, j in {(a, b), (b, a)}:
+            count[i, j] += 1
+            length[i, j] += np.linalg.norm(np.diff(s, axis=0), axis=1).sum()
+            weight[i, j] += w
+    np.testing.assert_array_equal(result['count'], count[1:, 1:])
+    np.testing.assert_allclose(result['weight'], weight[1:, 1:], rtol=1e-6)
+    assert len(result['assignments']) == len(streamlines)
+    if lengths:
+        np.testing.assert_allclose(result['length'] * result['count'], length[1:, 1:],
+                                   rtol=1e-4)
+    else:
+        assert 'length' not in result
+
+
+def test_compute_connectome(tmpdir, tractogram):
+    filename, parc, streamlines = tractogram
+    tmpdir.mkdir('connectome').chdir()
+    result = connectome.ComputeConnectome(in_file=filename, in_parc=parc).run()
+    with np.load(result.outputs.out_file) as f:
+        assert f['count'].shape == (4, 4)
+        np.testing.assert_array_equal(f['count'], f['count'].T)
+        # without a sidecar, only the endpoints are read by default
+        assert 'length' not in f
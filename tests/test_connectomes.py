@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the connectomes of the ensemble members."""
+
+import pytest
+import numpy as np
+import nibabel as nib
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+
+from trampolino.utils.connectomes import stack_connectomes, connect_member_connectomes
+
+
+@pytest.fixture
+def parc(tmpdir):
+    """Three regions along x, on a 1 mm grid."""
+    labels = np.zeros((40, 40, 40), dtype=np.int16)
+    labels[:15] = 1
+    labels[15:25] = 2
+    labels[25:] = 3
+    filename = str(tmpdir.join('parc.nii.gz'))
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), filename)
+    return filename
+
+
+def write_member(angle):
+    import os
+    import numpy as np
+    import nibabel as nib
+    lines = [np.full((5, 3), angle, dtype='f4')] * int(angle)
+    tractogram = nib.streamlines.Tractogram(lines, affine_to_rasmm=np.eye(4))
+    nib.streamlines.save(tractogram, 'member.tck')
+    return os.path.abspath('member.tck')
+
+
+def test_stack_connectomes(tmpdir):
+    """The shards of each member are combined."""
+    tmpdir.chdir()
+    files = []
+    for i, (count, length) in enumerate([(1, 10), (3, 20), (2, 5), (2, 7)]):
+        files.append(str(tmpdir.join('c{}.npz'.format(i))))
+        np.savez(files[-1], count=np.full((2, 2), count), length=np.full((2, 2), length))
+    with np.load(stack_connectomes(files, [30, 45], shards=2)) as f:
+        np.testing.assert_array_equal(f['members'], [30, 45])
+        np.testing.assert_array_equal(f['count'][:, 0, 0], [4, 4])
+        np.testing.assert_allclose(f['length'][:, 0, 0], [17.5, 6])
+
+
+@pytest.mark.parametrize('stream', [True, False])
+def test_member_connectomes(tmpdir, parc, stream):
+    """A connectome is stacked for each member, in the order of the members."""
+    from trampolino.utils.streaming import create_member_node
+
+    wf = pe.Workflow(name='tck', base_dir=str(tmpdir))
+    inputnode = pe.Node(util.IdentityInterface(fields=['angle']), name='inputnode')
+    inputnode.inputs.angle = [10, 30, 20]
+    outputnode = pe.Node(util.IdentityInterface(fields=['connectomes']), name='outputnode')
+    function = util.Function(input_names=['angle'], output_names=['out_file'],
+                             function=write_member)
+    if stream:
+        member = create_member_node('angle')
+        member.iterables = [('angle', [10, 30, 20]), ('member', [0, 1, 2])]
+        member.synchronize = True
+        track = pe.Node(function, name='track')
+        wf.connect([(member, track, [('angle', 'angle')])])
+    else:
+        member = None
+        track = pe.MapNode(function, name='track', iterfield=['angle'])
+        wf.connect([(inputnode, track, [('angle', 'angle')])])
+    connect_member_connectomes(wf, track, 'out_file', outputnode, parc, member, 'angle',
+                               inputnode)
+    graph = wf.run()
+
+    stacked = [n.result.outputs.out_file for n in graph.nodes()
+               if n.name == 'stack_connectomes'][0]
+    with np.load(stacked) as f:
+        assert f['count'].shape == (3, 3, 3)
+        np.testing.assert_array_equal(f['members'], [10, 30, 20])
+        order = np.argsort(f['members'])
+        np.testing.assert_array_equal(f['count'][order][:, [0, 1, 2], [0, 1, 2]],
+                                      np.diag([10, 20, 30]))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the tractogram conversion interfaces."""
+
+import os
+import shutil
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import conversion
+from trampolino.workflows.interfaces.nibabel.tck import TckReader
+
+
+@pytest.fixture
+def tractogram(tmpdir):
+    """Random tractogram in .tck with its reference volume."""
+    rng = np.random.RandomState(42)
+    streamlines = [rng.uniform(0, 20, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(2, 30, size=50)]
+    affine = np.diag([2., 2., 2., 1.])
+    affine[:3, 3] = [-10, 5, 3]
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((12, 14, 10), dtype=np.uint8), affine), ref)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    return tck, ref, streamlines
+
+
+@pytest.mark.parametrize('chunk_size,single_precision', [(0, True), (7, True), (7, False)])
+def test_tck2trk(tmpdir, tractogram, chunk_size, single_precision):
+    """Converted streamlines match the original ones in RAS+ mm."""
+    tck, ref, streamlines = tractogram
+    tmpdir.chdir()
+    conv = conversion.Tck2Trk(input_tck=tck, input_ref=ref, chunk_size=chunk_size,
+                              single_precision=single_precision)
+    result = conv.run()
+    trk = nib.streamlines.load(result.outputs.output_trk)
+    assert trk.header['nb_streamlines'] == len(streamlines)
+    for converted, original in zip(trk.streamlines, streamlines):
+        np.testing.assert_allclose(converted, original, atol=1e-4)
+
+
+@pytest.mark.parametrize('block_size', [5, 2**22])
+def test_tck_reader(tractogram, block_size):
+    """The memory-mapped reader finds the same streamlines as nibabel."""
+    tck, _, streamlines = tractogram
+    reader = TckReader(tck, block_size=block_size)
+    assert reader.nb_streamlines == len(streamlines)
+    np.testing.assert_array_equal(reader.lengths, [len(s) for s in streamlines])
+    for i, original in enumerate(streamlines):
+        np.testing.assert_array_equal(reader[i], original)
+    np.testing.assert_array_equal(reader.points(3, 10), np.concatenate(streamlines[3:10]))
+
+
+@pytest.mark.parametrize('chunk_size', [0, 7])
+def test_trk2tck(tmpdir, tractogram, chunk_size):
+    """Streamlines converted back to .tck match the original ones."""
+    tck, ref, streamlines = tractogram
+    tmpdir.chdir()
+    trk = conversion.Tck2Trk(input_tck=tck, input_ref=ref).run().outputs.output_trk
+    result = conversion.Trk2Tck(input_trk=trk, chunk_size=chunk_size).run()
+    converted = nib.streamlines.load(result.outputs.output_tck)
+    assert len(converted.streamlines) == len(streamlines)
+    for c, original in zip(converted.streamlines, streamlines):
+        np.testing.assert_allclose(c, original, atol=1e-4)
+
+
+def test_batch(tmpdir, tractogram):
+    """A batch conversion reports every file."""
+    from trampolino.utils.batch import run_batch
+    tck, ref, streamlines = tractogram
+    in_files = []
+    for i in range(3):
+        in_files.append(str(tmpdir.join('track{}.tck'.format(i))))
+        shutil.copyfile(tck, in_files[-1])
+    total = run_batch(in_files, str(tmpdir.join('out')), '.trk', echo=lambda s: None,
+                      ref=ref, workers=2)
+    assert total['files'] == 3
+    assert total['streamlines'] == 3 * len(streamlines)
+    assert sorted(os.listdir(str(tmpdir.join('out')))) == ['track0.trk', 'track1.trk', 'track2.trk']
+
+
+def test_tcz(tmpdir, tractogram):
+    """Compressed streamlines are decoded within the quantization precision."""
+    from trampolino.workflows.interfaces.nibabel.tcz import TczReader, TczWriter
+    tck, _, streamlines = tractogram
+    tmpdir.chdir()
+    tcz = conversion.Tck2Tcz(input_tck=tck, precision=0.01).run().outputs.output_tcz
+    reader = TczReader(tcz)
+    assert reader.nb_streamlines == len(streamlines)
+    np.testing.assert_allclose(reader[-1], streamlines[-1], atol=0.005 + 1e-5)
+    result = conversion.Tcz2Tck(input_tcz=tcz).run()
+    converted = nib.streamlines.load(result.outputs.output_tck)
+    for c, original in zip(converted.streamlines, streamlines):
+        np.testing.assert_allclose(c, original, atol=0.005 + 1e-5)
+
+    with TczWriter('blocks.tcz', precision=0.1, block_size=7) as writer:
+        for i in range(0, len(streamlines), 4):
+            writer.append(np.concatenate(streamlines[i:i + 4]),
+                          [len(s) for s in streamlines[i:i + 4]])
+    reader = TczReader('blocks.tcz')
+    assert reader.nb_blocks == 8
+    for i in [0, 6, 7, 23, 49]:
+        np.testing.assert_allclose(reader[i], streamlines[i], atol=0.05 + 1e-5)
+
+
+def test_tcz_precision(tmpdir):
+    """A precision too fine for the coordinates is an error, not a wrong decoding."""
+    from trampolino.workflows.interfaces.nibabel.tcz import TczWriter
+    tmpdir.chdir()
+    with pytest.raises(ValueError):
+        TczWriter('zero.tcz', precision=0)
+    with pytest.raises(ValueError):
+        with TczWriter('fine.tcz', precision=1e-8) as writer:
+            writer.append(np.array([[100., 0, 0], [101., 0, 0]], dtype=np.float32), [2])
+
+
+@pytest.mark.parametrize('nb_properties', [0, 2])
+def test_record_ends(nb_properties):
+    """Records of the same size are located without walking them."""
+    from trampolino.workflows.interfaces.nibabel.trk import record_ends
+    size = 1 + 5 * 3 + nb_properties
+    data = np.zeros(4 * size, dtype='<i4')
+    data[::size] = 5
+    np.testing.assert_array_equal(record_ends(data, 0, nb_properties, 4),
+                                  [size, 2 * size, 3 * size, 4 * size])
+    # different sizes (or an unknown count) are walked
+    data = np.zeros(1 + 2 * 3 + 1 + 4 * 3, dtype='<i4')
+    data[[0, 7]] = [2, 4]
+    for count in [0, 2]:
+        np.testing.assert_array_equal(record_ends(data, 0, 0, count), [7, 20])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the endpoints sidecar of the tractograms."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import endpoints, connectome
+from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+
+
+@pytest.fixture(params=['.tck', '.trk'])
+def tractogram(request, tmpdir):
+    rng = np.random.RandomState(3)
+    streamlines = [rng.uniform(-1, 21, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(1, 15, size=40)]
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    labels = np.zeros((10, 10, 10), dtype=np.int16)
+    labels[:5] = 1
+    labels[5:] = 2
+    nib.save(nib.Nifti1Image(labels, np.diag([2., 2., 2., 1.])), ref)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    if request.param == '.trk':
+        trk = os.path.join(str(tmpdir), 'track.trk')
+        tck2trk(tck, ref, trk)
+        tck = trk
+    return tck, ref, streamlines
+
+
+def test_extract_endpoints(tractogram):
+    """The sidecar holds the first and last point and the length of each streamline."""
+    filename, _, streamlines = tractogram
+    assert endpoints.extract_endpoints(filename, chunk_size=7) == len(streamlines)
+    sidecar = endpoints.find_endpoints(filename)
+    assert sidecar == filename + '_endpoints.npy'
+    data = endpoints.load_endpoints(sidecar)
+    np.testing.assert_allclose(data['endpoints'],
+                               [[s[0], s[-1]] for s in streamlines], atol=1e-4)
+    np.testing.assert_allclose(data['length'],
+                               [np.linalg.norm(np.diff(s, axis=0), axis=1).sum()
+                                for s in streamlines], rtol=1e-5, atol=1e-5)
+
+
+def test_outdated_sidecar(tractogram):
+    filename, _, _ = tractogram
+    endpoints.extract_endpoints(filename)
+    sidecar = endpoints.endpoints_path(filename)
+    os.utime(sidecar, (0, 0))
+    assert endpoints.find_endpoints(filename) is None
+
+
+def test_connectome_from_sidecar(tmpdir, tractogram):
+    """The connectome is the same with or without the sidecar, which is preferred."""
+    filename, ref, _ = tractogram
+    img = nib.load(ref)
+    labels = np.asarray(img.dataobj)
+    expected = connectome.build_connectome(filename, labels, img.affine, lengths=True)
+    tmpdir.mkdir('sidecar').chdir()
+    result = endpoints.ExtractEndpoints(in_file=filename).run()
+    sidecar = result.outputs.out_file
+    assert os.path.basename(sidecar) == os.path.basename(filename) + '_endpoints.npy'
+    # the tractogram itself is not read
+    os.rename(filename, filename + '.bak')
+    with open(filename, 'w'):
+        pass
+    found = connectome.build_connectome(filename, labels, img.affine, chunk_size=9,
+                                        endpoints_file=sidecar)
+    for key in ('count', 'length', 'assignments'):
+        np.testing.assert_allclose(found[key], expected[key], rtol=1e-5)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the adaptive sweep by successive halving."""
+
+import os
+
+import numpy as np
+import nibabel as nib
+from nipype.interfaces import utility as util
+from nipype.interfaces.base import (BaseInterface, BaseInterfaceInputSpec,
+                                    TraitedSpec, File, traits)
+from nipype.pipeline import engine as pe
+
+from trampolino.utils.halving import (rung_counts, promote, score_tractogram,
+                                      create_halving)
+
+
+class TractographyInputSpec(BaseInterfaceInputSpec):
+    in_file = File(exists=True, mandatory=True)
+    angle = traits.Float()
+    select = traits.Int()
+
+
+class TractographyOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+
+
+class Tractography(BaseInterface):
+    """Straight streamlines, the more the larger the angle."""
+
+    input_spec = TractographyInputSpec
+    output_spec = TractographyOutputSpec
+
+    def _run_interface(self, runtime):
+        line = np.outer(np.linspace(0, 30, 10), [1, 0, 0])
+        n = int(np.ceil(self.inputs.select * self.inputs.angle / 45))
+        tractogram = nib.streamlines.Tractogram([line] * n,
+                                                affine_to_rasmm=np.eye(4))
+        nib.streamlines.save(tractogram, 'tracked.tck')
+        return runtime
+
+    def _list_outputs(self):
+        return {'out_file': os.path.abspath('tracked.tck')}
+
+
+def test_rung_counts():
+    assert rung_counts(5000, 3, 0.5) == [1250, 2500, 5000]
+
+
+def test_promote():
+    angles, combos = promote([0.1, 0.9, 0.5, 0.7], 0.5, ['angle'], angle=[10, 20, 30, 40])
+    assert angles == [20, 40]
+    assert combos == [{'angle': 20}, {'angle': 40}]
+
+
+def test_score_tractogram(tmpdir):
+    lines = [np.outer(np.arange(l), [1., 0, 0]) for l in [5, 30, 40, 50]]
+    tck = str(tmpdir.join('track.tck'))
+    nib.streamlines.save(nib.streamlines.Tractogram(lines, affine_to_rasmm=np.eye(4)), tck)
+    assert score_tractogram(tck) == 0.75
+    assert score_tractogram(tck, count=8) == 0.375
+
+
+def test_score_endpoints(tmpdir):
+    """Without a seed mask, the lengths are read from the endpoints sidecar."""
+    from trampolino.workflows.interfaces.nibabel.endpoints import extract_endpoints
+
+    lines = [np.outer(np.arange(l), [1., 0, 0]) for l in [5, 30, 40, 50]]
+    tck = str(tmpdir.join('track.tck'))
+    nib.streamlines.save(nib.streamlines.Tractogram(lines, affine_to_rasmm=np.eye(4)), tck)
+    sidecar = str(tmpdir.join('sidecar.npy'))
+    extract_endpoints(tck, sidecar)
+    assert score_tractogram(tck, count=8, endpoints_file=sidecar) == 0.375
+    # the sidecar is trusted: shorter lengths lower the score
+    np.lib.format.open_memmap(sidecar, mode='r+')['length'][1:] = 10
+    assert score_tractogram(tck, endpoints_file=sidecar) == 0.
+
+
+def test_halving(tmpdir):
+    tmpdir.join('odf.nii').write('')
+    track_wf = pe.Workflow(name='tck')
+    inputnode = pe.Node(util.IdentityInterface(fields=['odf', 'angle']), name='inputnode')
+    track = pe.Node(Tractography(), name='track')
+    track.inputs.select = 90
+    outputnode = pe.Node(util.IdentityInterface(fields=['tck']), name='outputnode')
+    track_wf.connect([(inputnode, track, [('odf', 'in_file'), ('angle', 'angle')]),
+                      (track, outputnode, [('out_file', 'tck')])])
+
+    combos = [{'angle': a} for a in [10, 25, 30, 45]]
+    wf = create_halving(track_wf, combos, ['angle'], rungs=3, fraction=0.5)
+    wf.base_dir = str(tmpdir)
+    wf.inputs.inputnode.odf = str(tmpdir.join('odf.nii'))
+    graph = wf.run()
+    outputs = {n.name: n.result.outputs for n in graph.nodes()}
+    assert outputs['promote_rung2'].combos == [{'angle': 45}]
+    assert len(outputs['track_rung1'].out_file) == 2
+    assert len(nib.streamlines.load(outputs['decompress'].out_file[0]).streamlines) == 90
+
+
+def test_halving_mrtrix_tckgen(tmpdir):
+    """Every input of the tracking workflow reaches the rungs (mrtrix_tckgen)."""
+    from nipype.pipeline.engine.utils import generate_expanded_graph
+    from trampolino.workflows import mrtrix_tckgen
+
+    tmpdir.join('odf.mif').write('')
+    combos = [{'angle': a} for a in [30, 45]]
+    wf = create_halving(mrtrix_tckgen.create_pipeline(opt='nos:400'), combos, ['angle'])
+    wf.base_dir = str(tmpdir)
+    wf.inputs.inputnode.odf = str(tmpdir.join('odf.mif'))
+    wf.inputs.inputnode.algorithm = 'SD_Stream'
+    wf.inputs.inputnode.min_length = 20
+    graph = generate_expanded_graph(wf._create_flat_graph())
+    rungs = sorted((n for n in graph.nodes() if n.name.startswith('track_rung')),
+                   key=lambda n: n.name)
+    # the MapNodes keep the inputs other than the iterfields in their interface
+    assert [n.interface.inputs.select for n in rungs] == [100, 200, 400]
+    assert all(n.interface.inputs.algorithm == 'SD_Stream' and
+               n.interface.inputs.min_length == 20 for n in rungs)
+    assert rungs[0].inputs.angle == [30, 45]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the random-access streamline index."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import index as idx
+from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+
+
+@pytest.fixture(params=['.tck', '.trk'])
+def tractogram(request, tmpdir):
+    """Random tractogram, in .tck or .trk."""
+    rng = np.random.RandomState(0)
+    streamlines = [rng.uniform(0, 20, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(2, 30, size=40)]
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    if request.param == '.tck':
+        return tck, streamlines
+    affine = np.diag([2., 2., 2., 1.])
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((12, 14, 10), dtype=np.uint8), affine), ref)
+    trk = os.path.join(str(tmpdir), 'track.trk')
+    tck2trk(tck, ref, trk)
+    return trk, streamlines
+
+
+def test_streamline_index(tractogram):
+    """Subsets, ranges and samples match the original streamlines."""
+    filename, streamlines = tractogram
+    index = idx.StreamlineIndex(filename)
+    assert os.path.exists(idx.index_path(filename))
+    assert len(index) == len(streamlines)
+    np.testing.assert_allclose(index[7], streamlines[7], atol=1e-4)
+
+    ids = [31, 2, 17]
+    points, lengths = index.select(ids)
+    np.testing.assert_array_equal(lengths, [len(streamlines[i]) for i in ids])
+    np.testing.assert_allclose(points, np.concatenate([streamlines[i] for i in ids]), atol=1e-4)
+    points, lengths = index.range(35, 50)
+    assert len(lengths) == 5
+    np.testing.assert_allclose(points, np.concatenate(streamlines[35:]), atol=1e-4)
+
+    # the saved index is reused
+    index = idx.StreamlineIndex(filename)
+    assert isinstance(index.index, np.memmap)
+    points, lengths, ids = index.sample(10, seed=1)
+    assert len(ids) == 10 and np.all(np.diff(ids) > 0)
+    np.testing.assert_allclose(points, np.concatenate([streamlines[i] for i in ids]), atol=1e-4)
+
+
+def test_sample_tractogram(tmpdir, tractogram):
+    """The sample is written in the format of the input."""
+    filename, streamlines = tractogram
+    tmpdir.mkdir('sample').chdir()
+    result = idx.SampleTractogram(in_file=filename, nb_streamlines=12, seed=3).run()
+    sample = nib.streamlines.load(result.outputs.out_file)
+    assert result.outputs.out_file.endswith(os.path.splitext(filename)[1])
+    assert len(sample.streamlines) == 12
+    assert os.path.exists(result.outputs.index_file)
+    for s in sample.streamlines:
+        assert any(len(s) == len(o) and np.allclose(s, o, atol=1e-4) for o in streamlines)
+
+
+def test_index_formats(tmpdir):
+    """A .tck and a .trk of the same name do not share their index, and an
+    index of another tractogram is not reused."""
+    rng = np.random.RandomState(1)
+    streamlines = [rng.uniform(0, 20, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(2, 30, size=20)]
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((12, 14, 10), dtype=np.uint8),
+                             np.diag([2., 2., 2., 1.])), ref)
+    trk = os.path.join(str(tmpdir), 'track.trk')
+    tck2trk(tck, ref, trk)
+
+    idx.StreamlineIndex(trk)
+    assert idx.index_path(tck) != idx.index_path(trk)
+    for filename in [tck, trk]:
+        points, lengths = idx.StreamlineIndex(filename).select([19, 3])
+        np.testing.assert_allclose(points[:lengths[0]], streamlines[19], atol=1e-4)
+    # the index of the .trk, given for the .tck, is built again
+    index = idx.StreamlineIndex(tck, idx.index_path(trk))
+    np.testing.assert_allclose(index[5], streamlines[5], atol=1e-4)
+    assert idx.StreamlineIndex(trk).index[0]['offset'] != index.index[0]['offset']
+
+
+@pytest.fixture
+def tagged_trk(tmpdir):
+    """Merge of two .trk members, with the `member` property of each streamline."""
+    from trampolino.workflows.interfaces.nibabel.merge import merge_tractograms
+
+    rng = np.random.RandomState(2)
+    streamlines = [rng.uniform(0, 20, size=(n, 3)).astype(np.float32)
+                   for n in rng.randint(2, 30, size=15)]
+    tck = os.path.join(str(tmpdir), 'member.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((12, 14, 10), dtype=np.uint8),
+                             np.diag([2., 2., 2., 1.])), ref)
+    trk = os.path.join(str(tmpdir), 'member.trk')
+    tck2trk(tck, ref, trk)
+    merged = os.path.join(str(tmpdir), 'merged.trk')
+    merge_tractograms([trk, trk], merged, tag_members=True)
+    assert 'member' in nib.streamlines.load(merged).tractogram.data_per_streamline
+    return merged, streamlines + streamlines
+
+
+def test_save_tagged_trk(tmpdir, tagged_trk):
+    """The points of a .trk with properties are saved in a valid .trk."""
+    filename, streamlines = tagged_trk
+    out_file = str(tmpdir.join('subset.trk'))
+    ids = np.array([3, 16, 29])
+    idx.StreamlineIndex(filename).save(out_file, ids)
+    saved = nib.streamlines.load(out_file).streamlines
+    assert len(saved) == len(ids)
+    for s, i in zip(saved, ids):
+        np.testing.assert_allclose(s, streamlines[i], atol=1e-4)
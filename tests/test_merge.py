@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the native merge of tractograms."""
+
+import numpy as np
+import nibabel as nib
+import pytest
+from nibabel.streamlines import Field
+
+from trampolino.workflows.interfaces.nibabel.merge import merge_tractograms
+
+
+@pytest.fixture
+def members(tmpdir):
+    rng = np.random.RandomState(0)
+    streamlines = [[rng.rand(rng.randint(2, 20), 3).astype('f4') * 50
+                    for _ in range(20 + m)] for m in range(3)]
+    header = {Field.VOXEL_TO_RASMM: np.diag([2., 2., 2., 1.]),
+              Field.DIMENSIONS: (50, 50, 50),
+              Field.VOXEL_SIZES: (2., 2., 2.)}
+    files = {}
+    for ext in ['.tck', '.trk']:
+        files[ext] = []
+        for m, sl in enumerate(streamlines):
+            filename = str(tmpdir.join('member{}{}'.format(m, ext)))
+            tractogram = nib.streamlines.Tractogram(sl, affine_to_rasmm=np.eye(4))
+            nib.streamlines.save(tractogram, filename, header=header)
+            files[ext].append(filename)
+    return streamlines, files
+
+
+@pytest.mark.parametrize('ext', ['.tck', '.trk'])
+@pytest.mark.parametrize('tag', [False, True])
+def test_merge(tmpdir, members, ext, tag):
+    streamlines, files = members
+    out_file = str(tmpdir.join('merged' + ext))
+    count, members_file = merge_tractograms(files[ext], out_file, tag, block_size=100)
+    assert count == 63
+    merged = nib.streamlines.load(out_file)
+    assert merged.header[Field.NB_STREAMLINES] == 63
+    for a, b in zip(merged.streamlines, sum(streamlines, [])):
+        assert np.allclose(a, b, atol=1e-4)
+    if tag and ext == '.trk':
+        member = merged.tractogram.data_per_streamline['member'][:, 0]
+    elif tag:
+        member = np.loadtxt(members_file)
+    else:
+        assert members_file is None
+        return
+    assert np.array_equal(member, np.repeat([0, 1, 2], [20, 21, 22]))
+
+
+@pytest.mark.parametrize('ext', ['.tck', '.trk'])
+def test_merge_shards(tmpdir, members, ext):
+    """Consecutive shards are tagged as the same member."""
+    streamlines, files = members
+    out_file = str(tmpdir.join('merged' + ext))
+    _, members_file = merge_tractograms(files[ext] * 2, out_file, True, shards=2)
+    merged = nib.streamlines.load(out_file)
+    if ext == '.trk':
+        member = merged.tractogram.data_per_streamline['member'][:, 0]
+    else:
+        member = np.loadtxt(members_file)
+    assert np.array_equal(member, np.repeat([0, 0, 1, 1, 2, 2], [20, 21, 22, 20, 21, 22]))
+
+
+def test_tckgen_members_output():
+    """The member of each streamline of a sharded ensemble reaches the outputs."""
+    from trampolino.workflows import mrtrix_tckgen
+
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:100,shards:2,tag_members:1', ensemble='angle')
+    assert wf.get_node('merge').inputs.shards == 2
+    edges = [c for u, v, d in wf._graph.edges(data=True) if v.name == 'outputnode'
+             for c in d['connect']]
+    assert ('members_file', 'members') in edges
+
+
+def test_merge_formats(tmpdir, members):
+    _, files = members
+    with pytest.raises(ValueError):
+        merge_tractograms([files['.tck'][0], files['.trk'][0]], str(tmpdir.join('out.tck')))
+
+
+def write_member(angle):
+    import os
+    import numpy as np
+    import nibabel as nib
+    lines = [np.full((5, 3), angle, dtype='f4')] * int(angle)
+    tractogram = nib.streamlines.Tractogram(lines, affine_to_rasmm=np.eye(4))
+    nib.streamlines.save(tractogram, 'member.tck')
+    return os.path.abspath('member.tck')
+
+
+@pytest.mark.parametrize('plugin', ['Linear', 'MultiProc'])
+def test_streaming_merge(tmpdir, plugin):
+    from nipype.interfaces import utility as util
+    from nipype.pipeline import engine as pe
+    from trampolino.utils.streaming import create_member_node, connect_streaming_merge
+
+    wf = pe.Workflow(name='tck', base_dir=str(tmpdir))
+    member = create_member_node('angle')
+    member.iterables = [('angle', [10, 20, 30]), ('member', [0, 1, 2])]
+    member.synchronize = True
+    track = pe.Node(util.Function(input_names=['angle'], output_names=['out_file'],
+                                  function=write_member), name='track')
+    outputnode = pe.Node(util.IdentityInterface(fields=['tck']), name='outputnode')
+    wf.connect([(member, track, [('angle', 'angle')])])
+    connect_streaming_merge(wf, member, track, 'out_file', outputnode, '.tck', True)
+    graph = wf.run(plugin=plugin)
+
+    merged = [n.result.outputs.out_file for n in graph.nodes() if n.name == 'merge'][0]
+    streamlines = nib.streamlines.load(merged).streamlines
+    member = np.loadtxt(merged[:-4] + '_members.txt')
+    assert len(streamlines) == 60
+    assert np.array_equal(np.bincount(member.astype(int)), [10, 20, 30])
+    # the member tags follow the order of the appends
+    assert np.array_equal([s[0, 0] for s in streamlines], (member + 1) * 10)
+
+
+def write_scaled_member(angle, scale):
+    import os
+    import numpy as np
+    import nibabel as nib
+    lines = [np.full((5, 3), angle, dtype='f4')] * (int(angle) * scale)
+    tractogram = nib.streamlines.Tractogram(lines, affine_to_rasmm=np.eye(4))
+    nib.streamlines.save(tractogram, 'member.tck')
+    return os.path.abspath('member.tck')
+
+
+def test_streaming_merge_branches(tmpdir):
+    """Each branch of an outer iterable merges its members in its own tractogram."""
+    from nipype.interfaces import utility as util
+    from nipype.pipeline import engine as pe
+    from trampolino.utils.streaming import create_member_node, connect_streaming_merge
+
+    wf = pe.Workflow(name='tck', base_dir=str(tmpdir))
+    param = pe.Node(util.IdentityInterface(fields=['scale']), name='param_node')
+    param.iterables = [('scale', [1, 2])]
+    inputnode = pe.Node(util.IdentityInterface(fields=['scale']), name='inputnode')
+    member = create_member_node('angle')
+    member.iterables = [('angle', [10, 20]), ('member', [0, 1])]
+    member.synchronize = True
+    track = pe.Node(util.Function(input_names=['angle', 'scale'], output_names=['out_file'],
+                                  function=write_scaled_member), name='track')
+    outputnode = pe.Node(util.IdentityInterface(fields=['tck']), name='outputnode')
+    wf.connect([(param, inputnode, [('scale', 'scale')]),
+                (member, track, [('angle', 'angle')]),
+                (inputnode, track, [('scale', 'scale')])])
+    connect_streaming_merge(wf, member, track, 'out_file', outputnode, '.tck',
+                            inputnode=inputnode)
+    graph = wf.run()
+
+    merged = sorted(n.result.outputs.out_file for n in graph.nodes() if n.name == 'merge')
+    assert len(set(merged)) == 2
+    counts = sorted(len(nib.streamlines.load(f).streamlines) for f in merged)
+    assert counts == [30, 60]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the streamline metrics and the shape filter."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import metrics
+
+
+def arc(radius, angle, n):
+    """Arc of circle in the xy plane, with n points."""
+    theta = np.linspace(0, angle, n)
+    return np.stack([radius * np.cos(theta), radius * np.sin(theta),
+                     np.zeros(n)], axis=1).astype(np.float32)
+
+
+@pytest.fixture
+def streamlines():
+    line = np.zeros((11, 3), dtype=np.float32)
+    line[:, 0] = np.arange(11)
+    return [line, arc(10., np.pi, 200), arc(2., np.pi / 2, 50), line[:2]]
+
+
+def test_streamline_metrics(streamlines):
+    """Metrics match the analytic values of lines and arcs."""
+    points = np.concatenate(streamlines)
+    length, curvature, tortuosity = metrics.streamline_metrics(
+        points, [len(s) for s in streamlines])
+    np.testing.assert_allclose(length, [10., 10 * np.pi, np.pi, 1.], rtol=1e-3)
+    np.testing.assert_allclose(curvature, [0., 0.1, 0.5, 0.], atol=1e-3)
+    np.testing.assert_allclose(tortuosity, [1., np.pi / 2, np.pi / 2 / np.sqrt(2), 1.],
+                               rtol=1e-3)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100000])
+def test_filter_streamlines(tmpdir, streamlines, chunk_size):
+    """Streamlines out of the bounds are dropped and the metrics are saved."""
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    tmpdir.mkdir('filter').chdir()
+    result = metrics.FilterStreamlines(in_file=tck, min_length=2., max_curvature=0.2,
+                                       chunk_size=chunk_size).run()
+    kept = nib.streamlines.load(result.outputs.out_file).streamlines
+    assert len(kept) == 2
+    np.testing.assert_allclose(kept[0], streamlines[0])
+    np.testing.assert_allclose(kept[1], streamlines[1])
+    with np.load(result.outputs.metrics_file) as f:
+        np.testing.assert_array_equal(f['kept'], [True, True, False, False])
+        assert len(f['length']) == 4
+
+
+def test_filter_tagged_trk(tmpdir, streamlines):
+    """The filtered .trk of a merge with the member property is valid."""
+    from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+    from trampolino.workflows.interfaces.nibabel.merge import merge_tractograms
+
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((10, 10, 10), dtype=np.uint8), np.eye(4)), ref)
+    trk = os.path.join(str(tmpdir), 'track.trk')
+    tck2trk(tck, ref, trk)
+    merged = os.path.join(str(tmpdir), 'merged.trk')
+    merge_tractograms([trk, trk], merged, tag_members=True)
+
+    out_file = os.path.join(str(tmpdir), 'filtered.trk')
+    result = metrics.filter_tractogram(merged, out_file, min_length=2., max_curvature=0.2)
+    np.testing.assert_array_equal(result['kept'], [True, True, False, False] * 2)
+    kept = nib.streamlines.load(out_file).streamlines
+    assert len(kept) == 4
+    for s, i in zip(kept, [0, 1, 0, 1]):
+        np.testing.assert_allclose(s, streamlines[i], atol=1e-4)
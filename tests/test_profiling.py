@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the profiling report of the executed workflows."""
+
+import json
+import networkx as nx
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+
+from trampolino.utils.profiling import critical_path, profile_report, write_report
+
+
+def write_text(size):
+    import os
+    with open('out.txt', 'w') as f:
+        f.write('a' * size)
+    return os.path.abspath('out.txt')
+
+
+def join_text(in_files):
+    import os
+    with open('joined.txt', 'w') as out:
+        for name in in_files:
+            with open(name) as f:
+                out.write(f.read())
+    return os.path.abspath('joined.txt')
+
+
+def test_critical_path():
+    """The longest chain weighted by the durations, not by the number of nodes."""
+    graph = nx.DiGraph([('a', 'b'), ('b', 'c'), ('a', 'd'), ('d', 'e'), ('e', 'c')])
+    durations = {'a': 1., 'b': 5., 'c': 1., 'd': 1., 'e': 2.}
+    assert critical_path(graph, durations) == (['a', 'b', 'c'], 7.)
+    assert critical_path(nx.DiGraph(), {}) == ([], 0.)
+
+
+def test_profile_report(tmpdir):
+    """Every executed node is reported, with the sizes of its files."""
+    wf = pe.Workflow(name='profiled', base_dir=str(tmpdir))
+    write = pe.Node(util.Function(input_names=['size'], output_names=['out_file'],
+                                  function=write_text), name='write')
+    write.iterables = ('size', [100, 300])
+    join = pe.JoinNode(util.Function(input_names=['in_files'], output_names=['out_file'],
+                                     function=join_text),
+                       name='join', joinsource=write, joinfield=['in_files'])
+    wf.connect([(write, join, [('out_file', 'in_files')])])
+    graph = wf.run()
+
+    report = profile_report(graph, 10.)
+    nodes = {p['name']: p for p in report['nodes']}
+    assert set(nodes) == {'profiled.write (_size_100)', 'profiled.write (_size_300)',
+                          'profiled.join'}
+    assert nodes['profiled.write (_size_300)']['bytes_written'] == 300
+    assert nodes['profiled.join']['bytes_read'] == 400
+    assert nodes['profiled.join']['bytes_written'] == 400
+    assert all(p['wall_time'] is not None for p in report['nodes'])
+    assert report['critical_path']['nodes'][-1] == 'profiled.join'
+
+    basename = str(tmpdir.join('profile'))
+    write_report(report, basename)
+    with open(basename + '.json') as f:
+        assert json.load(f) == report
+    with open(basename + '.html') as f:
+        assert 'profiled.join' in f.read()
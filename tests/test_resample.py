@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the native resampling and linearization of streamlines."""
+
+import os
+import json
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import resample
+
+
+@pytest.fixture
+def streamlines():
+    """Helices and a straight line, densely sampled."""
+    rng = np.random.RandomState(3)
+    lines = []
+    for n in rng.randint(50, 300, size=10):
+        t = np.linspace(0, 4 * np.pi, n)
+        lines.append(np.stack([5 * np.cos(t), 5 * np.sin(t), 2 * t], axis=1).astype(np.float32))
+    line = np.zeros((200, 3), dtype=np.float32)
+    line[:, 2] = np.linspace(0, 40, 200)
+    lines.append(line)
+    return lines
+
+
+def segment_distance(points, polyline):
+    """Distance of each point from a polyline (brute force)."""
+    a, b = polyline[:-1], polyline[1:]
+    ab = b - a
+    t = np.clip(np.einsum('ijk,jk->ij', points[:, None] - a, ab) /
+                np.maximum((ab ** 2).sum(1), 1e-12), 0, 1)
+    closest = a + t[..., None] * ab
+    return np.linalg.norm(points[:, None] - closest, axis=2).min(axis=1)
+
+
+def test_resample(streamlines):
+    """Resampled streamlines have the requested points, with the same endpoints."""
+    points = np.concatenate(streamlines)
+    lengths = [len(s) for s in streamlines]
+    new, new_lengths = resample.resample(points, lengths, nb_points=12)
+    assert np.all(new_lengths == 12)
+    new = np.split(new, np.cumsum(new_lengths)[:-1])
+    for s, r in zip(streamlines, new):
+        np.testing.assert_allclose(r[[0, -1]], s[[0, -1]], atol=1e-4)
+
+    new, new_lengths = resample.resample(points, lengths, step=0.5)
+    for s, r in zip(streamlines, np.split(new, np.cumsum(new_lengths)[:-1])):
+        steps = np.linalg.norm(np.diff(r, axis=0), axis=1)
+        assert steps.max() <= 0.5 + 1e-4
+        np.testing.assert_allclose(steps, steps.mean(), rtol=0.05)
+        np.testing.assert_allclose(r[[0, -1]], s[[0, -1]], atol=1e-4)
+    np.testing.assert_allclose(new[-new_lengths[-1]:, 2], np.linspace(0, 40, 81), atol=1e-4)
+
+
+@pytest.mark.parametrize('tolerance', [0.01, 0.2])
+def test_linearize(streamlines, tolerance):
+    """Removed points are within the tolerance and long segments are split."""
+    points = np.concatenate(streamlines)
+    lengths = [len(s) for s in streamlines]
+    new, new_lengths = resample.linearize(points, lengths, tolerance, max_segment=5.)
+    assert new_lengths.sum() < len(points)
+    for s, r in zip(streamlines, np.split(new, np.cumsum(new_lengths)[:-1])):
+        np.testing.assert_array_equal(r[[0, -1]], s[[0, -1]])
+        assert segment_distance(s, r).max() <= tolerance + 1e-5
+        assert np.linalg.norm(np.diff(r, axis=0), axis=1).max() <= 5.
+    assert 9 <= new_lengths[-1] <= 17
+
+
+def test_resample_streamlines(tmpdir, streamlines):
+    """The interface writes the simplified tractogram and the size report."""
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    tmpdir.mkdir('resample').chdir()
+    result = resample.ResampleStreamlines(in_file=tck, step=1., tolerance=0.1,
+                                          chunk_size=4).run()
+    assert len(nib.streamlines.load(result.outputs.out_file).streamlines) == len(streamlines)
+    with open(result.outputs.report_file) as f:
+        report = json.load(f)
+    assert report['points_in'] == sum(len(s) for s in streamlines)
+    assert report['bytes_out'] < report['bytes_in']
+    assert 0 < report['reduction'] < 1
+
+
+def test_simplify_tagged_trk(tmpdir, streamlines):
+    """The simplified .trk of a merge with the member property is valid."""
+    from trampolino.workflows.interfaces.nibabel.conversion import tck2trk
+    from trampolino.workflows.interfaces.nibabel.merge import merge_tractograms
+
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((10, 10, 40), dtype=np.uint8), np.eye(4)), ref)
+    trk = os.path.join(str(tmpdir), 'track.trk')
+    tck2trk(tck, ref, trk)
+    merged = os.path.join(str(tmpdir), 'merged.trk')
+    merge_tractograms([trk, trk], merged, tag_members=True)
+
+    out_file = os.path.join(str(tmpdir), 'simplified.trk')
+    report = resample.simplify_tractogram(merged, out_file, nb_points=20)
+    simplified = nib.streamlines.load(out_file).streamlines
+    assert len(simplified) == report['streamlines'] == 2 * len(streamlines)
+    for s, line in zip(simplified, streamlines + streamlines):
+        assert len(s) == 20
+        np.testing.assert_allclose(s[[0, -1]], line[[0, -1]], atol=1e-3)
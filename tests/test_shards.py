@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the sharded tracking of mrtrix_tckgen."""
+
+from trampolino.workflows import mrtrix_tckgen
+
+
+def test_shard_parameters():
+    values, counts, seeds = mrtrix_tckgen.shard_parameters([30, 45], 10, 3, 5)
+    assert values == [30, 30, 30, 45, 45, 45]
+    assert counts == [4, 3, 3] * 2
+    assert seeds == [5, 6, 7, 8, 9, 10]
+
+
+def test_shards_clamped():
+    """No shard is left without streamlines (select 0 would not limit tckgen)."""
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:3,shards:5,rng_seed:2')
+    track = wf.get_node('track')
+    assert track.inputs.select == [1, 1, 1]
+    assert track.inputs.rng_seed == [2, 3, 4]
+
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:1,shards:5')
+    track = wf.get_node('track')
+    assert track.inputs.select == 1
+
+
+def test_single_node_seed():
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:100,rng_seed:7')
+    track = wf.get_node('track')
+    assert track.inputs.select == 100
+    assert track.inputs.rng_seed == 7
+
+
+def test_single_node_random():
+    """Without the rng_seed option, a single run is not seeded."""
+    from nipype.interfaces.base import isdefined
+
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:100')
+    assert not isdefined(wf.get_node('track').inputs.rng_seed)
+    wf = mrtrix_tckgen.create_pipeline(opt='nos:100,shards:2')
+    assert wf.get_node('track').inputs.rng_seed == [0, 1]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the native SIFT2-like weights."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import sift
+from trampolino.workflows.interfaces.nibabel.mif import load_image
+
+
+@pytest.fixture
+def bundles(tmpdir):
+    """Two bundles along x over the same fibre density, one with 3 times more
+    streamlines than the other, and a FOD saved as .mif (l=0 term first)."""
+    streamlines = []
+    for y, count in ((2, 30), (6, 10)):
+        for _ in range(count):
+            line = np.zeros((19, 3), dtype=np.float32)
+            line[:, 0] = np.linspace(0.5, 9.5, 19)
+            line[:, 1:] = (y, 4)
+            streamlines.append(line)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+
+    fod = np.zeros((10, 8, 8, 3), dtype=np.float32)
+    fod[:, [2, 6], 4, 0] = 1.
+    fod[..., 1] = 7.
+    mif = os.path.join(str(tmpdir), 'wm.mif')
+    # volumes stored first, then z flipped, as in an MRtrix layout
+    stored = np.ascontiguousarray(fod[:, :, ::-1].transpose(2, 1, 0, 3))
+    text = ('mrtrix image\ndim: 10,8,8,3\nvox: 1,1,1,1\nlayout: +1,+2,-3,+0\n'
+            'datatype: Float32LE\ntransform: 1,0,0,0\ntransform: 0,1,0,0\n'
+            'transform: 0,0,1,0\n')
+    offset = len(text) + len('file: . 0000\nEND\n')
+    with open(mif, 'wb') as f:
+        f.write((text + 'file: . {:04d}\nEND\n'.format(offset)).encode('utf-8'))
+        f.write(stored.astype('<f4').tobytes())
+    return tck, mif, fod
+
+
+def test_load_mif(bundles):
+    """The .mif reader reorders the axes according to the layout."""
+    _, mif, fod = bundles
+    data, affine = load_image(mif)
+    np.testing.assert_array_equal(data, fod)
+    np.testing.assert_array_equal(affine, np.eye(4))
+
+
+@pytest.mark.parametrize('workers,chunk_size', [(1, 100000), (2, 7)])
+def test_track_densities(bundles, workers, chunk_size):
+    """Partial densities from several processes add up to the streamline lengths."""
+    tck, _, _ = bundles
+    voxels, ids, values, n = sift.track_densities(tck, np.eye(4), (10, 8, 8), chunk_size,
+                                                  workers)
+    assert n == 40
+    np.testing.assert_allclose(np.bincount(ids, weights=values), 9., rtol=1e-5)
+    density = np.bincount(voxels, weights=values, minlength=640).reshape(10, 8, 8)
+    np.testing.assert_allclose(density[1:, 2, 4], 30., rtol=1e-5)
+    np.testing.assert_allclose(density[1:, 6, 4], 10., rtol=1e-5)
+
+
+def test_estimate_weights(tmpdir, bundles):
+    """The weights balance the two bundles, as their fibre density is the same."""
+    tck, mif, _ = bundles
+    tmpdir.mkdir('sift').chdir()
+    result = sift.EstimateWeights(in_file=tck, in_fod=mif, workers=2, chunk_size=8).run()
+    weights = np.loadtxt(result.outputs.out_weights)
+    assert len(weights) == 40
+    np.testing.assert_allclose(weights[:30].sum(), weights[30:].sum(), rtol=1e-2)
+    assert result.outputs.mu > 0
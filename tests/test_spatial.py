@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the spatial index of tractograms."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import spatial
+
+
+@pytest.fixture
+def tractogram(tmpdir):
+    """Straight streamlines along x, y and z on a 1 mm grid, with two regions."""
+    streamlines = []
+    for axis in range(3):
+        for offset in range(2, 8):
+            line = np.full((10, 3), float(offset), dtype=np.float32)
+            line[:, axis] = np.arange(10)
+            streamlines.append(line)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+
+    rois = {}
+    for name, box in (('plane', np.s_[4, :, :]), ('corner', np.s_[:3, :3, :3]),
+                      ('center', np.s_[5:7, 5:7, 5:7])):
+        mask = np.zeros((10, 10, 10), dtype=np.uint8)
+        mask[box] = 1
+        rois[name] = os.path.join(str(tmpdir), name + '.nii.gz')
+        nib.save(nib.Nifti1Image(mask, np.eye(4)), rois[name])
+    return tck, streamlines, rois
+
+
+def expected(streamlines, include=(), exclude=(), ends_in=()):
+    """Brute force selection, one streamline at a time."""
+    def inside(points, roi):
+        mask = nib.load(roi).get_fdata() > 0
+        vox = np.rint(points).astype(int)
+        return mask[vox[:, 0], vox[:, 1], vox[:, 2]]
+    return [i for i, s in enumerate(streamlines)
+            if all(inside(s, r).any() for r in include) and
+            not any(inside(s, r).any() for r in exclude) and
+            all(inside(s[[0, -1]], r).any() for r in ends_in)]
+
+
+@pytest.mark.parametrize('chunk_size', [4, 100000])
+def test_spatial_index(tmpdir, tractogram, chunk_size):
+    """Queries match a brute force selection, also after saving the index."""
+    tck, streamlines, rois = tractogram
+    index = spatial.SpatialIndex.build(tck, np.eye(4), (10, 10, 10), chunk_size)
+    index.save(os.path.join(str(tmpdir), 'voxels.npz'))
+    loaded = spatial.SpatialIndex.load(os.path.join(str(tmpdir), 'voxels.npz'))
+    queries = [{'include': [rois['plane']]},
+               {'include': [rois['plane']], 'exclude': [rois['center']]},
+               {'ends_in': [rois['plane']]},
+               {'include': [rois['center'], rois['plane']]},
+               {'exclude': [rois['corner']]}]
+    for q in queries:
+        np.testing.assert_array_equal(index.query(**q), expected(streamlines, **q))
+        np.testing.assert_array_equal(loaded.query(**q), expected(streamlines, **q))
+
+
+def test_query_tractogram(tmpdir, tractogram):
+    """The selected streamlines are written, and the index can be reused."""
+    tck, streamlines, rois = tractogram
+    tmpdir.mkdir('query').chdir()
+    result = spatial.QueryTractogram(in_file=tck, include=[rois['plane']],
+                                     exclude=[rois['center']]).run()
+    ids = expected(streamlines, [rois['plane']], [rois['center']])
+    selected = nib.streamlines.load(result.outputs.out_file).streamlines
+    assert len(selected) == len(ids)
+    for s, i in zip(selected, ids):
+        np.testing.assert_allclose(s, streamlines[i])
+
+    result = spatial.QueryTractogram(in_file=tck, index_file=result.outputs.index_file,
+                                     ends_in=[rois['plane']], out_file='ends.tck').run()
+    selected = nib.streamlines.load(result.outputs.out_file).streamlines
+    assert len(selected) == len(expected(streamlines, ends_in=[rois['plane']])) == 2
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the collection of subjects for batch processing."""
+
+import pytest
+
+from trampolino.utils.subjects import read_subjects, find_bids_subjects, select_subject
+
+
+def test_read_subjects(tmpdir):
+    tmpdir.join('subjects.txt').write(
+        '# id, dwi, bvecs, bvals, anat\n'
+        'sub01, sub01/dwi.nii.gz, sub01/bvec, sub01/bval\n'
+        '\n'
+        'sub02 /data/dwi.nii.gz /data/bvec /data/bval /data/t1.nii.gz\n')
+    subjects = read_subjects(str(tmpdir.join('subjects.txt')))
+    assert list(subjects) == ['sub01', 'sub02']
+    assert subjects['sub01']['dwi'] == str(tmpdir.join('sub01', 'dwi.nii.gz'))
+    assert subjects['sub01']['anat'] is None
+    assert subjects['sub02']['anat'] == '/data/t1.nii.gz'
+
+
+def test_read_subjects_irregular(tmpdir):
+    tmpdir.join('subjects.txt').write('sub01 dwi.nii.gz bvec\n')
+    with pytest.raises(ValueError):
+        read_subjects(str(tmpdir.join('subjects.txt')))
+
+
+def test_find_bids_subjects(tmpdir):
+    for sub in ['sub-01', 'sub-02']:
+        for ext in ['_dwi.nii.gz', '_dwi.bvec', '_dwi.bval']:
+            tmpdir.join(sub, 'dwi', sub + ext).ensure()
+    tmpdir.join('sub-01', 'anat', 'sub-01_T1w.nii.gz').ensure()
+    tmpdir.join('sub-03', 'dwi', 'sub-03_dwi.nii.gz').ensure()
+    subjects = find_bids_subjects(str(tmpdir))
+    assert list(subjects) == ['sub-01', 'sub-02']
+    assert subjects['sub-01']['bvecs'] == str(tmpdir.join('sub-01', 'dwi', 'sub-01_dwi.bvec'))
+    assert subjects['sub-01']['anat'] == str(tmpdir.join('sub-01', 'anat', 'sub-01_T1w.nii.gz'))
+    assert subjects['sub-02']['anat'] is None
+
+
+def test_select_subject_anat(tmpdir):
+    """Each subject gets its own T1-weighted data, even if some have none."""
+    tmpdir.join('subjects.txt').write(
+        'sub01 dwi1.nii.gz bvec1 bval1\n'
+        'sub02 dwi2.nii.gz bvec2 bval2 t1.nii.gz\n')
+    subjects = read_subjects(str(tmpdir.join('subjects.txt')))
+    assert select_subject('sub01', subjects)[3] is None
+    assert select_subject('sub02', subjects) == tuple(
+        str(tmpdir.join(f)) for f in ['dwi2.nii.gz', 'bvec2', 'bval2', 't1.nii.gz'])
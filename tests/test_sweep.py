@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the design of parameter sweeps."""
+
+from collections import OrderedDict
+
+from trampolino.utils.sweep import sweep, command_key
+from trampolino.workflows import mrtrix_tckgen
+
+
+def test_grid_design():
+    spec = {'design': 'grid',
+            'parameters': OrderedDict([('angle', {'min': 30, 'max': 60, 'step': 15}),
+                                       ('algorithm', ['iFOD2', 'SD_Stream'])])}
+    combos = sweep(spec)
+    assert len(combos) == 6
+    assert combos[0] == {'angle': 30, 'algorithm': 'iFOD2'}
+    assert combos[-1] == {'angle': 60, 'algorithm': 'SD_Stream'}
+
+
+def test_lhs_design():
+    spec = {'design': 'lhs', 'samples': 10, 'seed': 0,
+            'parameters': {'angle': {'min': 0, 'max': 10, 'type': 'float'}}}
+    angles = sorted(c['angle'] for c in sweep(spec))
+    assert [int(a) for a in angles] == list(range(10))
+
+
+def test_deduplication_and_budget():
+    spec = {'design': 'list', 'seed': 0,
+            'combinations': [{'angle': 30, 'min_length': 10},
+                             {'angle': 30.0000001, 'min_length': 10},
+                             {'angle': 45, 'min_length': 10},
+                             {'angle': 60, 'min_length': 10}]}
+    wf = mrtrix_tckgen.create_pipeline(name='tck', opt='')
+    key = command_key(wf, ['angle', 'min_length'])
+    assert len(sweep(spec, key=key)) == 3
+    spec['budget'] = 2
+    combos = sweep(spec, key=key)
+    assert len(combos) == 2
+    assert combos[0]['angle'] < combos[1]['angle']
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the native track density imaging."""
+
+import os
+import pytest
+import numpy as np
+import nibabel as nib
+
+from trampolino.workflows.interfaces.nibabel import tdi
+
+
+@pytest.fixture
+def tractogram(tmpdir):
+    """Streamlines along a diagonal and along x, on a 2 mm grid."""
+    rng = np.random.RandomState(5)
+    streamlines = []
+    for _ in range(20):
+        line = np.zeros((5, 3), dtype=np.float32)
+        line[:, 0] = np.linspace(1, 15, 5)
+        line[:, 1:] = 7.
+        streamlines.append(line + rng.uniform(-0.4, 0.4, size=3).astype(np.float32))
+    diagonal = np.repeat(np.linspace(0.2, 17.8, 3)[:, None], 3, axis=1).astype(np.float32)
+    streamlines.append(diagonal)
+    tck = os.path.join(str(tmpdir), 'track.tck')
+    nib.streamlines.save(
+        nib.streamlines.Tractogram(streamlines, affine_to_rasmm=np.eye(4)), tck)
+    affine = np.diag([2., 2., 2., 1.])
+    ref = os.path.join(str(tmpdir), 'ref.nii.gz')
+    nib.save(nib.Nifti1Image(np.zeros((9, 9, 9), dtype=np.uint8), affine), ref)
+    return tck, ref, streamlines
+
+
+def brute_force(streamlines, affine, shape, contrast):
+    """Density from finely sampled streamlines, one at a time."""
+    density = np.zeros(shape)
+    inverse = np.linalg.inv(affine)
+    for s in streamlines:
+        visited = set()
+        for a, b in zip(s[:-1], s[1:]):
+            t = (np.arange(1000) + 0.5) / 1000
+            points = a + t[:, None] * (b - a)
+            vox = np.rint(nib.affines.apply_affine(inverse, points)).astype(int)
+            for v in map(tuple, vox[np.all((vox >= 0) & (vox < shape), axis=1)]):
+                if contrast == 'length':
+                    density[v] += np.linalg.norm(b - a) / 1000
+                else:
+                    visited.add(v)
+        for v in visited:
+            density[v] += 1
+    return density
+
+
+@pytest.mark.parametrize('contrast', ['count', 'length'])
+@pytest.mark.parametrize('workers,chunk_size', [(1, 100000), (3, 4)])
+def test_track_density(tractogram, contrast, workers, chunk_size):
+    """The chunked, parallel map matches a brute force rasterization."""
+    tck, ref, streamlines = tractogram
+    affine = nib.load(ref).affine
+    density = tdi.track_density(tck, affine, (9, 9, 9), contrast, None, chunk_size, workers)
+    expected = brute_force(streamlines, affine, (9, 9, 9), contrast)
+    if contrast == 'count':
+        np.testing.assert_array_equal(density, expected)
+    else:
+        np.testing.assert_allclose(density, expected, atol=0.05)
+        np.testing.assert_allclose(density.sum(), expected.sum(), rtol=1e-4)
+
+
+def test_weighted_density(tmpdir, tractogram):
+    """The map is saved on the reference grid and weighted by streamline."""
+    tck, ref, streamlines = tractogram
+    weights = os.path.join(str(tmpdir), 'weights.txt')
+    np.savetxt(weights, [0.5] * 20 + [2.])
+    tmpdir.mkdir('tdi').chdir()
+    result = tdi.TrackDensity(in_file=tck, reference=ref, weights=weights).run()
+    img = nib.load(result.outputs.out_file)
+    np.testing.assert_array_equal(img.affine, nib.load(ref).affine)
+    expected = (0.5 * brute_force(streamlines[:20], img.affine, (9, 9, 9), 'count') +
+                2. * brute_force(streamlines[20:], img.affine, (9, 9, 9), 'count'))
+    np.testing.assert_allclose(img.get_fdata(), expected)
@@ -30,9 +30,11 @@ def test_content(response):
 def test_command_line_interface():
     """Test the CLI."""
     runner = CliRunner()
-    result = runner.invoke(cli.main)
+    result = runner.invoke(cli.cli)
     assert result.exit_code == 0
-    assert 'trampolino.cli.main' in result.output
-    help_result = runner.invoke(cli.main, ['--help'])
+    assert 'Commands:' in result.output
+    help_result = runner.invoke(cli.cli, ['--help'])
     assert help_result.exit_code == 0
-    assert '--help  Show this message and exit.' in help_result.output
+    assert '--help' in help_result.output
+    for command in ('recon', 'track', 'filter', 'convert'):
+        assert command in help_result.output
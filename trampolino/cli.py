@@ -7,6 +7,7 @@ import click
 import shutil
 import tempfile
 import time
+from collections import OrderedDict
 from importlib import import_module
 from importlib.util import find_spec
 import nipype.pipeline.engine as pe
@@ -15,6 +16,14 @@ from nipype.interfaces.io import DataSink
 from distutils.dir_util import copy_tree
 from .utils.get_example_data import grab_data
 from .utils.containers import set_inputs
+from .utils.resources import set_thread_budget
+from .utils.cache import ResultCache, enable_cache
+from .utils.sweep import read_spec, expand_values, command_key, sweep
+from .utils.halving import create_halving
+from .utils.batch import list_inputs, run_batch
+from .utils.subjects import read_subjects, find_bids_subjects, select_subject
+from .utils.profiling import enable_profiling, profile_report, write_report
+from .workflows.interfaces import nibabel as nba
 
 
 @click.group(chain=True)
@@ -29,8 +38,18 @@ from .utils.containers import set_inputs
 @click.option('-f', '--force', is_flag=True,
               help="""Forces following commands by downloading example data [~180MB] 
               and calculating required inputs.""")
+@click.option('-p', '--plugin', type=str, default='Linear',
+              help='Nipype execution plugin (e.g. Linear, MultiProc, SGE, SLURM).')
+@click.option('--n_procs', type=int, help='Number of processors available to the plugin.')
+@click.option('--memory_gb', type=float, help='Memory (in GB) available to the plugin.')
+@click.option('--cache_dir', type=click.Path(file_okay=False, resolve_path=True),
+              help='Directory of results shared across experiments.')
+@click.option('--cache_size', type=float, help='Maximum size (in GB) of the shared results.')
+@click.option('--profile', is_flag=True,
+              help='Monitor the resources of each node and write a profiling report (it requires psutil).')
 @click.pass_context
-def cli(ctx, working_dir, name, results, save, container, image, keep, force):
+def cli(ctx, working_dir, name, results, save, container, image, keep, force,
+        plugin, n_procs, memory_gb, cache_dir, cache_size, profile):
     if not ctx.obj:
         ctx.obj = {}
 
@@ -41,6 +60,19 @@ def cli(ctx, working_dir, name, results, save, container, image, keep, force):
     ctx.obj['force'] = force
     ctx.obj['temp'] = ''
     ctx.obj['container_dir'] = ''
+    ctx.obj['plugin'] = plugin
+    ctx.obj['plugin_args'] = {}
+    ctx.obj['threads'] = []
+    if n_procs:
+        ctx.obj['plugin_args']['n_procs'] = n_procs
+    if memory_gb:
+        ctx.obj['plugin_args']['memory_gb'] = memory_gb
+    ctx.obj['profile'] = profile
+    if profile:
+        if find_spec("psutil") is None:
+            click.echo('The --profile option was specified but the psutil package is not installed.')
+            sys.exit(1)
+        enable_profiling()
 
     if not ctx.obj['container']:
         datasink = pe.Node(DataSink(base_directory=ctx.obj['wdir'],
@@ -75,9 +107,13 @@ def cli(ctx, working_dir, name, results, save, container, image, keep, force):
               help='Text file containing the b-values.')
 @click.option('-a', '--anat', type=click.Path(resolve_path=True),
               help='Optional T1-weighted data.')
+@click.option('--subjects', type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Subject list (identifier, DWI, b-vectors, b-values, optional T1 per line).')
+@click.option('--bids', type=click.Path(exists=True, file_okay=False, resolve_path=True),
+              help='BIDS dataset to process all the subjects of.')
 @click.option('--opt', type=str, help='Workflow-specific optional arguments.')
 @click.pass_context
-def dw_recon(ctx, workflow, in_file, bvec, bval, anat, opt):
+def dw_recon(ctx, workflow, in_file, bvec, bval, anat, subjects, bids, opt):
     """Estimates the fiber orientation distribution.
 
     Available workflows: mrtrix_msmt_csd, dtk_dtirecon, dsi_rec"""
@@ -92,6 +128,57 @@ def dw_recon(ctx, workflow, in_file, bvec, bval, anat, opt):
     wf = ctx.obj['workflow']
     wf_sub = wf_mod.create_pipeline(name='recon', opt=opt)
 
+    if subjects or bids:
+        if subjects:
+            batch = read_subjects(click.format_filename(subjects))
+        else:
+            batch = find_bids_subjects(click.format_filename(bids))
+        if not batch:
+            click.echo("No subjects found.")
+            sys.exit(1)
+        for files in batch.values():
+            inputs = [files['dwi'], files['bvecs'], files['bvals']]
+            if files['anat']:
+                inputs.append(files['anat'])
+            files['dwi'], files['bvecs'], files['bvals'], *anat = \
+                set_inputs(ctx.obj['container'], inputs, ctx.obj['container_dir'], ctx.obj['temp'])
+            files['anat'] = anat[0] if anat else None
+        click.echo("Processing {} subjects.".format(len(batch)))
+
+        subject_node = pe.Node(
+            interface=util.IdentityInterface(fields=["subject_id"]),
+            name="subject_node")
+        subject_node.iterables = ('subject_id', list(batch.keys()))
+        select = pe.Node(name='select_subject', interface=util.Function(
+            input_names=['subject_id', 'subjects'],
+            output_names=['dwi', 'bvecs', 'bvals', 'anat'],
+            function=select_subject))
+        select.inputs.subjects = dict(batch)
+        wf.connect([(subject_node, select, [("subject_id", "subject_id")]),
+                    (select, wf_sub, [("dwi", "inputnode.dwi"),
+                                      ("bvecs", "inputnode.bvecs"),
+                                      ("bvals", "inputnode.bvals")])])
+        if 't1_dw' in wf_sub.get_node('inputnode').inputs.copyable_trait_names():
+            # the T1-weighted data of each subject (None when missing)
+            wf.connect([(select, wf_sub, [("anat", "inputnode.t1_dw")])])
+            missing = [s for s, files in batch.items() if not files['anat']]
+            if missing:
+                click.echo("No T1-weighted data for {} of the subjects: {}".format(
+                    len(missing), ', '.join(missing)))
+        ctx.obj['subjects'] = len(batch)
+    else:
+        set_recon_inputs(ctx, wf_sub, in_file, bvec, bval, anat)
+        wf.add_nodes([wf_sub])
+
+    wf.connect([(wf_sub, ctx.obj['results'], [
+        ("outputnode.odf", "@odf"),
+        ("outputnode.seed", "@seed")])])
+    ctx.obj['recon'] = wf_sub
+    ctx.obj['threads'].append((wf_sub, ctx.obj.get('subjects', 1)))
+    return workflow
+
+
+def set_recon_inputs(ctx, wf_sub, in_file, bvec, bval, anat):
     inputs = []
     if in_file:
         inputs.append(click.format_filename(in_file))
@@ -116,13 +203,6 @@ def dw_recon(ctx, workflow, in_file, bvec, bval, anat, opt):
     if anat:
         wf_sub.inputs.inputnode.t1_dw = anat[0]
 
-    wf.add_nodes([wf_sub])
-    wf.connect([(wf_sub, ctx.obj['results'], [
-        ("outputnode.odf", "@odf"),
-        ("outputnode.seed", "@seed")])])
-    ctx.obj['recon'] = wf_sub
-    return workflow
-
 
 @cli.command('track')
 @click.argument('workflow', required=True)
@@ -137,9 +217,19 @@ def dw_recon(ctx, workflow, in_file, bvec, bval, anat, opt):
 @click.option('--min_length', type=str, help='Minimum streamline length(s).')
 @click.option('--ensemble', type=str,
               help='Ensemble over one parameter (algorithm, angle, min_length).')
+@click.option('--sweep', 'sweep_spec', type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              help='Sweep specification (replaces the parameter values above).')
+@click.option('--adaptive', is_flag=True,
+              help='Prune the parameter combinations by successive halving.')
+@click.option('--rungs', type=int, default=3, help='Number of rungs of the adaptive sweep.')
+@click.option('--promote', type=float, default=0.5,
+              help='Fraction of combinations promoted at each rung of the adaptive sweep.')
+@click.option('--endpoints/--no_endpoints', default=True,
+              help='Write the endpoints and lengths of the streamlines in a sidecar.')
 @click.option('--opt', type=str, help='Workflow-specific optional arguments.')
 @click.pass_context
-def odf_track(ctx, workflow, odf, seed, algorithm, angle, angle_range, min_length, ensemble, opt):
+def odf_track(ctx, workflow, odf, seed, algorithm, angle, angle_range, min_length, ensemble,
+              sweep_spec, adaptive, rungs, promote, endpoints, opt):
     """Reconstructs the streamlines.
 
     Available workflows: mrtrix_tckgen, dtk_dtitracker, dsi_trk, trekker, tractseg"""
@@ -154,26 +244,61 @@ def odf_track(ctx, workflow, odf, seed, algorithm, angle, angle_range, min_lengt
     param = pe.Node(
         interface=util.IdentityInterface(fields=["angle", "algorithm", "min_length"]),
         name="param_node")
-    param_dict = {}
-    if angle or algorithm or min_length:
-        param.iterables = []
+    param_dict = OrderedDict()
     if angle:
-        angles = angle.split(',')
-        param_dict['angle'] = [int(a) for a in angles if a.isdigit()]
+        param_dict['angle'] = [int(a) for a in angle.split(',') if a.isdigit()]
         if angle_range:
-            param_dict['angle'] = range(param_dict['angle'][0], param_dict['angle'][-1])
-        param.iterables.append(('angle', param_dict['angle']))
+            param_dict['angle'] = list(range(param_dict['angle'][0], param_dict['angle'][-1]))
     if algorithm:
         param_dict['algorithm'] = algorithm.split(',')
-        param.iterables.append(('algorithm', param_dict['algorithm']))
     if min_length:
-        lengths = min_length.split(',')
-        param_dict['min_length'] = [int(l) for l in lengths if l.isdigit()]
-        param.iterables.append(('min_length', param_dict['min_length']))
+        param_dict['min_length'] = [int(l) for l in min_length.split(',') if l.isdigit()]
+    if sweep_spec:
+        spec = read_spec(click.format_filename(sweep_spec))
+    else:
+        spec = {'design': 'grid', 'parameters': param_dict}
     wf_sub = wf_mod.create_pipeline(name='tck', opt=opt, ensemble=ensemble)
+    members = 1
     if ensemble:
-        param.iterables.remove((ensemble, param_dict[ensemble]))
-        setattr(wf_sub.inputs.inputnode, ensemble, param_dict[ensemble])
+        values = expand_values(spec.get('parameters', {}).pop(ensemble, None) or
+                               param_dict[ensemble])
+        setattr(wf_sub.inputs.inputnode, ensemble, values)
+        members = len(values)
+        member = wf_sub.get_node('member')
+        if member is not None:
+            # streaming merge: the members are iterables instead of a MapNode
+            member.iterables = [(ensemble, values), ('member', list(range(members)))]
+            member.synchronize = True
+        shard = wf_sub.get_node('shard')
+        if shard is not None:
+            # the tracking MapNode runs every shard of every member
+            members *= shard.inputs.shards
+        for c in spec.get('combinations', []):
+            c.pop(ensemble, None)
+    if spec.get('design') == 'list':
+        names = list(spec['combinations'][0])
+    else:
+        names = list(spec.get('parameters', {}))
+    for n in names:
+        if n not in param.inputs.copyable_trait_names():
+            click.echo(n + ' is not a tracking parameter.')
+            sys.exit(1)
+    combos = sweep(spec, key=command_key(wf_sub, names)) if names else []
+    if adaptive:
+        if ensemble or not combos:
+            click.echo('The adaptive sweep requires swept parameters and no ensemble.')
+            sys.exit(1)
+        try:
+            wf_sub = create_halving(wf_sub, combos, names, rungs, promote, name='tck')
+        except ValueError as err:
+            click.echo(err)
+            sys.exit(1)
+        click.echo('Adaptive sweep over {} parameter combinations.'.format(len(combos)))
+        ctx.obj['adaptive'] = True
+    elif combos:
+        param.iterables = [(n, [c[n] for c in combos]) for n in names]
+        param.synchronize = True
+        click.echo('Sweeping {} parameter combinations.'.format(len(combos)))
     wf = ctx.obj['workflow']
 
     if 'recon' not in ctx.obj:
@@ -210,8 +335,24 @@ def odf_track(ctx, workflow, odf, seed, algorithm, angle, angle_range, min_lengt
         for p in param.iterables:
             wf.connect([(param, wf_sub, [(p[0], "inputnode." + p[0])])])
     wf.connect([(wf_sub, ctx.obj['results'], [("outputnode.tck", "@tck")])])
+    outputs = wf_sub.get_node('outputnode').inputs.copyable_trait_names()
+    if not adaptive and 'connectomes' in outputs:
+        wf.connect([(wf_sub, ctx.obj['results'], [("outputnode.connectomes", "@connectomes")])])
+    if not adaptive and 'members' in outputs:
+        wf.connect([(wf_sub, ctx.obj['results'], [("outputnode.members", "@members")])])
+    if endpoints and not adaptive:
+        # compact sidecar read by the filters instead of the whole tractogram
+        sidecar = pe.Node(nba.ExtractEndpoints(), name='endpoints')
+        wf.connect([(wf_sub, sidecar, [("outputnode.tck", "in_file")]),
+                    (sidecar, ctx.obj['results'], [("out_file", "@endpoints")])])
+        ctx.obj['endpoints'] = sidecar
+    branches = ctx.obj.get('subjects', 1)
+    if not adaptive:
+        branches *= max(len(combos), 1)
     ctx.obj['track'] = wf_sub
     ctx.obj['param'] = param
+    ctx.obj['branches'] = branches
+    ctx.obj['threads'].append((wf_sub, branches * members))
     return workflow
 
 
@@ -226,7 +367,8 @@ def odf_track(ctx, workflow, odf, seed, algorithm, angle, angle_range, min_lengt
 def tck_filter(ctx, workflow, tck, odf, opt):
     """Filters the tracking result.
 
-    Available workflows: mrtrix_tcksift, dtk_spline"""
+    Available workflows: mrtrix_tcksift, dtk_spline, subsample, roi_query,
+    shape_filter, resample, native_sift2, native_tdi, native_connectome"""
 
     try:
         wf_mod = import_module('.workflows.' + workflow, package='trampolino')
@@ -235,6 +377,9 @@ def tck_filter(ctx, workflow, tck, odf, opt):
     except ImportError as err:
         click.echo(workflow + ' is not a valid workflow.')
         sys.exit(1)
+    if ctx.obj.get('adaptive'):
+        click.echo('The adaptive sweep results in lists of tractograms, aborting.')
+        sys.exit(1)
     wf_sub = wf_mod.create_pipeline(name='tck_post', opt=opt)
     wf = ctx.obj['workflow']
     if 'track' not in ctx.obj:
@@ -264,7 +409,15 @@ def tck_filter(ctx, workflow, tck, odf, opt):
         wf.add_nodes([wf_sub])
         wf.connect([(ctx.obj['track'], wf_sub, [("outputnode.tck", "inputnode.tck")]),
                     (ctx.obj['track'], wf_sub, [("inputnode.odf", "inputnode.odf")])])
+    if ('endpoints' in ctx.obj and
+            'endpoints' in wf_sub.get_node('inputnode').inputs.copyable_trait_names()):
+        wf.connect([(ctx.obj['endpoints'], wf_sub, [("out_file", "inputnode.endpoints")])])
     wf.connect([(wf_sub, ctx.obj['results'], [("outputnode.tck_post", "@tck_post")])])
+    # other results of the native filters (e.g. weights, maps)
+    for field in wf_sub.get_node('outputnode').inputs.copyable_trait_names():
+        if field != 'tck_post':
+            wf.connect([(wf_sub, ctx.obj['results'], [("outputnode." + field, "@" + field)])])
+    ctx.obj['threads'].append((wf_sub, ctx.obj.get('branches', 1)))
     return workflow
 
 
@@ -274,12 +427,20 @@ def tck_filter(ctx, workflow, tck, odf, opt):
               help='Reconstructed streamlines.')
 @click.option('-r', '--ref', type=click.Path(exists=True, resolve_path=True),
               help='Estimated fiber orientation distribution.')
+@click.option('--batch', type=click.Path(exists=True, resolve_path=True),
+              help='Directory (or text file listing the tractograms) to convert in bulk.')
+@click.option('--out_dir', type=click.Path(file_okay=False, resolve_path=True),
+              help='Output directory of the batch conversion.')
+@click.option('--workers', type=int, help='Number of processes of the batch conversion.')
 @click.option('--opt', type=str, help='Workflow-specific optional arguments.')
 @click.pass_context
-def tck_convert(ctx, workflow, tck, ref, opt):
+def tck_convert(ctx, workflow, tck, ref, batch, out_dir, workers, opt):
     """Convert tractograms.
 
-    Available workflows: tck2tr, trk2tck"""
+    Available workflows: tck2trk, trk2tck, tck2tcz, tcz2tck"""
+
+    if batch:
+        convert_in_bulk(ctx, workflow, batch, ref, out_dir, workers, opt)
 
     try:
         wf_mod = import_module('.workflows.' + workflow, package='trampolino')
@@ -288,6 +449,9 @@ def tck_convert(ctx, workflow, tck, ref, opt):
     except ImportError as err:
         click.echo(workflow + ' is not a valid workflow.')
         sys.exit(1)
+    if ctx.obj.get('adaptive'):
+        click.echo('The adaptive sweep results in lists of tractograms, aborting.')
+        sys.exit(1)
     wf_sub = wf_mod.create_pipeline(name='tck_convert', opt=opt)
     wf = ctx.obj['workflow']
     if ref:
@@ -302,25 +466,80 @@ def tck_convert(ctx, workflow, tck, ref, opt):
     return workflow
 
 
+def convert_in_bulk(ctx, workflow, batch, ref, out_dir, workers, opt):
+    """Converts many tractograms in parallel processes, without building a workflow."""
+
+    extensions = {'tck2trk': ('.tck', '.trk'), 'trk2tck': ('.trk', '.tck'),
+                  'tck2tcz': ('.tck', '.tcz'), 'tcz2tck': ('.tcz', '.tck')}
+    if workflow not in extensions:
+        click.echo(workflow + ' is not a valid workflow.')
+        sys.exit(1)
+    if workflow == 'tck2trk' and not ref:
+        click.echo('The conversion to .trk requires a reference volume.')
+        sys.exit(1)
+    if len(ctx.obj['workflow'].list_node_names()) > 1:
+        click.echo('The batch conversion cannot be chained to other steps.')
+        sys.exit(1)
+
+    parameters = {'chunk_size': 0, 'precision': 'single' if workflow == 'tck2trk' else 0.01}
+    for o in (opt or '').split(','):
+        try:
+            [key, value] = o.split(':')
+            parameters[key] = value
+        except ValueError:
+            pass
+
+    in_ext, out_ext = extensions[workflow]
+    in_files = list_inputs(click.format_filename(batch), in_ext)
+    if not in_files:
+        click.echo('No tractograms found.')
+        sys.exit(1)
+    out_dir = out_dir or os.path.join(ctx.obj['wdir'], ctx.obj['output'])
+    click.echo('Converting {} tractograms with {}.'.format(len(in_files), workflow))
+    run_batch(in_files, out_dir, out_ext, echo=click.echo,
+              ref=click.format_filename(ref) if ref else None,
+              workers=workers or ctx.obj['plugin_args'].get('n_procs'),
+              chunk_size=int(parameters['chunk_size']),
+              single_precision=parameters['precision'] == 'single',
+              precision=float(parameters['precision']) if workflow == 'tck2tcz' else 0.01)
+    ctx.exit(0)
+
+
 @cli.resultcallback()
-def process_result(steps, working_dir, name, results, save, container, image, keep, force):
+def process_result(steps, working_dir, name, results, save, container, image, keep, force,
+                   plugin, n_procs, memory_gb, cache_dir, cache_size, profile):
     for n, s in enumerate(steps):
         click.echo('Step {}: {}'.format(n + 1, s))
     ctx = click.get_current_context()
     wf = ctx.obj['workflow']
+    if n_procs:
+        for wf_sub, concurrency in ctx.obj['threads']:
+            set_thread_budget(wf_sub, n_procs, concurrency)
     wf.write_graph(graph2use='colored')
     click.echo('Workflow graph generated.')
     if ctx.obj['save']:
         wf.export(name+'.py')
     if not ctx.obj['container']:
+        if cache_dir:
+            enable_cache(wf, ResultCache(cache_dir, cache_size))
         click.echo('Workflow about to be executed. Fasten your seatbelt!')
-        wf.run()
+        start = time.time()
+        graph = wf.run(plugin=ctx.obj['plugin'], plugin_args=ctx.obj['plugin_args'])
+        if profile:
+            out_dir = os.path.join(ctx.obj['wdir'], ctx.obj['output'])
+            os.makedirs(out_dir, exist_ok=True)
+            basename = os.path.join(out_dir, name + '_profile')
+            write_report(profile_report(graph, time.time() - start), basename)
+            click.echo('Profiling report written to {}.html (and .json).'.format(basename))
     else:
         click.echo('Containers enabled, about to go into the cyberspace!')
+        if profile:
+            click.echo('The profiling report is not available with containers.')
         docker = import_module('docker')
         shutil.copyfile(name+'.py', os.path.join(ctx.obj['temp'], name+'.py'))
         with open(os.path.join(ctx.obj['temp'], name+'.py'), 'a') as file:
-            file.write('\n' + name + '.run()\n')
+            file.write('\n{}.run(plugin={!r}, plugin_args={!r})\n'.format(
+                name, ctx.obj['plugin'], ctx.obj['plugin_args']))
         client = docker.from_env()
         cmd = 'python3 ' + os.path.join(os.path.join(ctx.obj['container_dir']), name+'.py')
         container_obj = client.containers.run(image, cmd,
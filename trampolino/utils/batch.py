@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Converting many tractograms at once, outside of a Nipype workflow
+"""
+
+import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ..workflows.interfaces.nibabel.conversion import convert_file
+
+
+def list_inputs(path, ext):
+    """Lists the tractograms in a directory (by extension) or in a text file."""
+
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*' + ext)))
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        return [os.path.join(root, line.strip()) for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+def convert_batch(in_files, out_dir, ext, ref=None, workers=None, chunk_size=0,
+                  single_precision=True, precision=0.01):
+    """Converts tractograms in parallel processes.
+
+    Each output is named after its input, with the extension `ext`, in
+    `out_dir`. The statistics of each conversion (see `convert_file`) are
+    yielded as soon as it is done.
+    """
+
+    out_files = [os.path.join(out_dir, os.path.splitext(os.path.basename(f))[0] + ext)
+                 for f in in_files]
+    if len(set(out_files)) < len(out_files):
+        raise ValueError('The input tractograms must have different names')
+    os.makedirs(out_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_file, i, o, ref, chunk_size, single_precision, precision)
+                   for i, o in zip(in_files, out_files)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(stats, seconds):
+    """Overall throughput of a batch, given the statistics of each file and the wall time."""
+
+    seconds = max(seconds, 1e-9)
+    total = {key: sum(s[key] for s in stats)
+             for key in ('streamlines', 'points', 'bytes', 'out_bytes')}
+    total['files'] = len(stats)
+    total['seconds'] = seconds
+    total['files_per_s'] = len(stats) / seconds
+    total['streamlines_per_s'] = total['streamlines'] / seconds
+    total['mb_per_s'] = total['bytes'] / 1024 ** 2 / seconds
+
+    return total
+
+
+def run_batch(in_files, out_dir, ext, echo=print, **kwargs):
+    """Converts a batch, reporting the timing of each file and the overall throughput."""
+
+    start = time.time()
+    stats = []
+    for s in convert_batch(in_files, out_dir, ext, **kwargs):
+        stats.append(s)
+        echo('{}: {} streamlines in {:.2f} s'.format(
+            os.path.basename(s['in_file']), s['streamlines'], s['seconds']))
+    total = summarize(stats, time.time() - start)
+    echo('Converted {files} files ({streamlines} streamlines, {points} points) in {seconds:.2f} s: '
+         '{files_per_s:.2f} files/s, {streamlines_per_s:.0f} streamlines/s, '
+         '{mb_per_s:.1f} MB/s ({bytes} bytes read, {out_bytes} written)'.format(**total))
+
+    return total
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Sharing node results across experiments through a content-addressed cache
+"""
+
+import os
+import json
+import glob
+import shutil
+import hashlib
+from copy import deepcopy
+from nipype import config, logging
+from nipype.pipeline import engine as pe
+from nipype.pipeline.engine.utils import (load_resultfile, save_resultfile,
+                                          save_hashfile, merge_dict)
+from nipype.utils.filemanip import hash_infile
+logger = logging.getLogger('nipype.workflow')
+
+
+def content_hash(value):
+    """Replaces the existing files in an input value with their checksum."""
+
+    if isinstance(value, (list, tuple)):
+        return [content_hash(v) for v in value]
+    if isinstance(value, dict):
+        return {k: content_hash(v) for k, v in value.items()}
+    if isinstance(value, str) and os.path.isfile(value):
+        return hash_infile(value)
+    return value
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+class ResultCache(object):
+    """Directory of node results indexed by a hash of their inputs.
+
+    The key of a node depends on its interface, on its parameters and on
+    the content (not the path) of its input files, so that the same
+    computation is recognized across experiments and working directories.
+    When the cache exceeds `max_size_gb`, the least recently used entries
+    are removed.
+    """
+
+    def __init__(self, cache_dir, max_size_gb=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_gb = max_size_gb
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, node):
+        node._get_inputs()
+        items = []
+        for name, value in sorted(node.inputs.get_traitsfree().items()):
+            if not node.inputs.trait(name).nohash:
+                items.append((name, content_hash(value)))
+        interface = node.interface.__class__
+        desc = json.dumps([interface.__module__, interface.__name__, items],
+                          sort_keys=True, default=str)
+        return hashlib.sha256(desc.encode()).hexdigest()
+
+    def fetch(self, key, outdir):
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            return False
+        shutil.rmtree(outdir, ignore_errors=True)
+        shutil.copytree(entry, outdir)
+        os.utime(entry)
+        return True
+
+    def store(self, key, outdir, name):
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        # output paths are stored relative to the node directory, to be resolved when fetched
+        resultfile = os.path.join(outdir, 'result_%s.pklz' % name)
+        save_resultfile(load_resultfile(resultfile), outdir, name, rebase=True)
+        temp = os.path.join(self.cache_dir, '.{}.{}'.format(key, os.getpid()))
+        shutil.copytree(outdir, temp)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        if self.max_size_gb is None:
+            return
+        entries = [os.path.join(self.cache_dir, e) for e in os.listdir(self.cache_dir)
+                   if not e.startswith('.') and e != keep]
+        entries.sort(key=os.path.getmtime)
+        sizes = {e: dir_size(e) for e in entries}
+        total = sum(sizes.values())
+        if keep is not None:
+            total += dir_size(os.path.join(self.cache_dir, keep))
+        while entries and total > self.max_size_gb * 1024 ** 3:
+            oldest = entries.pop(0)
+            shutil.rmtree(oldest, ignore_errors=True)
+            total -= sizes[oldest]
+            logger.info('[Cache] Evicted "%s".', oldest)
+
+
+class CachedNode(pe.Node):
+    """Node whose results can be fetched from (and stored in) a ResultCache.
+
+    Without a cache, it behaves exactly as a regular node.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CachedNode, self).__init__(*args, **kwargs)
+        self.cache = None
+
+    def run(self, updatehash=False):
+        if self.cache is None:
+            return super(CachedNode, self).run(updatehash=updatehash)
+
+        if self.config is None:
+            self.config = {}
+        self.config = merge_dict(deepcopy(config._sections), self.config)
+
+        outdir = self.output_dir()
+        key = self.cache.key(self)
+        cached, updated = self.is_cached()
+        if not (cached and updated) and self.cache.fetch(key, outdir):
+            # the fetched results are marked as up-to-date for this node
+            hashed_inputs, hashvalue = self._get_hashval()
+            for hashfile in glob.glob(os.path.join(outdir, '_0x*.json')):
+                os.remove(hashfile)
+            save_hashfile(os.path.join(outdir, '_0x%s.json' % hashvalue), hashed_inputs)
+            logger.info('[Cache] "%s" fetched from cache.', self.fullname)
+
+        result = super(CachedNode, self).run(updatehash=updatehash)
+        self.cache.store(key, outdir, self.name)
+        return result
+
+
+def enable_cache(workflow, cache):
+    for node in workflow._get_all_nodes():
+        if isinstance(node, CachedNode):
+            node.cache = cache
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Building a connectome for each member of an ensemble
+"""
+
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+
+
+def member_connectome(in_file, parc):
+    """Connectome (count and mean length) of the tractogram of one member."""
+
+    import os
+    import numpy as np
+    from trampolino.workflows.interfaces.nibabel.connectome import build_connectome
+    from trampolino.workflows.interfaces.nibabel.index import index_path
+    from trampolino.workflows.interfaces.nibabel.mif import load_image
+
+    labels, affine = load_image(parc)
+    index_file = os.path.abspath(index_path(os.path.basename(in_file)))
+    connectome = build_connectome(in_file, labels, affine, lengths=True, index_file=index_file)
+    out_file = os.path.abspath('connectome.npz')
+    np.savez_compressed(out_file, count=connectome['count'], length=connectome['length'])
+
+    return out_file
+
+
+def stack_connectomes(in_files, values=None, shards=1):
+    """Stacks the connectomes of the members (members x regions x regions) in a .npz file.
+
+    The connectomes of the shards of a member (consecutive inputs) are
+    combined: the counts are summed and the mean lengths weighted by them.
+    The value of the ensemble parameter of each member is saved as `members`.
+    """
+
+    import os
+    import numpy as np
+
+    counts, lengths = [], []
+    for f in in_files:
+        with np.load(f) as c:
+            counts.append(c['count'])
+            lengths.append(c['length'] * c['count'])
+    nb_regions = max(len(c) for c in counts)
+    # parcellations may differ in their highest label, the matrices are padded
+    counts = np.stack([np.pad(c, (0, nb_regions - len(c))) for c in counts])
+    lengths = np.stack([np.pad(l, (0, nb_regions - len(l))) for l in lengths])
+    shape = (-1, shards, nb_regions, nb_regions)
+    count = counts.reshape(shape).sum(axis=1)
+    length = np.divide(lengths.reshape(shape).sum(axis=1), count,
+                       out=np.zeros(count.shape), where=count > 0)
+    if values is None:
+        values = list(range(len(count)))
+    members = np.array(values[::shards] if len(values) == len(in_files) else values)
+
+    out_file = os.path.abspath('connectomes.npz')
+    np.savez_compressed(out_file, count=count, length=length, members=members)
+
+    return out_file
+
+
+def connect_member_connectomes(workflow, source, output, outputnode, parc,
+                               member=None, ensemble=None, inputnode=None, shards=1):
+    """Builds the connectome of each tractogram of `source` and stacks them.
+
+    If `member` is given (streaming merge), `source` runs once per member
+    and each connectome is built as soon as its tractogram is done, then
+    the connectomes are joined; otherwise, `source` is a MapNode (or a
+    single node) and the connectomes are built for each of its outputs. The
+    values of the `ensemble` parameter are taken from `member` or `inputnode`.
+    """
+
+    inputs = ['in_file', 'parc']
+    function = util.Function(input_names=inputs, output_names=['out_file'],
+                             function=member_connectome)
+    stack_function = util.Function(input_names=['in_files', 'values', 'shards'],
+                                   output_names=['out_file'], function=stack_connectomes)
+    if member is not None:
+        connectome = pe.Node(name='member_connectome', interface=function)
+        stack = pe.JoinNode(name='stack_connectomes', joinsource=member,
+                            joinfield=['in_files', 'values'], interface=stack_function)
+        workflow.connect([(member, stack, [(ensemble, "values")])])
+    else:
+        connectome = pe.MapNode(name='member_connectome', iterfield=['in_file'],
+                                interface=function)
+        stack = pe.Node(name='stack_connectomes', interface=stack_function)
+        if ensemble:
+            workflow.connect([(inputnode, stack, [(ensemble, "values")])])
+    connectome.inputs.parc = parc
+    stack.inputs.shards = shards
+
+    workflow.connect([(source, connectome, [(output, "in_file")]),
+                      (connectome, stack, [("out_file", "in_files")]),
+                      (stack, outputnode, [("out_file", "connectomes")])])
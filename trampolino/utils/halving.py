@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Pruning a tracking parameter sweep by successive halving
+"""
+
+from copy import deepcopy
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+
+
+# input setting the amount of tracking for each supported interface
+COUNT_FIELDS = {'Tractography': 'select',
+                'FiberTrack': 'nos',
+                'DTITracker': 'random_seed'}
+
+# interfaces whose count is a number of streamlines (yield can be measured)
+STREAMLINE_COUNTS = ['Tractography', 'FiberTrack']
+
+
+def rung_counts(count, rungs, fraction):
+    """Amount of tracking of each rung, growing as the combinations are pruned."""
+
+    return [max(1, int(count * fraction ** (rungs - 1 - r))) for r in range(rungs)]
+
+
+def score_tractogram(in_file, count=0, seed_file=None, min_length=20., endpoints_file=None):
+    """Cheap quality score of a (pilot) tractogram, between 0 and 1.
+
+    It is the product of the streamline yield (with respect to the requested
+    `count`, if any), of the fraction of streamlines longer than `min_length`
+    and of the fraction of the seed mask voxels crossed by the streamlines
+    (if the seed image can be read by nibabel). Without a seed mask, the
+    lengths are taken from the endpoints sidecar of the tractogram (either
+    `endpoints_file` or next to the tractogram), if present and up to date.
+    """
+
+    import gzip
+    import numpy as np
+    import nibabel as nib
+    from trampolino.workflows.interfaces.nibabel.endpoints import find_endpoints, load_endpoints
+
+    mask = None
+    if seed_file:
+        try:
+            seed = nib.load(seed_file)
+            mask = np.asarray(seed.dataobj) > 0
+        except Exception:
+            mask = None
+        if mask is not None and not mask.any():
+            mask = None
+
+    # the lengths are enough, unless the coverage of the seed mask is needed
+    sidecar = find_endpoints(in_file, endpoints_file)
+    if sidecar and mask is None:
+        mm = np.asarray(load_endpoints(sidecar)['length'])
+        n = len(mm)
+    else:
+        if in_file.endswith('.gz'):
+            with gzip.open(in_file) as f:
+                streamlines = nib.streamlines.TrkFile.load(f).streamlines
+        else:
+            streamlines = nib.streamlines.load(in_file).streamlines
+        n = len(streamlines)
+        points = streamlines.get_data()
+        if n:
+            offsets = np.asarray(streamlines._offsets)
+            lengths = np.asarray(streamlines._lengths)
+            steps = np.concatenate([[0.], np.cumsum(np.linalg.norm(np.diff(points, axis=0),
+                                                                   axis=1))])
+            mm = steps[offsets + lengths - 1] - steps[offsets]
+    if n == 0:
+        return 0.
+
+    score = np.mean(mm >= min_length)
+    if count:
+        score *= min(1., n / float(count))
+    if mask is not None:
+        vox = np.rint(nib.affines.apply_affine(np.linalg.inv(seed.affine), points)).astype(int)
+        inside = np.all((vox >= 0) & (vox < mask.shape[:3]), axis=1)
+        vox = vox[inside]
+        crossed = np.zeros(mask.shape[:3], dtype=bool)
+        crossed[vox[:, 0], vox[:, 1], vox[:, 2]] = True
+        score *= np.count_nonzero(crossed & mask) / float(np.count_nonzero(mask))
+
+    return float(score)
+
+
+def promote(scores, fraction, fields, **values):
+    """Keeps the parameter values of the best scoring fraction of combinations.
+
+    The values of each parameter in `fields` are passed as a list, and
+    returned in the same order followed by the promoted combinations.
+    """
+
+    import math
+
+    keep = max(1, int(math.ceil(len(scores) * fraction)))
+    ranking = sorted(range(len(scores)), key=lambda i: -scores[i])
+    kept = sorted(ranking[:keep])
+    promoted = [[values[f][i] for i in kept] for f in fields]
+    combos = [dict(zip(fields, c)) for c in zip(*promoted)]
+
+    return tuple(promoted + [combos])
+
+
+def decompress(in_file):
+
+    import os
+    import gzip
+    import shutil
+
+    if not in_file.endswith('.gz'):
+        return in_file
+    out_file = os.path.abspath(os.path.basename(in_file)[:-3])
+    with gzip.open(in_file, 'rb') as f, open(out_file, 'wb') as out:
+        shutil.copyfileobj(f, out)
+
+    return out_file
+
+
+def create_halving(track_wf, combos, names, rungs=3, fraction=0.5, name='tck'):
+    """Successive halving over the tracking node of a workflow.
+
+    Every combination of the swept parameters (`names`) is first tracked
+    with a small amount of streamlines; the tractograms are scored and only
+    the top `fraction` of the combinations is promoted to the next rung,
+    with a larger amount of streamlines, until the last rung runs the full
+    tracking of the workflow. The output `tck` is the list of the
+    tractograms of the last rung, `combos` lists their parameters and
+    `scores` the scores of all the combinations in the previous rung.
+    """
+
+    track = track_wf.get_node('track')
+    interface = track.interface.__class__.__name__
+    if interface not in COUNT_FIELDS or isinstance(track, pe.MapNode):
+        raise ValueError('The adaptive sweep is not supported by this workflow.')
+    count_field = COUNT_FIELDS[interface]
+    count = getattr(track.inputs, count_field)
+    if not isinstance(count, int):
+        # unset (seeds per voxel): the first rung uses the default of one
+        count = int(round(fraction ** (1 - rungs)))
+    counts = rung_counts(count, rungs, fraction)
+
+    # the parameters and the input files of the tracking node, as set by the workflow
+    fields = {}
+    inputs = []
+    output = None
+    for u, v, d in track_wf._graph.edges(data=True):
+        if v is track and u.name == 'inputnode':
+            for src, dest in d['connect']:
+                if src in names:
+                    fields[src] = dest
+                else:
+                    inputs.append((src, dest))
+        elif v is track:
+            raise ValueError('The adaptive sweep is not supported by this workflow.')
+        elif u is track:
+            output = d['connect'][0][0]
+    params = [n for n in names if n in fields]
+    if not params:
+        raise ValueError('None of the swept parameters is used by the tracking.')
+
+    # same inputs (and values already set) as the wrapped workflow
+    track_inputnode = track_wf.get_node('inputnode')
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(
+            fields=track_inputnode.inputs.copyable_trait_names()),
+        name="inputnode")
+    inputnode.inputs.trait_set(**track_inputnode.inputs.get_traitsfree())
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "combos", "scores"]),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    previous = None
+    for r, n in enumerate(counts):
+        rung = pe.MapNode(deepcopy(track.interface), name='track_rung{}'.format(r),
+                          iterfield=[fields[p] for p in params], mem_gb=track.mem_gb)
+        rung.n_procs = track.n_procs
+        setattr(rung.inputs, count_field, n)
+        for src, dest in inputs:
+            workflow.connect([(inputnode, rung, [(src, dest)])])
+        if previous is None:
+            for p in params:
+                setattr(rung.inputs, fields[p], [c[p] for c in combos])
+        else:
+            score, values = previous
+            select = pe.Node(name='promote_rung{}'.format(r), interface=util.Function(
+                input_names=['scores', 'fraction', 'fields'] + params,
+                output_names=params + ['combos'], function=promote))
+            select.inputs.fields = params
+            select.inputs.fraction = fraction
+            if values is None:
+                for p in params:
+                    setattr(select.inputs, p, [c[p] for c in combos])
+            else:
+                workflow.connect([(values, select, [(p, p) for p in params])])
+            workflow.connect([(score, select, [("score", "scores")]),
+                              (select, rung, [(p, fields[p]) for p in params])])
+
+        if r == rungs - 1:
+            unzip = pe.MapNode(name='decompress', iterfield=['in_file'],
+                               interface=util.Function(input_names=['in_file'],
+                                                       output_names=['out_file'],
+                                                       function=decompress))
+            workflow.connect([(rung, unzip, [(output, "in_file")]),
+                              (unzip, outputnode, [("out_file", "tck")])])
+            if previous is None:
+                outputnode.inputs.combos = combos
+            else:
+                workflow.connect([(select, outputnode, [("combos", "combos")]),
+                                  (score, outputnode, [("score", "scores")])])
+            break
+
+        score = pe.MapNode(name='score_rung{}'.format(r), iterfield=['in_file'],
+                           interface=util.Function(
+                               input_names=['in_file', 'count', 'seed_file'],
+                               output_names=['score'],
+                               function=score_tractogram))
+        score.inputs.count = n if interface in STREAMLINE_COUNTS else 0
+        # a single read of each pilot tractogram: an endpoints sidecar would
+        # be an extra pass, and the seed coverage needs all the points anyway
+        workflow.connect([(rung, score, [(output, "in_file")])])
+        if 'seed' in inputnode.inputs.copyable_trait_names():
+            workflow.connect([(inputnode, score, [("seed", "seed_file")])])
+        previous = (score, None if previous is None else select)
+
+    return workflow
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling the nodes of an executed workflow
+"""
+
+import os
+import json
+import html
+import networkx as nx
+from nipype import config
+
+
+def enable_profiling(frequency=1.):
+    """Turns on the nipype resource monitor (it requires psutil)."""
+
+    config.enable_resource_monitor()
+    config.set('execution', 'resource_monitor_frequency', str(frequency))
+
+
+def file_bytes(value, seen=None):
+    """Total size of the existing files in an input or output value."""
+
+    seen = set() if seen is None else seen
+    if isinstance(value, (list, tuple)):
+        return sum(file_bytes(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sum(file_bytes(v, seen) for v in value.values())
+    if isinstance(value, str) and value not in seen and os.path.isfile(value):
+        seen.add(value)
+        return os.path.getsize(value)
+    return 0
+
+
+def cpu_time(prof):
+    """CPU time (in s) from the samples of the resource monitor."""
+
+    times, cpus = prof.get('time', []), prof.get('cpus', [])
+    return sum((t1 - t0) * c / 100. for t0, t1, c in zip(times[:-1], times[1:], cpus[1:]))
+
+
+def node_profile(node):
+    """Wall and CPU time, peak memory and bytes read and written by a node.
+
+    The runtimes of the subnodes of a MapNode are summed (their peak memory
+    is the highest). The bytes are the sizes of the input and output files.
+    """
+
+    name = node.fullname
+    if getattr(node, 'parameterization', None):
+        # the iterable values distinguish the copies of an expanded node
+        name += ' ({})'.format(', '.join(node.parameterization))
+    profile = {'name': name, 'interface': node.interface.__class__.__name__,
+               'wall_time': None, 'cpu_time': None, 'peak_rss_gb': None,
+               'bytes_read': 0, 'bytes_written': 0}
+    try:
+        result = node.result
+    except Exception:
+        result = None
+    if result is None:
+        return profile
+
+    runtimes = result.runtime if isinstance(result.runtime, list) else [result.runtime]
+    durations = [getattr(r, 'duration', None) for r in runtimes]
+    if all(d is not None for d in durations):
+        profile['wall_time'] = sum(durations)
+    profs = [getattr(r, 'prof_dict', None) for r in runtimes]
+    if all(profs):
+        profile['cpu_time'] = sum(cpu_time(p) for p in profs)
+    peaks = [getattr(r, 'mem_peak_gb', None) for r in runtimes]
+    if all(p is not None for p in peaks):
+        profile['peak_rss_gb'] = max(peaks)
+    if result.inputs:
+        profile['bytes_read'] = file_bytes(result.inputs)
+    if result.outputs is not None:
+        # a Bunch for the MapNodes, a TraitedSpec otherwise
+        outputs = result.outputs
+        profile['bytes_written'] = file_bytes(
+            outputs.dictcopy() if hasattr(outputs, 'dictcopy') else outputs.get())
+    return profile
+
+
+def critical_path(graph, durations):
+    """Longest chain of dependent nodes of a DAG, weighted by their durations.
+
+    Returns the nodes of the path and its total duration.
+    """
+
+    finish, previous = {}, {}
+    for node in nx.topological_sort(graph):
+        start = 0.
+        for p in graph.predecessors(node):
+            if finish[p] > start:
+                start, previous[node] = finish[p], p
+        finish[node] = start + (durations.get(node) or 0.)
+    if not finish:
+        return [], 0.
+
+    node = max(finish, key=finish.get)
+    path = [node]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    return path[::-1], finish[node]
+
+
+def profile_report(graph, wall_time=None):
+    """Report of the nodes of an executed graph and of its critical path."""
+
+    profiles = {node: node_profile(node) for node in graph.nodes()}
+    durations = {node: p['wall_time'] for node, p in profiles.items()}
+    path, length = critical_path(graph, durations)
+    nodes = sorted(profiles.values(), key=lambda p: -(p['wall_time'] or 0.))
+
+    return {'wall_time': wall_time,
+            'total_node_time': sum(d or 0. for d in durations.values()),
+            'nodes': nodes,
+            'critical_path': {'nodes': [profiles[n]['name'] for n in path],
+                              'duration': length}}
+
+
+def format_value(value, unit=''):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{:.2f}{}'.format(value, unit)
+    return '{}{}'.format(value, unit)
+
+
+def write_report(report, basename):
+    """Writes the report as JSON and HTML (`basename` with .json and .html)."""
+
+    with open(basename + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+
+    on_path = set(report['critical_path']['nodes'])
+    rows = []
+    for p in report['nodes']:
+        cells = [html.escape(p['name']), html.escape(p['interface']),
+                 format_value(p['wall_time'], ' s'), format_value(p['cpu_time'], ' s'),
+                 format_value(p['peak_rss_gb'], ' GB'),
+                 format_value(p['bytes_read'] / 2 ** 20, ' MB'),
+                 format_value(p['bytes_written'] / 2 ** 20, ' MB')]
+        rows.append('<tr{}>{}</tr>'.format(' class="critical"' if p['name'] in on_path else '',
+                                            ''.join('<td>{}</td>'.format(c) for c in cells)))
+    headers = ['Node', 'Interface', 'Wall time', 'CPU time', 'Peak RSS', 'Read', 'Written']
+    page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Profile</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+td:first-child, td:nth-child(2) {{ text-align: left; }}
+tr.critical {{ background: #fde8c8; }}
+</style>
+</head>
+<body>
+<h1>Profile</h1>
+<p>Wall time of the run: {wall}. Sum of the node wall times: {total}.</p>
+<p>Critical path ({length}, highlighted below): {path}</p>
+<table>
+<tr>{headers}</tr>
+{rows}
+</table>
+</body>
+</html>
+""".format(wall=format_value(report['wall_time'], ' s'),
+           total=format_value(report['total_node_time'], ' s'),
+           length=format_value(report['critical_path']['duration'], ' s'),
+           path=' &rarr; '.join(html.escape(n) for n in report['critical_path']['nodes']),
+           headers=''.join('<th>{}</th>'.format(h) for h in headers),
+           rows='\n'.join(rows))
+    with open(basename + '.html', 'w') as f:
+        f.write(page)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Sharing the available threads among the MRtrix3 nodes of a workflow
+"""
+
+from nipype.interfaces.base import isdefined
+from nipype.pipeline import engine as pe
+
+
+def mapnode_width(node):
+    for field in node.iterfield:
+        value = getattr(node.inputs, field)
+        if isdefined(value):
+            return len(value)
+    return 1
+
+
+def set_thread_budget(workflow, n_procs, concurrency=1):
+    """Assigns the number of threads of every MRtrix3 node in a workflow.
+
+    Each node gets an equal share of `n_procs` among the copies of it that
+    can run at the same time (`concurrency`, times the width of a MapNode
+    when known), and requests the same number of processors from the
+    scheduler. Nodes with an explicit number of threads are left untouched.
+    """
+
+    for node in workflow._get_all_nodes():
+        if not hasattr(node.inputs, 'nthreads') or isdefined(node.inputs.nthreads):
+            continue
+        width = concurrency
+        if isinstance(node, pe.MapNode):
+            width *= mapnode_width(node)
+        nthreads = max(1, n_procs // width)
+        node.inputs.nthreads = nthreads
+        node.n_procs = nthreads
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Merging the members of an ensemble as soon as each of them is done
+"""
+
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+
+
+def merge_target(ext, **branch):
+    """Path of the merged tractogram, shared by all the appends.
+
+    The inputs of the branch (e.g. the swept parameters) are not used, but
+    make the node, and so the path, distinct for each branch of the
+    workflow.
+    """
+
+    import os
+
+    merged = os.path.abspath('merged' + ext)
+    for f in [merged, os.path.splitext(merged)[0] + '_members.txt']:
+        if os.path.exists(f):
+            os.remove(f)
+
+    return merged
+
+
+def append_member(merged, in_file, member, tag_members):
+
+    from trampolino.workflows.interfaces.nibabel.merge import append_tractogram
+
+    count = append_tractogram(merged, in_file, member, tag_members)
+
+    return in_file, count
+
+
+def finish_merge(merged, in_files, counts, tag_members):
+    """Checks the merged tractogram, merging again the members if it is out of date.
+
+    This happens when some appends were fetched from a previous execution
+    instead of being run on the current merged tractogram.
+    """
+
+    import os
+    from trampolino.workflows.interfaces.nibabel.merge import (merge_tractograms,
+                                                                tractogram_count)
+
+    if not os.path.exists(merged) or tractogram_count(merged) != sum(counts):
+        merge_tractograms(in_files, merged, tag_members)
+    if os.path.exists(merged + '.lock'):
+        os.remove(merged + '.lock')
+    members_file = os.path.splitext(merged)[0] + '_members.txt'
+
+    return merged, members_file if os.path.exists(members_file) else None
+
+
+def create_member_node(ensemble):
+    """Node iterating over the ensemble members (its iterables are set by the caller)."""
+
+    return pe.Node(
+        interface=util.IdentityInterface(fields=[ensemble, "member"]),
+        name="member")
+
+
+def connect_streaming_merge(workflow, member, source, output, outputnode, ext,
+                            tag_members=False, inputnode=None):
+    """Appends the output of each ensemble member to the merged tractogram as it finishes.
+
+    `source` runs once per ensemble member (iterating on the `member` node)
+    and its `output` is appended to a single tractogram, which is valid
+    after each append; a join node checks it once all the members are done
+    and passes it to `outputnode`. The fields of `inputnode` are connected
+    to the node creating the merged tractogram, so that it is copied (with
+    its own tractogram) for each branch of the iterables upstream.
+    """
+
+    fields = inputnode.inputs.copyable_trait_names() if inputnode is not None else []
+    target = pe.Node(name='merge_target', interface=util.Function(
+        input_names=['ext'] + fields, output_names=['merged'], function=merge_target))
+    target.inputs.ext = ext
+    if fields:
+        workflow.connect([(inputnode, target, [(f, f) for f in fields])])
+
+    append = pe.Node(name='append', interface=util.Function(
+        input_names=['merged', 'in_file', 'member', 'tag_members'],
+        output_names=['in_file', 'count'], function=append_member))
+    append.inputs.tag_members = tag_members
+
+    merge = pe.JoinNode(name='merge', joinsource=member, joinfield=['in_files', 'counts'],
+                        interface=util.Function(
+                            input_names=['merged', 'in_files', 'counts', 'tag_members'],
+                            output_names=['out_file', 'members_file'],
+                            function=finish_merge))
+    merge.inputs.tag_members = tag_members
+
+    workflow.connect([(target, append, [("merged", "merged")]),
+                      (source, append, [(output, "in_file")]),
+                      (member, append, [("member", "member")]),
+                      (target, merge, [("merged", "merged")]),
+                      (append, merge, [("in_file", "in_files"),
+                                       ("count", "counts")]),
+                      (merge, outputnode, [("out_file", "tck")])])
+    if 'members' in outputnode.inputs.copyable_trait_names():
+        workflow.connect([(merge, outputnode, [("members_file", "members")])])
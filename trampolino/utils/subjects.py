@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Collecting the input data of several subjects for batch processing
+"""
+
+import os
+import glob
+from collections import OrderedDict
+
+
+def read_subjects(filename):
+    """Reads a subject list.
+
+    Each line contains a subject identifier, the diffusion-weighted data,
+    the b-vectors, the b-values and optionally the T1-weighted data,
+    separated by commas, tabs or spaces. Empty lines and lines starting
+    with '#' are skipped; relative paths refer to the list location.
+    """
+
+    subjects = OrderedDict()
+    root = os.path.dirname(os.path.abspath(filename))
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.replace(',', ' ').split()
+            if len(fields) not in (4, 5):
+                raise ValueError('Irregular line in subject list: ' + line)
+            paths = [os.path.join(root, p) for p in fields[1:]]
+            subjects[fields[0]] = {'dwi': paths[0],
+                                   'bvecs': paths[1],
+                                   'bvals': paths[2],
+                                   'anat': paths[3] if len(paths) > 3 else None}
+
+    return subjects
+
+
+def find_bids_subjects(bids_dir):
+    """Finds the diffusion-weighted data (and T1-weighted data) in a BIDS dataset.
+
+    Every DWI run with its .bvec and .bval files becomes a subject entry,
+    identified by the run file name without the '_dwi' suffix.
+    """
+
+    subjects = OrderedDict()
+    runs = (glob.glob(os.path.join(bids_dir, 'sub-*', 'dwi', '*_dwi.nii*')) +
+            glob.glob(os.path.join(bids_dir, 'sub-*', 'ses-*', 'dwi', '*_dwi.nii*')))
+    for dwi in sorted(runs):
+        stem = dwi.split('.nii')[0]
+        if not (os.path.exists(stem + '.bvec') and os.path.exists(stem + '.bval')):
+            continue
+        subject_id = os.path.basename(stem)[:-len('_dwi')]
+        anat = glob.glob(os.path.join(os.path.dirname(os.path.dirname(dwi)),
+                                      'anat', '*_T1w.nii*'))
+        subjects[subject_id] = {'dwi': dwi,
+                                'bvecs': stem + '.bvec',
+                                'bvals': stem + '.bval',
+                                'anat': sorted(anat)[0] if anat else None}
+
+    return subjects
+
+
+def select_subject(subject_id, subjects):
+
+    files = subjects[subject_id]
+
+    return files['dwi'], files['bvecs'], files['bvals'], files['anat']
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Designing parameter sweeps over the tracking step
+"""
+
+import json
+import numpy as np
+from collections import OrderedDict
+
+
+def read_spec(filename):
+    """Reads a sweep specification from a JSON file.
+
+    The specification contains the `design` ('grid', 'random', 'lhs' or
+    'list'), the swept `parameters` (each one either a list of values or a
+    range given as {"min", "max", "step"/"type"}), the number of `samples`
+    for the random designs, the explicit `combinations` for the list design,
+    an optional `budget` (maximum number of runs) and an optional random `seed`.
+    """
+
+    with open(filename) as f:
+        spec = json.load(f, object_pairs_hook=OrderedDict)
+    design = spec.get('design', 'grid')
+    if design not in ('grid', 'random', 'lhs', 'list'):
+        raise ValueError('Unknown sweep design: ' + design)
+    if design == 'list' and 'combinations' not in spec:
+        raise ValueError('The list design requires the combinations.')
+
+    return spec
+
+
+def expand_values(values):
+    """Lists the values of a parameter, expanding the ranges."""
+
+    if not isinstance(values, dict):
+        return list(values)
+    step = values.get('step', 1)
+    expanded = np.arange(values['min'], values['max'] + step / 2, step)
+    if values.get('type', 'int' if isinstance(step, int) else 'float') == 'int':
+        return [int(round(v)) for v in expanded]
+    return [float(v) for v in expanded]
+
+
+def grid_design(parameters):
+
+    combos = [OrderedDict()]
+    for name, values in parameters.items():
+        combos = [OrderedDict(list(c.items()) + [(name, v)])
+                  for c in combos for v in expand_values(values)]
+
+    return combos
+
+
+def sample_values(values, quantiles):
+    """Maps quantiles in [0, 1) to values of a parameter."""
+
+    if not isinstance(values, dict):
+        return [values[int(q * len(values))] for q in quantiles]
+    samples = values['min'] + quantiles * (values['max'] - values['min'])
+    if values.get('type', 'float') == 'int':
+        return [int(round(v)) for v in samples]
+    return [float(v) for v in samples]
+
+
+def random_design(parameters, samples, rng):
+
+    columns = [sample_values(values, rng.random_sample(samples))
+               for values in parameters.values()]
+
+    return [OrderedDict(zip(parameters, row)) for row in zip(*columns)]
+
+
+def lhs_design(parameters, samples, rng):
+    """Latin hypercube: each parameter is sampled once in each of `samples` strata."""
+
+    columns = []
+    for values in parameters.values():
+        quantiles = (rng.permutation(samples) + rng.random_sample(samples)) / samples
+        columns.append(sample_values(values, quantiles))
+
+    return [OrderedDict(zip(parameters, row)) for row in zip(*columns)]
+
+
+def command_key(workflow, names):
+    """Returns a function mapping a combination to the command line options it sets.
+
+    The swept parameters are followed from the input node of the workflow
+    to the interfaces they feed, and rendered with the argument format of
+    the related inputs. Parameters that do not reach any interface do not
+    change the command lines and are ignored.
+    """
+
+    targets = {name: [] for name in names}
+    for u, v, d in workflow._graph.edges(data=True):
+        if u.name != 'inputnode':
+            continue
+        for src, dest in d['connect']:
+            if src in targets:
+                argstr = None
+                if hasattr(v, 'interface') and v.interface.inputs.trait(dest) is not None:
+                    argstr = v.interface.inputs.trait(dest).argstr
+                targets[src].append((v.name, dest, argstr))
+
+    def key(combo):
+        options = []
+        for name, value in combo.items():
+            for node, dest, argstr in targets.get(name, []):
+                try:
+                    rendered = argstr % value if argstr else repr(value)
+                except TypeError:
+                    rendered = repr(value)
+                options.append((node, dest, rendered))
+        return tuple(sorted(options))
+
+    return key
+
+
+def deduplicate(combos, key):
+
+    seen = set()
+    unique = []
+    for combo in combos:
+        k = key(combo)
+        if k not in seen:
+            seen.add(k)
+            unique.append(combo)
+
+    return unique
+
+
+def sweep(spec, key=None):
+    """Lists the parameter combinations to run according to a specification.
+
+    Combinations leading to the same command lines (according to `key`)
+    are run only once; when a `budget` is given and exceeded, a random
+    subset of the combinations is kept, in the original order.
+    """
+
+    rng = np.random.RandomState(spec.get('seed'))
+    design = spec.get('design', 'grid')
+    parameters = spec.get('parameters', OrderedDict())
+    if design == 'grid':
+        combos = grid_design(parameters)
+    elif design == 'random':
+        combos = random_design(parameters, int(spec['samples']), rng)
+    elif design == 'lhs':
+        combos = lhs_design(parameters, int(spec['samples']), rng)
+    else:
+        combos = [OrderedDict(c) for c in spec['combinations']]
+        if any(set(c) != set(combos[0]) for c in combos):
+            raise ValueError('All the combinations must set the same parameters.')
+
+    if key is not None:
+        combos = deduplicate(combos, key)
+
+    budget = spec.get('budget')
+    if budget is not None and len(combos) > int(budget):
+        keep = np.sort(rng.choice(len(combos), int(budget), replace=False))
+        combos = [combos[i] for i in keep]
+
+    return combos
@@ -1,13 +1,18 @@
 from nipype.interfaces import utility as util
 from nipype.pipeline import engine as pe
 from .interfaces import dsi_studio as dsi
-import nipype.interfaces.diffusion_toolkit as dtk
 from nipype.algorithms.misc import Gunzip
+from .interfaces import nibabel as nba
+from ..utils.streaming import create_member_node, connect_streaming_merge
+from ..utils.connectomes import connect_member_connectomes
 import os.path
 
 
 def create_pipeline(name="dsi_track", opt="", ensemble=""):
-    parameters = {'nos': 5000}
+    parameters = {'nos': 5000,
+                  'tag_members': 0,
+                  'stream_merge': 0,
+                  'parc': None}
 
     ensemble_dict = {'angle': 'angle_thres',
                      'min_length': 'min_length'}
@@ -26,7 +31,9 @@ def create_pipeline(name="dsi_track", opt="", ensemble=""):
             except ValueError:
                 print(o + ': irregular format, skipping')
 
-    if ensemble:
+    stream = bool(ensemble) and bool(int(parameters['stream_merge']))
+
+    if ensemble and not stream:
         tckgen = pe.MapNode(dsi.FiberTrack(),
                             name='track', iterfield=ensemble_dict[ensemble])
         gunzip = pe.MapNode(interface=Gunzip(), name="gunzip",
@@ -36,9 +43,12 @@ def create_pipeline(name="dsi_track", opt="", ensemble=""):
         gunzip = pe.Node(interface=Gunzip(), name="gunzip")
     tckgen.inputs.nos = int(parameters['nos'])
 
-    tckmerge = pe.Node(interface=dtk.TrackMerge(), name="merge")
+    tckmerge = pe.Node(interface=nba.MergeTractograms(), name="merge")
+    tckmerge.inputs.tag_members = bool(int(parameters['tag_members']))
 
     output_fields = ["tck"]
+    if parameters['parc'] is not None:
+        output_fields.append("connectomes")
     outputnode = pe.Node(
         interface=util.IdentityInterface(fields=output_fields),
         name="outputnode")
@@ -46,22 +56,36 @@ def create_pipeline(name="dsi_track", opt="", ensemble=""):
     workflow = pe.Workflow(name=name)
     workflow.base_output_dir = name
 
-    workflow.connect([(inputnode, tckgen, [("odf", "in_file"),
-                                           ("angle", "angle_thres"),
-                                           ("min_length", "min_length")]),
+    params = [("angle", "angle_thres"), ("min_length", "min_length")]
+    if stream:
+        member = create_member_node(ensemble)
+        workflow.connect([(member, tckgen, [(ensemble, ensemble_dict[ensemble])])])
+        params = [p for p in params if p[0] != ensemble]
+
+    workflow.connect([(inputnode, tckgen, [("odf", "in_file")] + params),
                       (tckgen, gunzip, [("out_file", "in_file")])])
 
     if inputnode.inputs.seed:
         workflow.connect([(inputnode, tckgen, [("seed", "seed_image")])])
 
-    if ensemble:
+    if stream:
+        connect_streaming_merge(workflow, member, gunzip, "out_file", outputnode,
+                                '.trk', tckmerge.inputs.tag_members,
+                                inputnode)
+    elif ensemble:
         workflow.connect([
-            (gunzip, tckmerge, [("out_file", "track_files")]),
-            (tckmerge, outputnode, [("track_file", "tck")])
+            (gunzip, tckmerge, [("out_file", "in_files")]),
+            (tckmerge, outputnode, [("out_file", "tck")])
         ])
     else:
         workflow.connect([(gunzip, outputnode, [("out_file", "tck")])])
 
+    # a connectome for each member, as soon as its tractogram is done
+    if parameters['parc'] is not None:
+        connect_member_connectomes(workflow, gunzip, "out_file", outputnode,
+                                   os.path.abspath(parameters['parc']),
+                                   member if stream else None, ensemble, inputnode)
+
     return workflow
 
 
@@ -1,6 +1,7 @@
 from nipype.interfaces import utility as util
 from nipype.pipeline import engine as pe
 from .interfaces import diffusion_toolkit as dtk
+from ..utils.cache import CachedNode
 import os.path
 
 
@@ -21,7 +22,7 @@ def create_pipeline(name="dtirecon", opt=""):
             except ValueError:
                 print(o+': irregular format, skipping')
 
-    dtirec = pe.Node(dtk.DTIRecon(), name='tensorfit')
+    dtirec = CachedNode(dtk.DTIRecon(), name='tensorfit')
     if parameters['b0_threshold']:
         dtirec.inputs.b0_threshold = parameters['b0_threshold']
 
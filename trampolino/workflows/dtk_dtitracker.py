@@ -1,13 +1,19 @@
 from nipype.interfaces import utility as util
 from nipype.pipeline import engine as pe
 from .interfaces import diffusion_toolkit as dtk
+from .interfaces import nibabel as nba
+from ..utils.streaming import create_member_node, connect_streaming_merge
+from ..utils.connectomes import connect_member_connectomes
 import os.path
 
 
 def create_pipeline(name="dtitracker", opt="", ensemble=""):
 
     parameters = {'mask2': None,
-                  'mask2_thr': None}
+                  'mask2_thr': None,
+                  'tag_members': 0,
+                  'stream_merge': 0,
+                  'parc': None}
 
     ensemble_dict = {'angle': 'angle_threshold'}
 
@@ -26,16 +32,21 @@ def create_pipeline(name="dtitracker", opt="", ensemble=""):
                 print(o+': irregular format, skipping')
 
 
-    if ensemble:
+    stream = bool(ensemble) and bool(int(parameters['stream_merge']))
+
+    if ensemble and not stream:
         tckgen = pe.MapNode(dtk.DTITracker(),
                          name='track', iterfield=ensemble_dict[ensemble])
     else:
         tckgen = pe.Node(dtk.DTITracker(), name='track')
     tckgen.inputs.mask1_threshold = 0.1
 
-    tckmerge = pe.Node(interface=dtk.TrackMerge(), name="merge")
+    tckmerge = pe.Node(interface=nba.MergeTractograms(), name="merge")
+    tckmerge.inputs.tag_members = bool(int(parameters['tag_members']))
 
     output_fields = ["tck"]
+    if parameters['parc'] is not None:
+        output_fields.append("connectomes")
     outputnode = pe.Node(
         interface=util.IdentityInterface(fields=output_fields),
         name="outputnode")
@@ -43,18 +54,33 @@ def create_pipeline(name="dtitracker", opt="", ensemble=""):
     workflow = pe.Workflow(name=name)
     workflow.base_output_dir = name
 
+    params = [("angle", "angle_threshold")]
+    if stream:
+        member = create_member_node(ensemble)
+        workflow.connect([(member, tckgen, [(ensemble, ensemble_dict[ensemble])])])
+        params = [p for p in params if p[0] != ensemble]
+
     workflow.connect([(inputnode, tckgen, [("odf", "tensor_file"),
-                                           ("seed", "mask1_file"),
-                                           ("angle", "angle_threshold")])])
+                                           ("seed", "mask1_file")] + params)])
 
-    if ensemble:
+    if stream:
+        connect_streaming_merge(workflow, member, tckgen, "track_file", outputnode,
+                                '.trk', tckmerge.inputs.tag_members,
+                                inputnode)
+    elif ensemble:
         workflow.connect([
-            (tckgen, tckmerge, [("track_file", "track_files")]),
-            (tckmerge, outputnode, [("track_file", "tck")])
+            (tckgen, tckmerge, [("track_file", "in_files")]),
+            (tckmerge, outputnode, [("out_file", "tck")])
         ])
     else:
         workflow.connect([(tckgen, outputnode, [("track_file", "tck")])])
 
+    # a connectome for each member, as soon as its tractogram is done
+    if parameters['parc'] is not None:
+        connect_member_connectomes(workflow, tckgen, "track_file", outputnode,
+                                   os.path.abspath(parameters['parc']),
+                                   member if stream else None, ensemble, inputnode)
+
     return workflow
 
 
@@ -49,7 +49,13 @@ class FiberTrack(CommandLine):
     input_spec = FiberTrackInputSpec
     output_spec = FiberTrackOutputSpec
 
+    def _format_arg(self, name, trait_spec, value):
+        # the output is written in the working directory, not next to the source
+        if name == 'out_file':
+            value = os.path.abspath(value)
+        return super(FiberTrack, self)._format_arg(name, trait_spec, value)
+
     def _list_outputs(self):
         outputs = self.output_spec().get()
-        outputs['out_file'] = os.path.join(os.path.dirname(self.inputs.in_file), self.inputs.out_file)
+        outputs['out_file'] = os.path.abspath(self.inputs.out_file)
         return outputs
@@ -6,7 +6,7 @@ from __future__ import (print_function, division, unicode_literals,
 
 import os.path as op
 
-from nipype.interfaces.base import traits, TraitedSpec, File
+from nipype.interfaces.base import traits, TraitedSpec, File, isdefined
 from .base import MRTrix3BaseInputSpec, MRTrix3Base
 
 
@@ -219,6 +219,9 @@ class TractographyInputSpec(MRTrix3BaseInputSpec):
         argstr='-output_seeds %s',
         desc=('output the seed location of all successful streamlines to'
               ' a file'))
+    rng_seed = traits.Int(
+        desc=('seed of the random number generator (set through the '
+              'MRTRIX_RNG_SEED environment variable)'))
 
 
 class TractographyOutputSpec(TraitedSpec):
@@ -286,6 +289,11 @@ class Tractography(MRTrix3Base):
 
         return super(Tractography, self)._format_arg(name, trait_spec, value)
 
+    def _run_interface(self, runtime):
+        if isdefined(self.inputs.rng_seed):
+            runtime.environ['MRTRIX_RNG_SEED'] = str(self.inputs.rng_seed)
+        return super(Tractography, self)._run_interface(runtime)
+
     def _list_outputs(self):
         outputs = self.output_spec().get()
         outputs['out_file'] = op.abspath(self.inputs.out_file)
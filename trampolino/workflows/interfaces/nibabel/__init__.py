@@ -1,3 +1,12 @@
 from __future__ import absolute_import
 
-from .conversion import Tck2Trk, Trk2Tck
+from .conversion import Tck2Trk, Trk2Tck, Tck2Tcz, Tcz2Tck
+from .merge import MergeTractograms
+from .index import SampleTractogram
+from .spatial import QueryTractogram
+from .metrics import FilterStreamlines
+from .resample import ResampleStreamlines
+from .sift import EstimateWeights
+from .tdi import TrackDensity
+from .connectome import ComputeConnectome
+from .endpoints import ExtractEndpoints
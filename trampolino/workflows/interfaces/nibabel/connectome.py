@@ -0,0 +1,165 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from .geometry import transform_points
+from .index import StreamlineIndex, index_path
+from .endpoints import arc_length, find_endpoints, load_endpoints
+from .mif import load_image
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def assign_labels(endpoints, labels, affine):
+    """Label of the voxel of each endpoint (0 outside of the parcellation)."""
+
+    vox = np.rint(transform_points(endpoints.reshape(-1, 3), np.linalg.inv(affine),
+                                   dtype=np.float64)).astype(np.int64)
+    inside = np.all((vox >= 0) & (vox < labels.shape), axis=1)
+    assigned = np.zeros(len(vox), dtype=np.int64)
+    assigned[inside] = labels[tuple(vox[inside].T)]
+    return assigned.reshape(-1, 2)
+
+
+def accumulate(matrix, nodes, values=None):
+    """Adds the values of the edges between the pairs of nodes to a symmetric matrix."""
+
+    a, b = nodes[:, 0], nodes[:, 1]
+    values = np.ones(len(a)) if values is None else values
+    np.add.at(matrix, (a, b), values)
+    off = a != b
+    np.add.at(matrix, (b[off], a[off]), values[off])
+
+
+def build_connectome(filename, labels, affine, weights=None, chunk_size=100000,
+                     lengths=None, index_file=None, endpoints_file=None):
+    """Builds the structural connectome of a tractogram, given a parcellation.
+
+    The endpoints and the lengths of the streamlines are read from their
+    sidecar (`endpoints_file`, or the one next to the tractogram if up to
+    date) when present; otherwise, only the endpoints of the streamlines are
+    read (through the random-access index), unless `lengths` is True. By
+    default, the mean lengths are computed only if given by the sidecar.
+    Each endpoint takes the label of its voxel (0, not part of the
+    connectome, outside of the parcellation). Returns the count, the mean
+    length and the sum of the weights of the streamlines between each pair
+    of regions (labels from 1), and the pair of labels of each streamline.
+    """
+
+    labels = np.asarray(labels).astype(np.int64)
+    nb_regions = int(labels.max())
+    endpoints_file = endpoints_file or find_endpoints(filename)
+    if lengths is None:
+        lengths = bool(endpoints_file)
+    if endpoints_file:
+        sidecar = load_endpoints(endpoints_file)
+        nb_streamlines = len(sidecar)
+    else:
+        index = StreamlineIndex(filename, index_file)
+        nb_streamlines = len(index)
+    shape = (nb_regions + 1, nb_regions + 1)
+    count, total_length, total_weight = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    assignments = []
+    for start in range(0, nb_streamlines, chunk_size):
+        ids = np.arange(start, min(start + chunk_size, nb_streamlines))
+        if endpoints_file:
+            endpoints = sidecar['endpoints'][ids]
+            mm = sidecar['length'][ids]
+        elif lengths:
+            points, point_counts = index.select(ids)
+            starts = np.cumsum(point_counts) - point_counts
+            endpoints = points[np.stack([starts, starts + point_counts - 1], axis=1)]
+            mm = arc_length(points, point_counts)
+        else:
+            endpoints = index.endpoints(ids)
+        nodes = assign_labels(endpoints, labels, affine)
+        assignments.append(nodes)
+        accumulate(count, nodes)
+        if lengths:
+            accumulate(total_length, nodes, mm)
+        if weights is not None:
+            accumulate(total_weight, nodes, weights[ids])
+
+    connectome = {'count': count[1:, 1:]}
+    if lengths:
+        connectome['length'] = np.divide(total_length, count, out=np.zeros(shape),
+                                         where=count > 0)[1:, 1:]
+    if weights is not None:
+        connectome['weight'] = total_weight[1:, 1:]
+    connectome['assignments'] = (np.concatenate(assignments) if assignments
+                                 else np.zeros((0, 2), dtype=np.int64))
+    return connectome
+
+
+class ComputeConnectomeInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    in_parc = File(
+        exists=True,
+        mandatory=True,
+        desc="Parcellation (.mif or NIfTI), with the regions labelled from 1"
+    )
+    weights = File(
+        exists=True,
+        desc="Weight of each streamline (text file, e.g. from SIFT2)"
+    )
+    endpoints = File(
+        exists=True,
+        desc="Endpoints sidecar of the tractogram (by default, the one next to it if present)"
+    )
+    lengths = traits.Bool(
+        desc="Compute the mean length of the streamlines of each edge; by "
+             "default, only if the lengths are in the endpoints sidecar (otherwise "
+             "only the endpoints are read)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    out_file = File(
+        'connectome.npz',
+        usedefault=True,
+        desc="Output matrices (count, length, weight) and assignments"
+    )
+
+
+class ComputeConnectomeOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+
+
+class ComputeConnectome(BaseInterface):
+    input_spec = ComputeConnectomeInputSpec
+    output_spec = ComputeConnectomeOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        labels, affine = load_image(self.inputs.in_parc)
+        weights = None
+        if isdefined(self.inputs.weights):
+            weights = np.loadtxt(self.inputs.weights, ndmin=1)
+        index_file = os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+        endpoints_file = None
+        if isdefined(self.inputs.endpoints):
+            endpoints_file = self.inputs.endpoints
+        lengths = None
+        if isdefined(self.inputs.lengths):
+            lengths = self.inputs.lengths
+        connectome = build_connectome(self.inputs.in_file, labels, affine, weights,
+                                      self.inputs.chunk_size, lengths,
+                                      index_file, endpoints_file)
+        np.savez_compressed(os.path.abspath(self.inputs.out_file), **connectome)
+        iflogger.info('Built a connectome of %d regions from %d streamlines in %.2f s',
+                      len(connectome['count']), len(connectome['assignments']),
+                      time.time() - start)
+
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = os.path.abspath(self.inputs.out_file)
+        return outputs
@@ -1,7 +1,113 @@
-from nipype.interfaces.base import (TraitedSpec, BaseInterface, File,
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
                                     BaseInterfaceInputSpec)
+from nipype import logging
+from .tck import TckReader, TckWriter
+from .trk import TrkReader, TrkWriter
+from .tcz import TczReader, TczWriter
+import numpy as np
 import nibabel as nib
 import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def tck2trk(in_file, ref, out_file, chunk_size=0, dtype=np.float32):
+    """Converts a .tck file to .trk, given a reference volume.
+
+    Returns the number of converted streamlines and points.
+    """
+
+    from nibabel.streamlines import Field
+    from nibabel.orientations import aff2axcodes
+
+    nii = nib.load(ref)
+
+    header = {}
+    header[Field.VOXEL_TO_RASMM] = nii.affine.copy()
+    header[Field.VOXEL_SIZES] = nii.header.get_zooms()[:3]
+    header[Field.DIMENSIONS] = nii.shape[:3]
+    header[Field.VOXEL_ORDER] = "".join(aff2axcodes(nii.affine))
+
+    tck = TckReader(in_file)
+    chunk_size = chunk_size or max(tck.nb_streamlines, 1)
+    with TrkWriter(out_file, header, dtype) as trk:
+        # chunks are copies of the mapped data, so they can be transformed in place
+        for points, lengths in tck.iter_chunks(chunk_size):
+            trk.append(points, lengths, inplace=True)
+
+    return tck.nb_streamlines, tck.nb_points
+
+
+def trk2tck(in_file, out_file, chunk_size=0):
+    """Converts a .trk file to .tck.
+
+    Returns the number of converted streamlines and points.
+    """
+
+    trk = TrkReader(in_file)
+    chunk_size = chunk_size or max(trk.nb_streamlines, 1)
+    with TckWriter(out_file) as tck:
+        for points, lengths in trk.iter_chunks(chunk_size):
+            tck.append(points, lengths)
+
+    return trk.nb_streamlines, trk.nb_points
+
+
+def compress(in_file, out_file, precision=0.01, block_size=10000, chunk_size=0):
+    """Converts a .tck or .trk file to the compressed .tcz format.
+
+    Returns the number of converted streamlines and points.
+    """
+
+    reader = TckReader(in_file) if in_file.endswith('.tck') else TrkReader(in_file)
+    chunk_size = chunk_size or max(reader.nb_streamlines, 1)
+    with TczWriter(out_file, precision, block_size) as tcz:
+        for points, lengths in reader.iter_chunks(chunk_size):
+            tcz.append(points, lengths)
+
+    return reader.nb_streamlines, reader.nb_points
+
+
+def decompress(in_file, out_file):
+    """Converts a .tcz file to .tck, one block at a time.
+
+    Returns the number of converted streamlines and points.
+    """
+
+    tcz = TczReader(in_file)
+    with TckWriter(out_file) as tck:
+        for points, lengths in tcz.iter_chunks():
+            tck.append(points, lengths)
+
+    return tcz.nb_streamlines, tcz.nb_points
+
+
+def convert_file(in_file, out_file, ref=None, chunk_size=0, single_precision=True,
+                 precision=0.01):
+    """Converts a tractogram according to the extensions, timing the conversion."""
+
+    start = time.time()
+    if in_file.endswith('.tck') and out_file.endswith('.trk'):
+        dtype = np.float32 if single_precision else np.float64
+        nb_streamlines, nb_points = tck2trk(in_file, ref, out_file, chunk_size, dtype)
+    elif in_file.endswith('.trk') and out_file.endswith('.tck'):
+        nb_streamlines, nb_points = trk2tck(in_file, out_file, chunk_size)
+    elif in_file.endswith(('.tck', '.trk')) and out_file.endswith('.tcz'):
+        nb_streamlines, nb_points = compress(in_file, out_file, precision,
+                                             chunk_size=chunk_size)
+    elif in_file.endswith('.tcz') and out_file.endswith('.tck'):
+        nb_streamlines, nb_points = decompress(in_file, out_file)
+    else:
+        raise ValueError('Unsupported conversion: {} to {}'.format(in_file, out_file))
+
+    return {'in_file': in_file,
+            'out_file': out_file,
+            'streamlines': nb_streamlines,
+            'points': nb_points,
+            'bytes': os.path.getsize(in_file),
+            'out_bytes': os.path.getsize(out_file),
+            'seconds': time.time() - start}
+
 
 class Tck2TrkInputSpec(BaseInterfaceInputSpec):
     input_tck = File(
@@ -21,6 +127,19 @@ class Tck2TrkInputSpec(BaseInterfaceInputSpec):
             "Output file in .trk"
         )
     )
+    chunk_size = traits.Int(
+        0,
+        usedefault=True,
+        desc=(
+            "Number of streamlines converted at a time; if zero, "
+            "the whole tractogram is loaded in memory"
+        )
+    )
+    single_precision = traits.Bool(
+        True,
+        usedefault=True,
+        desc="Apply the affine transform in single precision"
+    )
 
 
 class Tck2TrkOutputSpec(TraitedSpec):
@@ -32,28 +151,17 @@ class Tck2Trk(BaseInterface):
     output_spec = Tck2TrkOutputSpec
 
     def _run_interface(self, runtime):
-        from nibabel.streamlines import Field
-        from nibabel.orientations import aff2axcodes
-
-        tck = nib.streamlines.load(self.inputs.input_tck)
-
-        nii = nib.load(self.inputs.input_ref)
-
-        header = {}
-        header[Field.VOXEL_TO_RASMM] = nii.affine.copy()
-        header[Field.VOXEL_SIZES] = nii.header.get_zooms()[:3]
-        header[Field.DIMENSIONS] = nii.shape[:3]
-        header[Field.VOXEL_ORDER] = "".join(aff2axcodes(nii.affine))
-
-        self._tractogram = tck.tractogram
-        self._header = header
+        stats = convert_file(self.inputs.input_tck, os.path.abspath(self.inputs.output_trk),
+                             self.inputs.input_ref, self.inputs.chunk_size,
+                             self.inputs.single_precision)
+        iflogger.info('Converted %d points in %.2f s (%.0f points/s)', stats['points'],
+                      stats['seconds'], stats['points'] / max(stats['seconds'], 1e-9))
 
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs['output_trk'] = os.path.abspath(self.inputs.output_trk)
-        nib.streamlines.save(self._tractogram, outputs['output_trk'], header=self._header)
         return outputs
 
 
@@ -70,6 +178,14 @@ class Trk2TckInputSpec(BaseInterfaceInputSpec):
             "Output file in .tck"
         )
     )
+    chunk_size = traits.Int(
+        0,
+        usedefault=True,
+        desc=(
+            "Number of streamlines converted at a time; if zero, "
+            "the whole tractogram is loaded in memory"
+        )
+    )
 
 
 class Trk2TckOutputSpec(TraitedSpec):
@@ -81,14 +197,101 @@ class Trk2Tck(BaseInterface):
     output_spec = Trk2TckOutputSpec
 
     def _run_interface(self, runtime):
-        trk = nib.streamlines.load(self.inputs.input_trk)
+        stats = convert_file(self.inputs.input_trk, os.path.abspath(self.inputs.output_tck),
+                             chunk_size=self.inputs.chunk_size)
+        iflogger.info('Converted %d points in %.2f s (%.0f points/s)', stats['points'],
+                      stats['seconds'], stats['points'] / max(stats['seconds'], 1e-9))
 
-        self._tractogram = trk.tractogram
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['output_tck'] = os.path.abspath(self.inputs.output_tck)
+        return outputs
+
+
+class Tck2TczInputSpec(BaseInterfaceInputSpec):
+    input_tck = File(
+        exists=True,
+        mandatory=True,
+        desc="Input file in .tck (or .trk)"
+    )
+    output_tcz = File(
+        'track.tcz',
+        usedefault=True,
+        desc=(
+            "Output file in .tcz"
+        )
+    )
+    precision = traits.Float(
+        0.01,
+        usedefault=True,
+        desc="Precision of the quantized coordinates (in mm)"
+    )
+    chunk_size = traits.Int(
+        0,
+        usedefault=True,
+        desc=(
+            "Number of streamlines read at a time; if zero, "
+            "the whole tractogram is loaded in memory"
+        )
+    )
+
+
+class Tck2TczOutputSpec(TraitedSpec):
+    output_tcz = File(exists=True)
+
+
+class Tck2Tcz(BaseInterface):
+    input_spec = Tck2TczInputSpec
+    output_spec = Tck2TczOutputSpec
+
+    def _run_interface(self, runtime):
+        stats = convert_file(self.inputs.input_tck, os.path.abspath(self.inputs.output_tcz),
+                             chunk_size=self.inputs.chunk_size,
+                             precision=self.inputs.precision)
+        iflogger.info('Compressed %d points in %.2f s, from %d to %d bytes (%.1fx)',
+                      stats['points'], stats['seconds'], stats['bytes'], stats['out_bytes'],
+                      stats['bytes'] / max(stats['out_bytes'], 1))
+
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['output_tcz'] = os.path.abspath(self.inputs.output_tcz)
+        return outputs
+
+
+class Tcz2TckInputSpec(BaseInterfaceInputSpec):
+    input_tcz = File(
+        exists=True,
+        mandatory=True,
+        desc="Input file in .tcz"
+    )
+    output_tck = File(
+        'track.tck',
+        usedefault=True,
+        desc=(
+            "Output file in .tck"
+        )
+    )
+
+
+class Tcz2TckOutputSpec(TraitedSpec):
+    output_tck = File(exists=True)
+
+
+class Tcz2Tck(BaseInterface):
+    input_spec = Tcz2TckInputSpec
+    output_spec = Tcz2TckOutputSpec
+
+    def _run_interface(self, runtime):
+        stats = convert_file(self.inputs.input_tcz, os.path.abspath(self.inputs.output_tck))
+        iflogger.info('Decompressed %d points in %.2f s', stats['points'], stats['seconds'])
 
         return runtime
 
     def _list_outputs(self):
         outputs = self._outputs().get()
         outputs['output_tck'] = os.path.abspath(self.inputs.output_tck)
-        nib.streamlines.save(self._tractogram, outputs['output_tck'])
         return outputs
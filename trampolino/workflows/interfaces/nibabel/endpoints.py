@@ -0,0 +1,112 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from .index import StreamlineIndex, index_path
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+# first and last point (RAS+ mm) of each streamline and its length (in mm)
+ENDPOINTS_DTYPE = np.dtype([('endpoints', '<f4', (2, 3)), ('length', '<f4')])
+
+
+def arc_length(points, lengths):
+    """Length (in mm) of each streamline of a chunk."""
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1) * (owner[1:] == owner[:-1])
+    return np.bincount(owner[1:], weights=steps, minlength=len(lengths))
+
+
+def endpoints_path(filename):
+    """Path of the endpoints sidecar of a tractogram (keeping its extension)."""
+
+    return filename + '_endpoints.npy'
+
+
+def extract_endpoints(filename, out_file=None, chunk_size=100000, index_file=None):
+    """Writes the endpoints and the length of the streamlines of a tractogram.
+
+    The streamlines are read once, chunk by chunk, and the sidecar (see
+    `ENDPOINTS_DTYPE`) is written as a memory-mapped .npy array, by default
+    next to the tractogram. Returns the number of streamlines.
+    """
+
+    index = StreamlineIndex(filename, index_file)
+    sidecar = np.lib.format.open_memmap(out_file or endpoints_path(filename), mode='w+',
+                                        dtype=ENDPOINTS_DTYPE, shape=(len(index),))
+    for start in range(0, len(index), chunk_size):
+        stop = min(start + chunk_size, len(index))
+        points, lengths = index.range(start, stop)
+        starts = np.cumsum(lengths) - lengths
+        sidecar['endpoints'][start:stop] = points[np.stack([starts, starts + lengths - 1], axis=1)]
+        sidecar['length'][start:stop] = arc_length(points, lengths)
+    sidecar.flush()
+
+    return len(index)
+
+
+def find_endpoints(filename, sidecar=None):
+    """Path of the endpoints sidecar of a tractogram, if present and up to date."""
+
+    sidecar = sidecar or endpoints_path(filename)
+    if (os.path.exists(sidecar) and
+            os.path.getmtime(sidecar) >= os.path.getmtime(filename)):
+        return sidecar
+    return None
+
+
+def load_endpoints(sidecar):
+    """Loads an endpoints sidecar (memory-mapped)."""
+
+    endpoints = np.load(sidecar, mmap_mode='r')
+    if endpoints.dtype != ENDPOINTS_DTYPE:
+        raise ValueError(sidecar + ' is not a valid endpoints sidecar')
+    return endpoints
+
+
+class ExtractEndpointsInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    out_file = File(
+        desc="Output sidecar (by default, the name of the input followed by '_endpoints.npy')"
+    )
+
+
+class ExtractEndpointsOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+
+
+class ExtractEndpoints(BaseInterface):
+    input_spec = ExtractEndpointsInputSpec
+    output_spec = ExtractEndpointsOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        index_file = os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+        nb_streamlines = extract_endpoints(self.inputs.in_file, self._out_file(),
+                                           self.inputs.chunk_size, index_file)
+        iflogger.info('Extracted the endpoints of %d streamlines in %.2f s',
+                      nb_streamlines, time.time() - start)
+
+        return runtime
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath(endpoints_path(os.path.basename(self.inputs.in_file)))
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        return outputs
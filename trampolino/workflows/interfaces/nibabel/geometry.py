@@ -0,0 +1,27 @@
+import numpy as np
+
+
+def transform_points(points, affine, out=None, dtype=np.float32, block_size=2**20):
+    """Applies an affine transform to an (N, 3) array of points.
+
+    The points are transformed with one matrix product per block of rows,
+    so that the temporary memory is bounded by the block size. Passing the
+    input array as `out` transforms the points in place.
+    """
+
+    affine = np.asarray(affine, dtype=dtype)
+    rotation = affine[:3, :3].T.copy()
+    translation = affine[:3, 3]
+
+    if out is None:
+        out = np.empty(points.shape, dtype=dtype)
+    buffer = np.empty((min(block_size, len(points)), 3), dtype=dtype)
+
+    for start in range(0, len(points), block_size):
+        block = np.asarray(points[start:start + block_size], dtype=dtype)
+        result = buffer[:len(block)]
+        np.dot(block, rotation, out=result)
+        result += translation
+        out[start:start + len(block)] = result
+
+    return out
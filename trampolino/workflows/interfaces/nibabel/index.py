@@ -0,0 +1,252 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from nibabel.streamlines import Field
+from nibabel.streamlines.trk import get_affine_rasmm_to_trackvis
+from .geometry import transform_points
+from .tck import read_header as read_tck_header, TckReader, TckWriter
+from .trk import read_header as read_trk_header, TrkReader, TrkWriter
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+# byte offset of the first point of each streamline and its number of points
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4')])
+
+# format of the indexed tractogram, stored in the first record of the index
+INDEX_FORMATS = {'.tck': 1, '.trk': 2}
+
+
+def open_reader(filename):
+    """Memory-mapped reader of a .tck or .trk file."""
+
+    if filename.endswith('.tck'):
+        return TckReader(filename)
+    elif filename.endswith('.trk'):
+        return TrkReader(filename)
+    raise ValueError('Unsupported tractogram format: ' + filename)
+
+
+def open_writer(out_file, header):
+    """Writer of a .tck or .trk file, given the header of the input tractogram.
+
+    A .trk output requires the header of a .trk input (for its space). Only
+    the points are written, so the scalars and properties of the input are
+    not declared in the output header.
+    """
+
+    if out_file.endswith('.tck'):
+        return TckWriter(out_file, header if isinstance(header, dict) else None)
+    elif isinstance(header, dict):
+        raise ValueError('A .trk output requires a .trk input')
+    fields = {k: header[k] for k in header.dtype.names
+              if k not in (Field.NB_SCALARS_PER_POINT, Field.NB_PROPERTIES_PER_STREAMLINE,
+                           'scalar_name', 'property_name')}
+    return TrkWriter(out_file, fields)
+
+
+def index_path(filename):
+    """Path of the index of a tractogram (the extension is kept, so that a
+    .tck and a .trk of the same name have their own index)."""
+
+    return filename + '_index.npy'
+
+
+def header_count(filename):
+    """Number of streamlines declared in the header of a tractogram (0 if unknown)."""
+
+    if filename.endswith('.tck'):
+        count = read_tck_header(filename)[0].get('count', '0')
+        return int(count) if count.isdigit() else 0
+    return int(read_trk_header(filename)[Field.NB_STREAMLINES])
+
+
+def build_index(filename, index_file=None):
+    """Scans a .tck or .trk file once and writes the index of its streamlines.
+
+    The index is saved as a .npy array (see `INDEX_DTYPE`), by default next
+    to the tractogram; if it cannot be written, it is only returned. The
+    first record of the saved array holds the size (in bytes) and the
+    format of the tractogram, the others the streamlines.
+    """
+
+    reader = open_reader(filename)
+    if filename.endswith('.tck'):
+        base = read_tck_header(filename)[1]
+        offsets = base + reader.offsets * 3 * reader.dtype.itemsize
+    else:
+        offsets = reader.header.dtype.itemsize + (reader.starts + 1) * 4
+
+    index = np.empty(reader.nb_streamlines + 1, dtype=INDEX_DTYPE)
+    index[0] = (os.path.getsize(filename), INDEX_FORMATS[os.path.splitext(filename)[1]])
+    index['offset'][1:] = offsets
+    index['length'][1:] = reader.lengths
+    try:
+        np.save(index_file or index_path(filename), index)
+    except OSError:
+        iflogger.warning('Could not write the index of %s', filename)
+
+    return index[1:]
+
+
+def load_index(filename, index_file=None):
+    """Loads the index of a tractogram (memory-mapped), building it if missing or outdated.
+
+    An index is reused only if it is newer than the tractogram and matches
+    its format, its size and (if declared in the header) its number of
+    streamlines.
+    """
+
+    index_file = index_file or index_path(filename)
+    if (os.path.exists(index_file) and
+            os.path.getmtime(index_file) >= os.path.getmtime(filename)):
+        index = np.load(index_file, mmap_mode='r')
+        count = header_count(filename)
+        if (index.dtype == INDEX_DTYPE and len(index) and
+                index[0]['offset'] == os.path.getsize(filename) and
+                index[0]['length'] == INDEX_FORMATS[os.path.splitext(filename)[1]] and
+                count in (0, len(index) - 1)):
+            return index[1:]
+        iflogger.info('The index %s does not match %s, building it again',
+                      index_file, filename)
+    return build_index(filename, index_file)
+
+
+class StreamlineIndex(object):
+    """Random access to the streamlines of a .tck or .trk file.
+
+    The file is memory-mapped and the index gives where each streamline
+    starts, so that any subset is read with a single gather of its points,
+    without scanning the file. Points are returned in RAS+ mm.
+    """
+
+    def __init__(self, filename, index_file=None):
+        self.filename = filename
+        self.index = load_index(filename, index_file)
+        if filename.endswith('.tck'):
+            self.header, base, dtype = read_tck_header(filename)
+            self.stride = 3
+            self.affine = None
+        else:
+            self.header = read_trk_header(filename)
+            base = self.header.dtype.itemsize
+            dtype = np.dtype(self.header.dtype['hdr_size'].str.replace('i', 'f'))
+            self.stride = 3 + int(self.header[Field.NB_SCALARS_PER_POINT])
+            self.affine = np.linalg.inv(get_affine_rasmm_to_trackvis(self.header))
+        self.base = base
+        self.dtype = dtype
+        self.data = np.memmap(filename, dtype=dtype, mode='r', offset=base)
+
+    @property
+    def lengths(self):
+        return self.index['length'].astype(np.int64)
+
+    @property
+    def nb_streamlines(self):
+        return len(self.index)
+
+    def __len__(self):
+        return self.nb_streamlines
+
+    def __getitem__(self, i):
+        return self.select([i])[0]
+
+    def select(self, ids):
+        """Returns the points and lengths of the given streamlines, in that order."""
+
+        ids = np.asarray(ids, dtype=np.int64)
+        lengths = self.index['length'][ids].astype(np.int64)
+        first = (self.index['offset'][ids].astype(np.int64) - self.base) // self.dtype.itemsize
+        # position of the first coordinate of each point
+        rank = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = np.repeat(first, lengths) + rank * self.stride
+        points = self.data[rows[:, None] + np.arange(3)].astype(np.float32)
+        if self.affine is not None:
+            points = transform_points(points, self.affine, out=points)
+        return points, lengths
+
+    def endpoints(self, ids):
+        """Returns the first and last point of the given streamlines, as an (N, 2, 3) array."""
+
+        ids = np.asarray(ids, dtype=np.int64)
+        lengths = self.index['length'][ids].astype(np.int64)
+        first = (self.index['offset'][ids].astype(np.int64) - self.base) // self.dtype.itemsize
+        rows = np.stack([first, first + (np.maximum(lengths, 1) - 1) * self.stride], axis=1)
+        points = self.data[rows.reshape(-1, 1) + np.arange(3)].astype(np.float32)
+        if self.affine is not None:
+            points = transform_points(points, self.affine, out=points)
+        return points.reshape(-1, 2, 3)
+
+    def range(self, start, stop):
+        return self.select(np.arange(start, min(stop, self.nb_streamlines)))
+
+    def sample(self, n, seed=None):
+        """Returns a random sample of `n` streamlines (kept in file order) and their ids."""
+
+        rng = np.random.RandomState(seed)
+        ids = np.sort(rng.choice(self.nb_streamlines, min(n, self.nb_streamlines),
+                                 replace=False))
+        points, lengths = self.select(ids)
+        return points, lengths, ids
+
+    def save(self, out_file, ids, chunk_size=100000):
+        """Writes the given streamlines, in chunks, in the format of `out_file`."""
+
+        with open_writer(out_file, self.header) as writer:
+            for start in range(0, len(ids), chunk_size):
+                writer.append(*self.select(ids[start:start + chunk_size]))
+
+
+class SampleTractogramInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    nb_streamlines = traits.Int(
+        10000,
+        usedefault=True,
+        desc="Number of streamlines to sample"
+    )
+    seed = traits.Int(
+        desc="Seed of the random sample"
+    )
+    out_file = File(
+        desc="Output tractogram (by default, 'sample' with the format of the input)"
+    )
+
+
+class SampleTractogramOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+    index_file = File(desc="Index of the input streamlines")
+
+
+class SampleTractogram(BaseInterface):
+    input_spec = SampleTractogramInputSpec
+    output_spec = SampleTractogramOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        index = StreamlineIndex(self.inputs.in_file, self._index_file())
+        seed = self.inputs.seed if isdefined(self.inputs.seed) else None
+        _, _, ids = index.sample(self.inputs.nb_streamlines, seed)
+        index.save(self._out_file(), ids)
+        iflogger.info('Sampled %d of %d streamlines in %.2f s',
+                      len(ids), len(index), time.time() - start)
+
+        return runtime
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath('sample' + os.path.splitext(self.inputs.in_file)[1])
+
+    def _index_file(self):
+        return os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        outputs['index_file'] = self._index_file()
+        return outputs
@@ -0,0 +1,333 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, InputMultiPath,
+                                    isdefined)
+from nipype import logging
+from nibabel.streamlines import Field
+from nibabel.streamlines.trk import header_2_dtype
+from .tck import read_header as read_tck_header, format_header, TckReader
+from .trk import read_header as read_trk_header, record_ends
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def tck_extent(filename, header, offset, dtype):
+    """Returns the streamline count of a .tck file and the end of its data (in bytes).
+
+    The count is taken from the header and the data is expected to end with
+    the terminator; otherwise, the delimiters are scanned.
+    """
+
+    size = os.path.getsize(filename)
+    triplet = 3 * dtype.itemsize
+    if 'count' in header and size >= offset + triplet:
+        last = np.fromfile(filename, dtype=dtype, count=3, offset=size - triplet)
+        if np.isinf(last).all():
+            return int(header['count']), size - triplet
+    tck = TckReader(filename)
+    return tck.nb_streamlines, offset + tck.end * triplet
+
+
+class TckAppender(object):
+    """Appends the streamlines of .tck files to a new .tck file.
+
+    The point data of each input is copied as raw blocks of bytes (converted
+    only if the data types differ) and the counts in the header are updated
+    in place, so that the output is a valid tractogram after each append.
+    If `members_file` is given, the member index of every streamline is
+    written to it, one per line.
+    """
+
+    def __init__(self, filename, header, dtype='<f4', members_file=None, block_size=2**24):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.block_size = max(block_size // (3 * self.dtype.itemsize), 1) * 3 * self.dtype.itemsize
+        self.count = 0
+        self.total_count = 0
+        text, self._positions = format_header(header, self.dtype)
+        self._terminator = np.full(3, np.inf, dtype=self.dtype).tobytes()
+        self._file = open(filename, 'w+b')
+        self._file.write(text + self._terminator)
+        self._members = open(members_file, 'w') if members_file else None
+
+    @classmethod
+    def reopen(cls, filename, members_file=None, block_size=2**24):
+        """Opens a .tck file written by a TckAppender to append more streamlines."""
+
+        self = cls.__new__(cls)
+        header, offset, self.dtype = read_tck_header(filename)
+        self.filename = filename
+        self.block_size = max(block_size // (3 * self.dtype.itemsize), 1) * 3 * self.dtype.itemsize
+        self.count = int(header['count'])
+        self.total_count = int(header['total_count'])
+        with open(filename, 'rb') as f:
+            text = f.read(offset)
+        self._positions = {key: text.index(b'\n' + key.encode('utf-8') + b': ') + len(key) + 3
+                           for key in ('count', 'total_count')}
+        self._terminator = np.full(3, np.inf, dtype=self.dtype).tobytes()
+        self._file = open(filename, 'r+b')
+        self._members = open(members_file, 'a') if members_file else None
+        return self
+
+    def append(self, in_file, member=None):
+        header, offset, dtype = read_tck_header(in_file)
+        count, end = tck_extent(in_file, header, offset, dtype)
+        self._file.seek(-len(self._terminator), os.SEEK_END)
+        with open(in_file, 'rb') as f:
+            f.seek(offset)
+            remaining = end - offset
+            while remaining > 0:
+                block = f.read(min(self.block_size, remaining))
+                remaining -= len(block)
+                if dtype != self.dtype:
+                    block = np.frombuffer(block, dtype=dtype).astype(self.dtype).tobytes()
+                self._file.write(block)
+        self._file.write(self._terminator)
+
+        self.count += count
+        self.total_count += int(header.get('total_count', count))
+        for key, value in (('count', self.count), ('total_count', self.total_count)):
+            self._file.seek(self._positions[key])
+            self._file.write('{:012d}'.format(value).encode('utf-8'))
+        self._file.flush()
+        if self._members is not None:
+            self._members.write('{}\n'.format(member) * count)
+            self._members.flush()
+
+        return count
+
+    def close(self):
+        self._file.close()
+        if self._members is not None:
+            self._members.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrkAppender(object):
+    """Appends the streamlines of .trk files to a new .trk file.
+
+    The records of each input are copied as raw blocks of bytes (swapped
+    if the byte order differs) and the streamline count in the header is
+    updated in place, so that the output is a valid tractogram after each
+    append. If `tag` is true, the member index of every streamline is added
+    as a property named 'member': only in this case (or if the input header
+    does not provide the count) the records are walked one by one.
+    """
+
+    def __init__(self, filename, header, tag=False, block_size=2**24):
+        self.filename = filename
+        self.header = header.astype(header.dtype.newbyteorder('<'))
+        self.nb_scalars = int(self.header[Field.NB_SCALARS_PER_POINT])
+        self.nb_properties = int(self.header[Field.NB_PROPERTIES_PER_STREAMLINE])
+        self.tag = tag
+        self.block_size = max(block_size // 4, 1)
+        self.header[Field.NB_STREAMLINES] = 0
+        if tag:
+            self.header['property_name'][self.nb_properties] = b'member'
+            self.header[Field.NB_PROPERTIES_PER_STREAMLINE] = self.nb_properties + 1
+        self.nb_streamlines = 0
+        self._file = open(filename, 'w+b')
+        self._file.write(self.header.tobytes())
+
+    @classmethod
+    def reopen(cls, filename, tag=False, block_size=2**24):
+        """Opens a .trk file written by a TrkAppender to append more streamlines."""
+
+        self = cls.__new__(cls)
+        self.filename = filename
+        self.header = read_trk_header(filename)
+        self.nb_scalars = int(self.header[Field.NB_SCALARS_PER_POINT])
+        self.nb_properties = int(self.header[Field.NB_PROPERTIES_PER_STREAMLINE]) - int(tag)
+        self.tag = tag
+        self.block_size = max(block_size // 4, 1)
+        self.nb_streamlines = int(self.header[Field.NB_STREAMLINES])
+        self._file = open(filename, 'r+b')
+        return self
+
+    def check(self, header, filename):
+        if (int(header[Field.NB_SCALARS_PER_POINT]) != self.nb_scalars or
+                int(header[Field.NB_PROPERTIES_PER_STREAMLINE]) != self.nb_properties):
+            raise ValueError(filename + ': different scalars or properties')
+        for field in (Field.VOXEL_TO_RASMM, Field.DIMENSIONS, Field.VOXEL_SIZES):
+            if not np.allclose(header[field], self.header[field]):
+                raise ValueError(filename + ': different space')
+
+    def append(self, in_file, member=None):
+        header = read_trk_header(in_file)
+        self.check(header, in_file)
+        # counts and coordinates are all 4-byte values, swapped as integers if needed
+        data = np.memmap(in_file, dtype=header.dtype['hdr_size'].str, mode='r',
+                         offset=header.dtype.itemsize)
+        count = int(header[Field.NB_STREAMLINES])
+        if self.tag or count == 0:
+            ends = record_ends(data, self.nb_scalars, self.nb_properties, count)
+            count = len(ends)
+
+        self._file.seek(0, os.SEEK_END)
+        if self.tag:
+            # the member is inserted at the end of each record
+            value = np.array(member, dtype='<f4').view('<i4')
+            starts = np.concatenate([[0], ends[:-1]])
+            step = max(1, self.block_size * count // max(len(data), 1))
+            for i in range(0, count, step):
+                block = data[starts[i]:ends[min(i + step, count) - 1]].astype('<i4')
+                block = np.insert(block, ends[i:i + step] - starts[i], value)
+                self._file.write(block.tobytes())
+        else:
+            for start in range(0, len(data), self.block_size):
+                self._file.write(data[start:start + self.block_size].astype('<i4').tobytes())
+
+        self.nb_streamlines += count
+        self._file.seek(header_2_dtype.fields[Field.NB_STREAMLINES][1])
+        self._file.write(np.array(self.nb_streamlines, dtype='<i4').tobytes())
+        self._file.flush()
+
+        return count
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def members_path(out_file):
+    return os.path.splitext(out_file)[0] + '_members.txt'
+
+
+def tractogram_count(filename):
+    if filename.endswith('.tck'):
+        return int(read_tck_header(filename)[0]['count'])
+    return int(read_trk_header(filename)[Field.NB_STREAMLINES])
+
+
+def append_tractogram(out_file, in_file, member=None, tag_members=False, block_size=2**24):
+    """Appends a tractogram to another one, which is created if it does not exist.
+
+    Appends from concurrent processes are serialized through a lock file.
+    Returns the number of appended streamlines.
+    """
+
+    import fcntl
+
+    ext = os.path.splitext(out_file)[1]
+    if os.path.splitext(in_file)[1] != ext:
+        raise ValueError('The tractograms to merge must be in the same format')
+    with open(out_file + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exists = os.path.exists(out_file) and os.path.getsize(out_file) > 0
+        members_file = members_path(out_file) if tag_members else None
+        if ext == '.tck' and exists:
+            merged = TckAppender.reopen(out_file, members_file, block_size)
+        elif ext == '.tck':
+            header, _, dtype = read_tck_header(in_file)
+            merged = TckAppender(out_file, header, dtype, members_file, block_size)
+        elif ext == '.trk' and exists:
+            merged = TrkAppender.reopen(out_file, tag_members, block_size)
+        elif ext == '.trk':
+            merged = TrkAppender(out_file, read_trk_header(in_file), tag_members, block_size)
+        else:
+            raise ValueError('Unsupported tractogram format: ' + ext)
+        with merged:
+            return merged.append(in_file, member)
+
+
+def merge_tractograms(in_files, out_file, tag_members=False, block_size=2**24, shards=1):
+    """Concatenates tractograms in the same format (.tck or .trk).
+
+    With tagged members, the member of a streamline is the index of its
+    input, or of its group of `shards` consecutive inputs (the shards of
+    each member of an ensemble). Returns the number of streamlines and, for
+    .tck files with tagged members, the file listing the member of each
+    streamline.
+    """
+
+    ext = os.path.splitext(in_files[0])[1]
+    if any(os.path.splitext(f)[1] != ext for f in in_files):
+        raise ValueError('The tractograms to merge must be in the same format')
+
+    members_file = None
+    if ext == '.tck':
+        header, _, dtype = read_tck_header(in_files[0])
+        if tag_members:
+            members_file = members_path(out_file)
+        merged = TckAppender(out_file, header, dtype, members_file, block_size)
+    elif ext == '.trk':
+        merged = TrkAppender(out_file, read_trk_header(in_files[0]), tag_members, block_size)
+    else:
+        raise ValueError('Unsupported tractogram format: ' + ext)
+
+    with merged:
+        count = sum(merged.append(f, i // shards) for i, f in enumerate(in_files))
+
+    return count, members_file
+
+
+class MergeTractogramsInputSpec(BaseInterfaceInputSpec):
+    in_files = InputMultiPath(
+        File(exists=True),
+        mandatory=True,
+        desc="Input tractograms (all in .tck or all in .trk)"
+    )
+    out_file = File(
+        desc="Output tractogram (by default, 'merged' with the format of the inputs)"
+    )
+    tag_members = traits.Bool(
+        False,
+        usedefault=True,
+        desc=(
+            "Tag each streamline with the index of its input (as a property "
+            "for .trk, in a separate text file for .tck)"
+        )
+    )
+    block_size = traits.Int(
+        2**24,
+        usedefault=True,
+        desc="Number of bytes copied at a time"
+    )
+    shards = traits.Int(
+        1,
+        usedefault=True,
+        desc="Number of consecutive inputs tagged as the same member"
+    )
+
+
+class MergeTractogramsOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+    members_file = File(desc="Member of each streamline (for .tck)")
+
+
+class MergeTractograms(BaseInterface):
+    input_spec = MergeTractogramsInputSpec
+    output_spec = MergeTractogramsOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        count, self._members_file = merge_tractograms(
+            self.inputs.in_files, self._out_file(), self.inputs.tag_members,
+            self.inputs.block_size, self.inputs.shards)
+        iflogger.info('Merged %d streamlines from %d files in %.2f s',
+                      count, len(self.inputs.in_files), time.time() - start)
+
+        return runtime
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath('merged' + os.path.splitext(self.inputs.in_files[0])[1])
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        if getattr(self, '_members_file', None):
+            outputs['members_file'] = self._members_file
+        return outputs
@@ -0,0 +1,135 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from .index import open_reader, open_writer
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def streamline_metrics(points, lengths):
+    """Computes the length, mean curvature and tortuosity of a chunk of streamlines.
+
+    All the streamlines are processed at once on the concatenated points:
+    segments and angles spanning two streamlines are masked out, and the
+    values are summed per streamline with weighted bincounts. The curvature
+    at each inner point is the turning angle over the mean length of the
+    two segments (rad/mm); the tortuosity is the length over the distance
+    between the endpoints (infinite for closed streamlines).
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(lengths)
+    points = np.asarray(points, dtype=np.float64)
+    owner = np.repeat(np.arange(n), lengths)
+
+    segments = np.diff(points, axis=0)
+    same = owner[1:] == owner[:-1]
+    norms = np.linalg.norm(segments, axis=1) * same
+    length = np.bincount(owner[1:], weights=norms, minlength=n)
+
+    starts = np.cumsum(lengths) - lengths
+    chord = np.linalg.norm(points[starts + lengths - 1] - points[starts], axis=1)
+    tortuosity = np.full(n, np.inf)
+    np.divide(length, chord, out=tortuosity, where=chord > 0)
+    tortuosity[length == 0] = 1.
+
+    # turning angle at each inner point, between its two segments
+    inner = same[:-1] & same[1:] & (norms[:-1] > 0) & (norms[1:] > 0)
+    a, b = segments[:-1][inner], segments[1:][inner]
+    na, nb = norms[:-1][inner], norms[1:][inner]
+    cosine = np.clip(np.einsum('ij,ij->i', a, b) / (na * nb), -1., 1.)
+    local = np.arccos(cosine) / (0.5 * (na + nb))
+    curvature = np.bincount(owner[1:-1][inner], weights=local, minlength=n)
+    counts = np.bincount(owner[1:-1][inner], minlength=n)
+    curvature = np.divide(curvature, counts, out=np.zeros(n), where=counts > 0)
+
+    return length, curvature, tortuosity
+
+
+def filter_tractogram(in_file, out_file, min_length=0., max_length=np.inf,
+                      max_curvature=np.inf, max_tortuosity=np.inf, chunk_size=100000):
+    """Keeps the streamlines within the given bounds, in a single pass over the input.
+
+    Returns the metrics of all the input streamlines and which are kept.
+    """
+
+    reader = open_reader(in_file)
+    metrics = {'length': [], 'curvature': [], 'tortuosity': [], 'kept': []}
+    with open_writer(out_file, reader.header) as writer:
+        for points, lengths in reader.iter_chunks(chunk_size):
+            length, curvature, tortuosity = streamline_metrics(points, lengths)
+            kept = ((length >= min_length) & (length <= max_length) &
+                    (curvature <= max_curvature) & (tortuosity <= max_tortuosity))
+            owner = np.repeat(kept, lengths)
+            writer.append(points[owner], lengths[kept])
+            for key, value in (('length', length), ('curvature', curvature),
+                               ('tortuosity', tortuosity), ('kept', kept)):
+                metrics[key].append(value.astype(np.float32) if key != 'kept' else value)
+
+    return {key: np.concatenate(value) if value else np.zeros(0)
+            for key, value in metrics.items()}
+
+
+class FilterStreamlinesInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    min_length = traits.Float(
+        desc="Minimum length of the streamlines (in mm)"
+    )
+    max_length = traits.Float(
+        desc="Maximum length of the streamlines (in mm)"
+    )
+    max_curvature = traits.Float(
+        desc="Maximum mean curvature of the streamlines (in rad/mm)"
+    )
+    max_tortuosity = traits.Float(
+        desc="Maximum ratio between the length and the distance of the endpoints"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    out_file = File(
+        desc="Output tractogram (by default, 'filtered' with the format of the input)"
+    )
+
+
+class FilterStreamlinesOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+    metrics_file = File(exists=True, desc="Metrics of the input streamlines (.npz)")
+
+
+class FilterStreamlines(BaseInterface):
+    input_spec = FilterStreamlinesInputSpec
+    output_spec = FilterStreamlinesOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        bounds = {k: getattr(self.inputs, k) for k in
+                  ('min_length', 'max_length', 'max_curvature', 'max_tortuosity')
+                  if isdefined(getattr(self.inputs, k))}
+        metrics = filter_tractogram(self.inputs.in_file, self._out_file(),
+                                    chunk_size=self.inputs.chunk_size, **bounds)
+        np.savez(os.path.abspath('metrics.npz'), **metrics)
+        iflogger.info('Kept %d of %d streamlines in %.2f s',
+                      np.count_nonzero(metrics['kept']), len(metrics['kept']),
+                      time.time() - start)
+
+        return runtime
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath('filtered' + os.path.splitext(self.inputs.in_file)[1])
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        outputs['metrics_file'] = os.path.abspath('metrics.npz')
+        return outputs
@@ -0,0 +1,72 @@
+import numpy as np
+import nibabel as nib
+import os
+
+DATATYPES = {'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2',
+             'Int32': 'i4', 'UInt32': 'u4', 'Int64': 'i8', 'UInt64': 'u8',
+             'Float32': 'f4', 'Float64': 'f8'}
+
+
+def read_mif_header(filename):
+    """Reads the header of a .mif file (uncompressed, with the data in the same file)."""
+
+    header = {}
+    with open(filename, 'rb') as f:
+        if f.readline().strip() != b'mrtrix image':
+            raise ValueError(filename + ' is not a valid .mif file')
+        for line in f:
+            line = line.decode('utf-8').strip()
+            if line == 'END':
+                break
+            try:
+                key, value = line.split(':', 1)
+            except ValueError:
+                continue
+            header.setdefault(key.strip(), []).append(value.strip())
+
+    return header
+
+
+def load_mif(filename):
+    """Loads the data of a .mif file with its voxel-to-RAS+ mm affine.
+
+    The data is returned indexed as in MRtrix (the axes reordered and
+    flipped according to the layout of the file).
+    """
+
+    header = read_mif_header(filename)
+    shape = [int(d) for d in header['dim'][0].split(',')]
+    vox = [float(v) for v in header['vox'][0].split(',')][:3]
+    layout = header['layout'][0].split(',')
+    datatype = header['datatype'][0]
+    dtype = np.dtype(DATATYPES[datatype.rstrip('LEB')])
+    if datatype.endswith(('LE', 'BE')):
+        dtype = dtype.newbyteorder('<' if datatype.endswith('LE') else '>')
+    name, offset = header['file'][0].split()
+    if name != '.':
+        raise ValueError(filename + ': the data must be in the same file')
+
+    # axes from the slowest to the fastest varying in the file
+    ranks = [int(l[1:]) if l[0] in '+-' else int(l) for l in layout]
+    order = sorted(range(len(shape)), key=lambda a: -ranks[a])
+    data = np.memmap(filename, dtype=dtype, mode='r', offset=int(offset),
+                     shape=tuple(shape[a] for a in order))
+    data = np.transpose(data, np.argsort(order))
+    flips = tuple(slice(None, None, -1) if l.startswith('-') else slice(None) for l in layout)
+    data = np.asarray(data[flips])
+
+    affine = np.eye(4)
+    affine[:3] = np.array([[float(v) for v in row.split(',')]
+                           for row in header['transform'][:3]])
+    affine[:3, :3] = affine[:3, :3] * vox
+
+    return data, affine
+
+
+def load_image(filename):
+    """Loads the data and the affine of an image, in .mif or in any format read by nibabel."""
+
+    if os.path.splitext(filename)[1] == '.mif':
+        return load_mif(filename)
+    img = nib.load(filename)
+    return np.asanyarray(img.dataobj), img.affine
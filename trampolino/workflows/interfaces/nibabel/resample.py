@@ -0,0 +1,212 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from .index import open_reader, open_writer
+import numpy as np
+import json
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def arc_lengths(points, lengths):
+    """Cumulative arc length of the points of all the streamlines.
+
+    The streamlines are laid out one after the other along a single axis,
+    separated by a gap of one, so that the position of a point identifies
+    its streamline. Returns the positions and the start of each streamline.
+    """
+
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    steps = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    steps[owner[1:] != owner[:-1]] = 1.
+    positions = np.concatenate([[0.], np.cumsum(steps)])
+    starts = np.cumsum(lengths) - lengths
+    return positions, starts
+
+
+def resample(points, lengths, step=None, nb_points=None):
+    """Resamples a chunk of streamlines, with a fixed number of points or a fixed step.
+
+    With a `step` (in mm), each streamline gets as many equally spaced
+    points as needed for their spacing not to exceed it; the endpoints are
+    kept. The new points are interpolated linearly for all the streamlines
+    at once, by searching their arc length in the cumulative arc length.
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    points = np.asarray(points, dtype=np.float64)
+    if not len(lengths):
+        return points.astype(np.float32), lengths
+    positions, starts = arc_lengths(points, lengths)
+    ends = starts + lengths - 1
+    length = positions[ends] - positions[starts]
+    if nb_points is not None:
+        new_lengths = np.full(len(lengths), int(nb_points), dtype=np.int64)
+    else:
+        new_lengths = np.ceil(length / step).astype(np.int64) + 1
+
+    owner = np.repeat(np.arange(len(lengths)), new_lengths)
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(new_lengths) - new_lengths, new_lengths)
+    fraction = rank / np.maximum(new_lengths[owner] - 1, 1).astype(np.float64)
+    targets = positions[starts][owner] + fraction * length[owner]
+
+    # segment containing each target, within its streamline
+    k = np.searchsorted(positions, targets, side='right') - 1
+    k = np.clip(k, starts[owner], np.maximum(ends[owner] - 1, starts[owner]))
+    nxt = np.minimum(k + 1, ends[owner])
+    span = positions[nxt] - positions[k]
+    t = np.divide(targets - positions[k], span, out=np.zeros(len(k)), where=span > 0)
+    new_points = points[k] + np.clip(t, 0, 1)[:, None] * (points[nxt] - points[k])
+
+    return new_points.astype(np.float32), new_lengths
+
+
+def linearize(points, lengths, tolerance=0.1, max_segment=10.):
+    """Removes the points of a chunk of streamlines that are nearly on a line.
+
+    The points are simplified as in the Douglas-Peucker algorithm, for all
+    the streamlines at once: the endpoints are kept and, at every iteration,
+    the farthest point of each segment between kept points is also kept if
+    its distance from the segment is above `tolerance` (in mm), or if the
+    segment is longer than `max_segment`. Returns the kept points and the
+    new lengths.
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    points = np.asarray(points)
+    n = len(points)
+    index = np.arange(n)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    keep = np.zeros(n, dtype=bool)
+    keep[starts] = True
+    keep[starts + lengths - 1] = True
+    coords = points.astype(np.float64)
+
+    while True:
+        previous = np.maximum.accumulate(np.where(keep, index, 0))
+        following = np.minimum.accumulate(np.where(keep, index, n - 1)[::-1])[::-1]
+        a, b = coords[previous], coords[following]
+        ab = b - a
+        norm = np.linalg.norm(ab, axis=1)
+        ap = coords - a
+        distance = np.where(norm > 0,
+                            np.linalg.norm(np.cross(ap, ab), axis=1) / np.maximum(norm, 1e-12),
+                            np.linalg.norm(ap, axis=1))
+        far = ~keep & (distance > tolerance)
+        split = ~keep & (far | (norm > max_segment))
+        if not split.any():
+            break
+        # the farthest point of each segment (identified by its previous kept
+        # point) is kept or, if all are close enough, the middle one
+        has_far = np.bincount(previous[far], minlength=n)[previous] > 0
+        score = np.where(has_far, distance, -np.abs(index - 0.5 * (previous + following)))
+        candidates = np.flatnonzero(split)
+        order = np.lexsort((score[candidates], previous[candidates]))
+        candidates = candidates[order]
+        last = np.append(previous[candidates][1:] != previous[candidates][:-1], True)
+        keep[candidates[last]] = True
+
+    new_lengths = np.bincount(owner[keep], minlength=len(lengths))
+    return points[keep], new_lengths
+
+
+def simplify_tractogram(in_file, out_file, step=None, nb_points=None, tolerance=None,
+                        max_segment=10., chunk_size=100000):
+    """Resamples and/or linearizes a .tck or .trk file, chunk by chunk.
+
+    Returns a report of the size reduction.
+    """
+
+    reader = open_reader(in_file)
+    nb_streamlines = nb_points_in = nb_points_out = 0
+    with open_writer(out_file, reader.header) as writer:
+        for points, lengths in reader.iter_chunks(chunk_size):
+            nb_points_in += len(points)
+            if step is not None or nb_points is not None:
+                points, lengths = resample(points, lengths, step, nb_points)
+            if tolerance is not None:
+                points, lengths = linearize(points, lengths, tolerance, max_segment)
+            writer.append(points, lengths)
+            nb_streamlines += len(lengths)
+            nb_points_out += len(points)
+
+    report = {'streamlines': nb_streamlines,
+              'points_in': nb_points_in,
+              'points_out': nb_points_out,
+              'bytes_in': os.path.getsize(in_file),
+              'bytes_out': os.path.getsize(out_file)}
+    report['reduction'] = 1 - report['bytes_out'] / float(max(report['bytes_in'], 1))
+    return report
+
+
+class ResampleStreamlinesInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    step = traits.Float(
+        desc="Maximum distance between consecutive points (in mm)",
+        xor=['nb_points']
+    )
+    nb_points = traits.Int(
+        desc="Number of points of each streamline",
+        xor=['step']
+    )
+    tolerance = traits.Float(
+        desc="Maximum distance of the removed points from the simplified "
+             "streamlines (in mm); if not set, points are not removed"
+    )
+    max_segment = traits.Float(
+        10.,
+        usedefault=True,
+        desc="Maximum length of a segment after the simplification (in mm)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    out_file = File(
+        desc="Output tractogram (by default, 'resampled' with the format of the input)"
+    )
+
+
+class ResampleStreamlinesOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+    report_file = File(exists=True, desc="Size reduction (.json)")
+
+
+class ResampleStreamlines(BaseInterface):
+    input_spec = ResampleStreamlinesInputSpec
+    output_spec = ResampleStreamlinesOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        options = {k: getattr(self.inputs, k) for k in ('step', 'nb_points', 'tolerance')
+                   if isdefined(getattr(self.inputs, k))}
+        report = simplify_tractogram(self.inputs.in_file, self._out_file(),
+                                     max_segment=self.inputs.max_segment,
+                                     chunk_size=self.inputs.chunk_size, **options)
+        report['seconds'] = time.time() - start
+        with open(os.path.abspath('report.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        iflogger.info('Resampled %d streamlines from %d to %d points (%d to %d bytes) '
+                      'in %.2f s', report['streamlines'], report['points_in'],
+                      report['points_out'], report['bytes_in'], report['bytes_out'],
+                      report['seconds'])
+
+        return runtime
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath('resampled' + os.path.splitext(self.inputs.in_file)[1])
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        outputs['report_file'] = os.path.abspath('report.json')
+        return outputs
@@ -0,0 +1,203 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec)
+from nipype import logging
+from concurrent.futures import ProcessPoolExecutor
+from .geometry import transform_points
+from .index import StreamlineIndex, load_index, index_path
+from .mif import load_image
+import numpy as np
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def segment_densities(points, lengths, affine, shape, first=0):
+    """Length of each streamline of a chunk within each voxel of a grid.
+
+    Each segment is assigned to the voxel of its midpoint. Returns the
+    linear voxel indices, the streamline ids (starting from `first`) and
+    the lengths (in mm), summed for each voxel and streamline.
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    owner = np.repeat(np.arange(first, first + len(lengths)), lengths)
+    same = owner[1:] == owner[:-1]
+    points = np.asarray(points, dtype=np.float64)
+    segments = np.linalg.norm(np.diff(points, axis=0), axis=1)[same]
+    middle = 0.5 * (points[1:] + points[:-1])[same]
+    vox = np.rint(transform_points(middle, np.linalg.inv(affine), dtype=np.float64))
+    inside = np.all((vox >= 0) & (vox < shape), axis=1)
+    voxels = np.ravel_multi_index(vox[inside].astype(np.int64).T, shape)
+
+    size = first + len(lengths)
+    keys, inverse = np.unique(voxels * size + owner[1:][same][inside], return_inverse=True)
+    values = np.bincount(inverse, weights=segments[inside], minlength=len(keys))
+    return keys // size, (keys % size).astype(np.uint32), values.astype(np.float32)
+
+
+def accumulate_range(filename, index_file, start, stop, affine, shape, chunk_size):
+    """Densities of a range of streamlines, read chunk by chunk through their index."""
+
+    index = StreamlineIndex(filename, index_file)
+    parts = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32),
+              np.zeros(0, dtype=np.float32))]
+    for first in range(start, stop, chunk_size):
+        points, lengths = index.range(first, min(first + chunk_size, stop))
+        parts.append(segment_densities(points, lengths, affine, shape, first))
+
+    return tuple(np.concatenate(p) for p in zip(*parts))
+
+
+def track_densities(filename, affine, shape, chunk_size=100000, workers=1, index_file=None):
+    """Sparse matrix (voxels x streamlines) of the streamline lengths in each voxel.
+
+    The streamlines are split in ranges, accumulated in parallel processes
+    (each reading its own range through the random-access index) and the
+    partial matrices are concatenated. Returns the voxels, the streamline
+    ids and the lengths of the non-zero entries, and the number of streamlines.
+    """
+
+    index_file = index_file or index_path(filename)
+    nb_streamlines = len(load_index(filename, index_file))
+    shape = tuple(int(s) for s in shape[:3])
+    step = max(chunk_size, -(-nb_streamlines // max(workers, 1)))
+    ranges = [(s, min(s + step, nb_streamlines)) for s in range(0, nb_streamlines, step)]
+    args = [(filename, index_file, s, e, affine, shape, chunk_size) for s, e in ranges]
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(accumulate_range, *zip(*args)))
+    else:
+        parts = [accumulate_range(*a) for a in args]
+    if not parts:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32),
+                np.zeros(0, dtype=np.float32), 0)
+
+    voxels, ids, values = (np.concatenate(p) for p in zip(*parts))
+    return voxels, ids, values, nb_streamlines
+
+
+def solve_weights(voxels, ids, values, fibre_density, nb_streamlines, iterations=100,
+                  min_factor=0., max_factor=np.inf, damping=0.5, tolerance=1e-6):
+    """Estimates a weight for each streamline so that the weighted track densities
+    match the fibre densities, up to a global proportionality `mu`.
+
+    Following the idea of SIFT2, the cost is the sum over the voxels of the
+    squared differences between the fibre density and `mu` times the
+    weighted track density. All the weights are updated at once with a
+    multiplicative step: the factor of each streamline is the mean, along
+    its path, of the ratio between the fibre and the track density of the
+    voxels it crosses, raised to `damping`. Voxels without fibre density
+    are ignored. Returns the weights, `mu` and the cost at each iteration.
+    """
+
+    density = np.asarray(fibre_density, dtype=np.float64).ravel()
+    used = density[voxels] > 0
+    voxels, ids, values = voxels[used], ids[used], values[used].astype(np.float64)
+    nb_voxels = len(density)
+    total = np.bincount(ids, weights=values, minlength=nb_streamlines)
+    tracked = total > 0
+
+    weights = np.ones(nb_streamlines)
+    costs = []
+    mu = 0.
+    for _ in range(iterations):
+        track_density = np.bincount(voxels, weights=values * weights[ids], minlength=nb_voxels)
+        crossed = track_density > 0
+        mu = density[crossed].sum() / max(track_density[crossed].sum(), 1e-12)
+        costs.append(float(((density - mu * track_density)[crossed | (density > 0)] ** 2).sum()))
+        if len(costs) > 1 and costs[-2] - costs[-1] <= tolerance * costs[0]:
+            break
+        ratio = np.divide(density, mu * track_density, out=np.ones(nb_voxels), where=crossed)
+        factor = np.ones(nb_streamlines)
+        np.divide(np.bincount(ids, weights=values * ratio[voxels], minlength=nb_streamlines),
+                  total, out=factor, where=tracked)
+        weights = np.clip(weights * factor ** damping, min_factor, max_factor)
+
+    return weights, mu, costs
+
+
+class EstimateWeightsInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    in_fod = File(
+        exists=True,
+        mandatory=True,
+        desc="Fibre orientation distribution (.mif or NIfTI): the first volume "
+             "(l=0 term) gives the fibre density of each voxel"
+    )
+    iterations = traits.Int(
+        100,
+        usedefault=True,
+        desc="Maximum number of iterations of the solver"
+    )
+    min_factor = traits.Float(
+        0.,
+        usedefault=True,
+        desc="Minimum weight of a streamline"
+    )
+    max_factor = traits.Float(
+        np.inf,
+        usedefault=True,
+        desc="Maximum weight of a streamline"
+    )
+    damping = traits.Float(
+        0.5,
+        usedefault=True,
+        desc="Exponent of the multiplicative updates (between 0 and 1)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    workers = traits.Int(
+        1,
+        usedefault=True,
+        desc="Number of processes accumulating the track densities"
+    )
+    out_weights = File(
+        'weights.txt',
+        usedefault=True,
+        desc="Output weights, one per streamline"
+    )
+
+
+class EstimateWeightsOutputSpec(TraitedSpec):
+    out_weights = File(exists=True)
+    mu = traits.Float(desc="Proportionality between fibre and track density")
+
+
+class EstimateWeights(BaseInterface):
+    input_spec = EstimateWeightsInputSpec
+    output_spec = EstimateWeightsOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        fod, affine = load_image(self.inputs.in_fod)
+        density = fod[..., 0] if fod.ndim > 3 else fod
+        index_file = os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+        voxels, ids, values, nb_streamlines = track_densities(
+            self.inputs.in_file, affine, density.shape, self.inputs.chunk_size,
+            self.inputs.workers, index_file)
+        iflogger.info('Accumulated the densities of %d streamlines in %.2f s',
+                      nb_streamlines, time.time() - start)
+
+        start = time.time()
+        weights, self._mu, costs = solve_weights(
+            voxels, ids, values, density, nb_streamlines, self.inputs.iterations,
+            self.inputs.min_factor, self.inputs.max_factor, self.inputs.damping)
+        np.savetxt(os.path.abspath(self.inputs.out_weights), weights, fmt='%.6g')
+        iflogger.info('Estimated the weights in %d iterations (%.2f s), cost from %g to %g',
+                      len(costs), time.time() - start, costs[0] if costs else 0,
+                      costs[-1] if costs else 0)
+
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_weights'] = os.path.abspath(self.inputs.out_weights)
+        outputs['mu'] = getattr(self, '_mu', 0.)
+        return outputs
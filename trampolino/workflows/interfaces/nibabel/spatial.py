@@ -0,0 +1,230 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, InputMultiPath,
+                                    isdefined)
+from nipype import logging
+from .geometry import transform_points
+from .index import StreamlineIndex, index_path, open_reader
+import numpy as np
+import nibabel as nib
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def voxelize(points, lengths, affine, shape, first=0):
+    """Finds the voxels crossed by each streamline of a chunk.
+
+    The points (in RAS+ mm) are brought to the voxel grid given by `affine`
+    and `shape`; returns the (sorted, unique) pairs of streamline id and
+    linear voxel index, and the linear voxel index of the two endpoints of
+    each streamline (-1 if outside of the grid). Ids start from `first`.
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ids = np.repeat(np.arange(first, first + len(lengths)), lengths)
+    vox = np.rint(transform_points(points, np.linalg.inv(affine), dtype=np.float64))
+    inside = np.all((vox >= 0) & (vox < shape), axis=1)
+    linear = np.full(len(vox), -1, dtype=np.int64)
+    linear[inside] = np.ravel_multi_index(vox[inside].astype(np.int64).T, shape)
+
+    ends = np.cumsum(lengths) - 1
+    endpoints = np.stack([linear[ends - lengths + 1], linear[ends]], axis=1)
+
+    # unique pairs, with the voxel as the slow varying key
+    keys = np.unique(linear[inside] * (first + len(lengths)) + ids[inside])
+    return keys % (first + len(lengths)), keys // (first + len(lengths)), endpoints
+
+
+class SpatialIndex(object):
+    """Inverted index from the voxels of a grid to the streamlines crossing them.
+
+    The streamline ids of each voxel are stored contiguously (compressed
+    sparse rows: `pointers` gives where the ids of each voxel start), so
+    that the streamlines crossing a region are found by concatenating the
+    rows of its voxels, without reading the tractogram.
+    """
+
+    def __init__(self, pointers, ids, endpoints, affine, shape):
+        self.pointers = pointers
+        self.ids = ids
+        self.endpoints = endpoints
+        self.affine = np.asarray(affine, dtype=np.float64)
+        self.shape = tuple(int(s) for s in shape)
+
+    @classmethod
+    def build(cls, filename, affine, shape, chunk_size=100000):
+        """Builds the index of a .tck or .trk file, reading it chunk by chunk."""
+
+        shape = tuple(int(s) for s in shape[:3])
+        voxels = [np.zeros(0, dtype=np.int64)]
+        ids = [np.zeros(0, dtype=np.uint32)]
+        endpoints = [np.zeros((0, 2), dtype=np.int64)]
+        first = 0
+        for points, lengths in open_reader(filename).iter_chunks(chunk_size):
+            s, v, e = voxelize(points, lengths, affine, shape, first)
+            ids.append(s.astype(np.uint32))
+            voxels.append(v)
+            endpoints.append(e)
+            first += len(lengths)
+        voxels = np.concatenate(voxels)
+        # chunks are in streamline order, so a stable sort keeps the ids sorted
+        order = np.argsort(voxels, kind='stable')
+        pointers = np.concatenate([[0], np.cumsum(np.bincount(voxels, minlength=np.prod(shape)))])
+        return cls(pointers, np.concatenate(ids)[order], np.concatenate(endpoints),
+                   affine, shape)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['pointers'], f['ids'], f['endpoints'], f['affine'], f['shape'])
+
+    def save(self, filename):
+        np.savez(filename, pointers=self.pointers, ids=self.ids, endpoints=self.endpoints,
+                 affine=self.affine, shape=np.array(self.shape))
+
+    @property
+    def nb_streamlines(self):
+        return len(self.endpoints)
+
+    def region(self, roi):
+        """Linear indices of the voxels of a region, given as a mask or a NIfTI file.
+
+        A region defined on another grid is mapped to the index grid by the
+        nearest voxel of each of its voxels.
+        """
+
+        if isinstance(roi, str):
+            img = nib.load(roi)
+            mask, affine = np.asarray(img.dataobj) > 0, img.affine
+        else:
+            mask, affine = np.asarray(roi) > 0, self.affine
+        mask = mask.reshape(mask.shape[:3])
+        if mask.shape == self.shape and np.allclose(affine, self.affine):
+            return np.flatnonzero(mask)
+        vox = np.rint(transform_points(np.argwhere(mask), np.linalg.inv(self.affine).dot(affine),
+                                       dtype=np.float64)).astype(np.int64)
+        vox = vox[np.all((vox >= 0) & (vox < self.shape), axis=1)]
+        return np.unique(np.ravel_multi_index(vox.T, self.shape))
+
+    def crossing(self, roi):
+        """Boolean mask of the streamlines crossing a region."""
+
+        voxels = self.region(roi)
+        starts, stops = self.pointers[voxels], self.pointers[voxels + 1]
+        sizes = stops - starts
+        rows = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        selected = np.zeros(self.nb_streamlines, dtype=bool)
+        selected[self.ids[rows]] = True
+        return selected
+
+    def ending(self, roi):
+        """Boolean mask of the streamlines with at least one endpoint in a region."""
+
+        voxels = np.zeros(int(np.prod(self.shape)) + 1, dtype=bool)
+        voxels[self.region(roi)] = True
+        # the last element stands for the endpoints outside of the grid (-1)
+        return voxels[self.endpoints].any(axis=1)
+
+    def query(self, include=(), exclude=(), ends_in=()):
+        """Ids of the streamlines crossing all the `include` regions and none of the
+        `exclude` regions, with an endpoint in each of the `ends_in` regions."""
+
+        selected = np.ones(self.nb_streamlines, dtype=bool)
+        for roi in include:
+            selected &= self.crossing(roi)
+        for roi in exclude:
+            selected &= ~self.crossing(roi)
+        for roi in ends_in:
+            selected &= self.ending(roi)
+        return np.flatnonzero(selected)
+
+
+class QueryTractogramInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    ref = File(
+        exists=True,
+        desc="Reference NIfTI volume defining the grid of the index "
+             "(by default, the first region)"
+    )
+    index_file = File(
+        exists=True,
+        desc="Spatial index of the input, built if not given"
+    )
+    include = InputMultiPath(
+        File(exists=True),
+        desc="Regions that the streamlines must cross (NIfTI)"
+    )
+    exclude = InputMultiPath(
+        File(exists=True),
+        desc="Regions that the streamlines must not cross (NIfTI)"
+    )
+    ends_in = InputMultiPath(
+        File(exists=True),
+        desc="Regions that must contain an endpoint of the streamlines (NIfTI)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    out_file = File(
+        desc="Output tractogram (by default, 'selected' with the format of the input)"
+    )
+
+
+class QueryTractogramOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+    index_file = File(exists=True, desc="Spatial index of the input")
+
+
+class QueryTractogram(BaseInterface):
+    input_spec = QueryTractogramInputSpec
+    output_spec = QueryTractogramOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        regions = {k: getattr(self.inputs, k) if isdefined(getattr(self.inputs, k)) else []
+                   for k in ('include', 'exclude', 'ends_in')}
+        if isdefined(self.inputs.index_file):
+            spatial = SpatialIndex.load(self.inputs.index_file)
+        else:
+            rois = regions['include'] + regions['ends_in'] + regions['exclude']
+            ref = self.inputs.ref if isdefined(self.inputs.ref) else (rois or [None])[0]
+            if ref is None:
+                raise ValueError('A reference volume or a region is required')
+            img = nib.load(ref)
+            spatial = SpatialIndex.build(self.inputs.in_file, img.affine, img.shape[:3],
+                                         self.inputs.chunk_size)
+            spatial.save(self._index_file())
+            iflogger.info('Indexed %d streamlines in %.2f s',
+                          spatial.nb_streamlines, time.time() - start)
+
+        start = time.time()
+        ids = spatial.query(**regions)
+        iflogger.info('Selected %d of %d streamlines in %.3f s',
+                      len(ids), spatial.nb_streamlines, time.time() - start)
+        index_file = os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+        StreamlineIndex(self.inputs.in_file, index_file).save(self._out_file(), ids,
+                                                              self.inputs.chunk_size)
+
+        return runtime
+
+    def _index_file(self):
+        if isdefined(self.inputs.index_file):
+            return self.inputs.index_file
+        return os.path.abspath('voxels.npz')
+
+    def _out_file(self):
+        if isdefined(self.inputs.out_file):
+            return os.path.abspath(self.inputs.out_file)
+        return os.path.abspath('selected' + os.path.splitext(self.inputs.in_file)[1])
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = self._out_file()
+        outputs['index_file'] = self._index_file()
+        return outputs
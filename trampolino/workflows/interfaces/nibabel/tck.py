@@ -0,0 +1,198 @@
+import sys
+import numpy as np
+
+
+def read_header(filename):
+    """Reads the header of a .tck file.
+
+    Returns the header fields, the offset of the point data and its dtype.
+    """
+
+    header = {}
+    with open(filename, 'rb') as f:
+        magic = f.readline().strip()
+        if magic != b'mrtrix tracks':
+            raise ValueError(filename + ' is not a valid .tck file')
+        for line in f:
+            line = line.decode('utf-8').strip()
+            if line == 'END':
+                break
+            try:
+                key, value = line.split(':', 1)
+            except ValueError:
+                continue
+            key = key.strip()
+            if key in header:
+                header[key] += '\n' + value.strip()
+            else:
+                header[key] = value.strip()
+        else:
+            raise ValueError(filename + ': missing END in the header')
+
+    datatype = header.get('datatype', 'Float32LE')
+    if datatype.startswith('Float64'):
+        dtype = np.dtype('f8')
+    else:
+        dtype = np.dtype('f4')
+    dtype = dtype.newbyteorder('>' if datatype.endswith('BE') else '<')
+    offset = int(header['file'].split()[1])
+
+    return header, offset, dtype
+
+
+def format_header(header, dtype, count_width=12):
+    """Formats the header of a .tck file from the fields of another one.
+
+    The streamline counts are written as zero-padded numbers of fixed width,
+    so that they can be updated in place. Returns the header and the
+    positions of the counts in it.
+    """
+
+    dtype = np.dtype(dtype)
+    datatype = 'Float64' if dtype.itemsize == 8 else 'Float32'
+    big_endian = dtype.byteorder == '>' or (dtype.byteorder == '=' and sys.byteorder == 'big')
+    datatype += 'BE' if big_endian else 'LE'
+
+    lines = ['mrtrix tracks']
+    for key, value in header.items():
+        if key in ('file', 'datatype', 'count', 'total_count'):
+            continue
+        lines.extend('{}: {}'.format(key, v) for v in value.split('\n'))
+    lines.append('datatype: ' + datatype)
+    text = '\n'.join(lines) + '\n'
+    positions = {}
+    for key in ('count', 'total_count'):
+        text += key + ': '
+        positions[key] = len(text)
+        text += '0' * count_width + '\n'
+
+    # the offset of the data counts its own digits
+    offset = len(text) + len('file: . \nEND\n')
+    while len(text) + len('file: . {}\nEND\n'.format(offset)) != offset:
+        offset += 1
+    text += 'file: . {}\nEND\n'.format(offset)
+
+    return text.encode('utf-8'), positions
+
+
+def scan_delimiters(data, block_size=2**22):
+    """Finds streamline delimiters in the point data of a .tck file.
+
+    Returns the indices of the NaN rows separating the streamlines and the
+    index of the Inf row marking the end of the data. The data is scanned
+    in blocks of rows, so that memory-mapped files are never fully loaded.
+    """
+
+    delimiters = []
+    end = len(data)
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size, 0]
+        rows = np.flatnonzero(~np.isfinite(block))
+        is_end = np.isinf(block[rows])
+        if is_end.any():
+            last = rows[np.argmax(is_end)]
+            delimiters.append(rows[rows < last] + start)
+            end = start + last
+            break
+        delimiters.append(rows + start)
+
+    if delimiters:
+        delimiters = np.concatenate(delimiters)
+    else:
+        delimiters = np.zeros(0, dtype=np.int64)
+
+    return delimiters, end
+
+
+class TckReader(object):
+    """Memory-mapped reader for .tck files.
+
+    The point data is mapped rather than loaded, and the streamlines are
+    described by their offsets (first row in the point data) and lengths,
+    so that single streamlines can be accessed as views.
+    """
+
+    def __init__(self, filename, block_size=2**22):
+        self.filename = filename
+        self.header, offset, self.dtype = read_header(filename)
+        data = np.memmap(filename, dtype=self.dtype, mode='r', offset=offset)
+        self.data = data[:len(data) // 3 * 3].reshape(-1, 3)
+        delimiters, self.end = scan_delimiters(self.data, block_size)
+        self.offsets = np.concatenate([[0], delimiters + 1])[:len(delimiters)]
+        self.lengths = (delimiters - self.offsets).astype(np.int64)
+
+    @property
+    def nb_streamlines(self):
+        return len(self.lengths)
+
+    @property
+    def nb_points(self):
+        return int(self.lengths.sum())
+
+    def __len__(self):
+        return self.nb_streamlines
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i] + self.lengths[i]]
+
+    def points(self, start=0, stop=None):
+        """Returns the points of a range of streamlines, without delimiters."""
+
+        stop = self.nb_streamlines if stop is None else min(stop, self.nb_streamlines)
+        if stop <= start:
+            return np.zeros((0, 3), dtype=self.dtype)
+        first = self.offsets[start]
+        last = self.offsets[stop - 1] + self.lengths[stop - 1]
+        block = self.data[first:last]
+        return block[np.isfinite(block[:, 0])]
+
+    def iter_chunks(self, chunk_size):
+        """Yields the points and lengths of consecutive chunks of streamlines."""
+
+        for start in range(0, self.nb_streamlines, chunk_size):
+            yield (self.points(start, start + chunk_size),
+                   self.lengths[start:start + chunk_size])
+
+
+def pack_streamlines(points, lengths, dtype='<f4'):
+    """Lays out streamlines as in a .tck file, each followed by a NaN delimiter."""
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    buffer = np.full((len(points) + len(lengths), 3), np.nan, dtype=dtype)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    buffer[np.arange(len(points)) + owner] = points
+
+    return buffer
+
+
+class TckWriter(object):
+    """Writes a .tck file incrementally.
+
+    Streamlines (in RAS+ mm) are appended in batches and the counts in
+    the header are updated in place when the file is closed.
+    """
+
+    def __init__(self, filename, header=None, dtype='<f4'):
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.nb_streamlines = 0
+        text, self._positions = format_header(header or {}, self.dtype)
+        self._file = open(filename, 'wb')
+        self._file.write(text)
+
+    def append(self, points, lengths):
+        self._file.write(pack_streamlines(points, lengths, self.dtype).tobytes())
+        self.nb_streamlines += len(lengths)
+
+    def close(self):
+        self._file.write(np.full(3, np.inf, dtype=self.dtype).tobytes())
+        for key in ('count', 'total_count'):
+            self._file.seek(self._positions[key])
+            self._file.write('{:012d}'.format(self.nb_streamlines).encode('utf-8'))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
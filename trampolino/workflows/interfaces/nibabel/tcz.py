@@ -0,0 +1,189 @@
+"""Compressed tractograms (.tcz).
+
+The coordinates (in RAS+ mm) are quantized to fixed point with a given
+precision and stored as differences between consecutive points, which are
+small integers. Blocks of streamlines are compressed separately, and an
+index of the blocks at the end of the file allows decoding each of them
+only when needed.
+
+Layout: magic, offsets of the index and of the header (uint64), the
+compressed blocks, the index and the header (JSON). Each block contains
+the lengths of its streamlines followed by the differences, zigzag-encoded
+and split in byte planes so that the compression sees long runs of zeros.
+"""
+
+import json
+import zlib
+import numpy as np
+
+MAGIC = b'TRAMPTCZ'
+PREAMBLE = len(MAGIC) + 16
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u8'), ('first', '<u8'),
+                        ('streamlines', '<u4'), ('points', '<u8')])
+
+
+def encode_block(points, lengths, precision, level=6):
+    """Compresses a block of streamlines, returning the bytes to be written."""
+
+    quantized = np.rint(np.asarray(points, dtype=np.float64) / precision).astype(np.int64)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 3), dtype=np.int64))
+    # the zigzag-encoded differences are stored on 4 bytes
+    if len(deltas) and np.abs(deltas).max() >= 2 ** 31:
+        raise ValueError('The precision ({}) is too fine for the coordinates '
+                         'of the streamlines'.format(precision))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype('<u4')
+    planes = zigzag.view(np.uint8).reshape(-1, 4).T
+    payload = np.asarray(lengths, dtype='<u4').tobytes() + planes.tobytes()
+    return zlib.compress(payload, level)
+
+
+def decode_block(data, nb_streamlines, nb_points, precision):
+    """Decompresses a block of streamlines, returning their points and lengths."""
+
+    payload = zlib.decompress(data)
+    lengths = np.frombuffer(payload, dtype='<u4', count=nb_streamlines).astype(np.int64)
+    planes = np.frombuffer(payload, dtype=np.uint8, offset=4 * nb_streamlines)
+    zigzag = planes.reshape(4, -1).T.copy().view('<u4').reshape(nb_points, 3).astype(np.int64)
+    deltas = (zigzag >> 1) ^ -(zigzag & 1)
+    points = (np.cumsum(deltas, axis=0) * precision).astype(np.float32)
+    return points, lengths
+
+
+class TczWriter(object):
+    """Writes a .tcz file incrementally.
+
+    Streamlines (in RAS+ mm) are buffered and compressed in blocks of
+    `block_size` streamlines; the index and the header are written when
+    the file is closed. `header` can hold any JSON-serializable field.
+    """
+
+    def __init__(self, filename, precision=0.01, block_size=10000, level=6, header=None):
+        if not precision > 0:
+            raise ValueError('The precision must be positive')
+        self.filename = filename
+        self.precision = float(precision)
+        self.block_size = block_size
+        self.level = level
+        self.header = dict(header or {})
+        self.nb_streamlines = 0
+        self.nb_points = 0
+        self._index = []
+        self._points = []
+        self._lengths = []
+        self._buffered = 0
+        self._file = open(filename, 'wb')
+        self._file.write(MAGIC + bytes(16))
+
+    def append(self, points, lengths):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)])
+        done = 0
+        while done < len(lengths):
+            take = min(self.block_size - self._buffered, len(lengths) - done)
+            self._points.append(points[starts[done]:starts[done + take]])
+            self._lengths.append(lengths[done:done + take])
+            self._buffered += take
+            done += take
+            if self._buffered == self.block_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        points = np.concatenate(self._points)
+        lengths = np.concatenate(self._lengths)
+        data = encode_block(points, lengths, self.precision, self.level)
+        self._index.append((self._file.tell(), len(data), self.nb_streamlines,
+                            len(lengths), len(points)))
+        self._file.write(data)
+        self.nb_streamlines += len(lengths)
+        self.nb_points += len(points)
+        self._points, self._lengths, self._buffered = [], [], 0
+
+    def close(self):
+        self._flush()
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        header_offset = self._file.tell()
+        header = dict(self.header, precision=self.precision, block_size=self.block_size,
+                      nb_streamlines=self.nb_streamlines, nb_points=self.nb_points,
+                      nb_blocks=len(self._index))
+        self._file.write(json.dumps(header).encode('utf-8'))
+        self._file.seek(len(MAGIC))
+        self._file.write(np.array([index_offset, header_offset], dtype='<u8').tobytes())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TczReader(object):
+    """Reader for .tcz files, decoding the blocks only when they are accessed.
+
+    The last decoded block is kept, so that consecutive streamlines are
+    accessed without decoding again.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            preamble = f.read(PREAMBLE)
+            if preamble[:len(MAGIC)] != MAGIC:
+                raise ValueError(filename + ' is not a valid .tcz file')
+            index_offset, header_offset = np.frombuffer(preamble, dtype='<u8', offset=len(MAGIC))
+            f.seek(header_offset)
+            self.header = json.loads(f.read().decode('utf-8'))
+        self.index = np.fromfile(filename, dtype=INDEX_DTYPE, count=self.header['nb_blocks'],
+                                 offset=int(index_offset))
+        self.precision = self.header['precision']
+        self._cached = None
+
+    @property
+    def nb_streamlines(self):
+        return self.header['nb_streamlines']
+
+    @property
+    def nb_points(self):
+        return self.header['nb_points']
+
+    @property
+    def nb_blocks(self):
+        return len(self.index)
+
+    def __len__(self):
+        return self.nb_streamlines
+
+    def block(self, i):
+        """Returns the points, lengths and offsets of the streamlines of a block."""
+
+        if self._cached is not None and self._cached[0] == i:
+            return self._cached[1]
+        entry = self.index[i]
+        with open(self.filename, 'rb') as f:
+            f.seek(int(entry['offset']))
+            data = f.read(int(entry['size']))
+        points, lengths = decode_block(data, int(entry['streamlines']), int(entry['points']),
+                                       self.precision)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self._cached = (i, (points, lengths, offsets))
+        return self._cached[1]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.nb_streamlines
+        if not 0 <= i < self.nb_streamlines:
+            raise IndexError('streamline index out of range')
+        b = int(np.searchsorted(self.index['first'], i, side='right')) - 1
+        points, lengths, offsets = self.block(b)
+        k = i - int(self.index['first'][b])
+        return points[offsets[k]:offsets[k] + lengths[k]]
+
+    def iter_chunks(self):
+        """Yields the points and lengths of the streamlines of each block."""
+
+        for i in range(self.nb_blocks):
+            points, lengths, _ = self.block(i)
+            yield points, lengths
@@ -0,0 +1,177 @@
+from nipype.interfaces.base import (TraitedSpec, BaseInterface, File, traits,
+                                    BaseInterfaceInputSpec, isdefined)
+from nipype import logging
+from concurrent.futures import ProcessPoolExecutor
+from .geometry import transform_points
+from .index import StreamlineIndex, load_index, index_path
+from .mif import load_image
+import numpy as np
+import nibabel as nib
+import os
+import time
+iflogger = logging.getLogger('nipype.interface')
+
+
+def rasterize(points, lengths, affine, shape, first=0):
+    """Finds the voxels traversed by each segment of a chunk of streamlines.
+
+    The segments are cut where they cross the voxel boundaries (computed in
+    the voxel space for all the segments at once), and each piece is
+    assigned to the voxel of its midpoint. Returns the linear voxel indices,
+    the streamline ids (starting from `first`) and the length of each piece (in mm).
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    owner = np.repeat(np.arange(first, first + len(lengths)), lengths)
+    same = owner[1:] == owner[:-1]
+    points = np.asarray(points, dtype=np.float64)
+    vox = transform_points(points, np.linalg.inv(affine), dtype=np.float64)
+    start, delta = vox[:-1][same], np.diff(vox, axis=0)[same]
+    mm = np.linalg.norm(np.diff(points, axis=0), axis=1)[same]
+    nb_segments = len(mm)
+
+    # position along each segment (0 to 1) of its crossings with the voxel boundaries
+    cells = np.floor(start + 0.5)
+    crossings = np.abs(np.floor(start + delta + 0.5) - cells).astype(np.int64)
+    segment = [np.arange(nb_segments), np.arange(nb_segments)]
+    position = [np.zeros(nb_segments), np.ones(nb_segments)]
+    for axis in range(3):
+        n = crossings[:, axis]
+        s = np.repeat(np.arange(nb_segments), n)
+        rank = np.arange(len(s)) - np.repeat(np.cumsum(n) - n, n)
+        direction = np.sign(delta[s, axis])
+        plane = cells[s, axis] + direction * (rank + 0.5)
+        segment.append(s)
+        position.append((plane - start[s, axis]) / delta[s, axis])
+    segment, position = np.concatenate(segment), np.concatenate(position)
+    order = np.lexsort((position, segment))
+    segment, position = segment[order], position[order]
+
+    # pieces between consecutive cuts of the same segment
+    valid = (segment[1:] == segment[:-1]) & (position[1:] > position[:-1])
+    s = segment[:-1][valid]
+    middle = 0.5 * (position[:-1] + position[1:])[valid]
+    centers = np.rint(start[s] + middle[:, None] * delta[s]).astype(np.int64)
+    inside = np.all((centers >= 0) & (centers < shape), axis=1)
+    voxels = np.ravel_multi_index(centers[inside].T, shape)
+    ids = owner[1:][same][s[inside]]
+    pieces = (np.diff(position)[valid] * mm[s])[inside]
+    return voxels, ids, pieces
+
+
+def density_range(filename, index_file, start, stop, affine, shape, contrast='count',
+                  weights=None, chunk_size=100000):
+    """Partial density map of a range of streamlines, read chunk by chunk."""
+
+    index = StreamlineIndex(filename, index_file)
+    size = int(np.prod(shape))
+    density = np.zeros(size)
+    for first in range(start, stop, chunk_size):
+        points, lengths = index.range(first, min(first + chunk_size, stop))
+        voxels, ids, mm = rasterize(points, lengths, affine, shape, first)
+        if contrast == 'count':
+            # each streamline counts once in each voxel
+            pairs = np.unique(voxels * (first + len(lengths)) + ids)
+            voxels, ids = pairs // (first + len(lengths)), pairs % (first + len(lengths))
+            values = None if weights is None else weights[ids]
+        else:
+            values = mm if weights is None else mm * weights[ids]
+        density += np.bincount(voxels, weights=values, minlength=size)
+
+    return density
+
+
+def track_density(filename, affine, shape, contrast='count', weights=None,
+                  chunk_size=100000, workers=1, index_file=None):
+    """Track density map (count of streamlines or length per voxel) on a grid.
+
+    Ranges of streamlines are accumulated in parallel processes, each in
+    its own partial map, and the partial maps are summed at the end.
+    """
+
+    index_file = index_file or index_path(filename)
+    nb_streamlines = len(load_index(filename, index_file))
+    shape = tuple(int(s) for s in shape[:3])
+    if weights is not None and len(weights) != nb_streamlines:
+        raise ValueError('The number of weights and of streamlines differ')
+    step = max(chunk_size, -(-nb_streamlines // max(workers, 1)))
+    ranges = [(s, min(s + step, nb_streamlines)) for s in range(0, nb_streamlines, step)]
+    args = [(filename, index_file, s, e, affine, shape, contrast, weights, chunk_size)
+            for s, e in ranges]
+    density = np.zeros(int(np.prod(shape)))
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(density_range, *zip(*args)):
+                density += partial
+    else:
+        for a in args:
+            density += density_range(*a)
+
+    return density.reshape(shape)
+
+
+class TrackDensityInputSpec(BaseInterfaceInputSpec):
+    in_file = File(
+        exists=True,
+        mandatory=True,
+        desc="Input tractogram (.tck or .trk)"
+    )
+    reference = File(
+        exists=True,
+        mandatory=True,
+        desc="Reference image (.mif or NIfTI) defining the grid of the map"
+    )
+    contrast = traits.Enum(
+        'count', 'length',
+        usedefault=True,
+        desc="Number of streamlines or total length of the streamlines (in mm) in each voxel"
+    )
+    weights = File(
+        exists=True,
+        desc="Weight of each streamline (text file, e.g. from SIFT2)"
+    )
+    chunk_size = traits.Int(
+        100000,
+        usedefault=True,
+        desc="Number of streamlines read at a time"
+    )
+    workers = traits.Int(
+        1,
+        usedefault=True,
+        desc="Number of processes accumulating the density"
+    )
+    out_file = File(
+        'tdi.nii.gz',
+        usedefault=True,
+        desc="Output density map (NIfTI)"
+    )
+
+
+class TrackDensityOutputSpec(TraitedSpec):
+    out_file = File(exists=True)
+
+
+class TrackDensity(BaseInterface):
+    input_spec = TrackDensityInputSpec
+    output_spec = TrackDensityOutputSpec
+
+    def _run_interface(self, runtime):
+        start = time.time()
+        data, affine = load_image(self.inputs.reference)
+        weights = None
+        if isdefined(self.inputs.weights):
+            weights = np.loadtxt(self.inputs.weights, ndmin=1)
+        index_file = os.path.abspath(index_path(os.path.basename(self.inputs.in_file)))
+        density = track_density(self.inputs.in_file, affine, data.shape[:3],
+                                self.inputs.contrast, weights, self.inputs.chunk_size,
+                                self.inputs.workers, index_file)
+        nib.save(nib.Nifti1Image(density.astype(np.float32), affine),
+                 os.path.abspath(self.inputs.out_file))
+        iflogger.info('Computed the track density in %.2f s', time.time() - start)
+
+        return runtime
+
+    def _list_outputs(self):
+        outputs = self._outputs().get()
+        outputs['out_file'] = os.path.abspath(self.inputs.out_file)
+        return outputs
@@ -0,0 +1,185 @@
+import numpy as np
+from nibabel.streamlines import Field
+from nibabel.streamlines.trk import (header_2_dtype,
+                                     get_affine_rasmm_to_trackvis)
+from .geometry import transform_points
+
+
+def create_header(header):
+    """Builds a little-endian TRK header from a dictionary of fields."""
+
+    trk_header = np.zeros((), dtype=header_2_dtype.newbyteorder('<'))
+    trk_header[Field.MAGIC_NUMBER] = b'TRACK'
+    trk_header[Field.VOXEL_SIZES] = (1, 1, 1)
+    trk_header[Field.DIMENSIONS] = (1, 1, 1)
+    trk_header[Field.VOXEL_TO_RASMM] = np.eye(4)
+    trk_header['version'] = 2
+    trk_header['hdr_size'] = 1000
+
+    for k, v in header.items():
+        if k in header_2_dtype.fields:
+            trk_header[k] = v
+
+    # By default, the voxel order is LPS (as in nibabel)
+    if trk_header[Field.VOXEL_ORDER] == b'':
+        trk_header[Field.VOXEL_ORDER] = b'LPS'
+
+    return trk_header
+
+
+def read_header(filename):
+    """Reads the header of a .trk file, in the byte order of the file."""
+
+    with open(filename, 'rb') as f:
+        buffer = f.read(header_2_dtype.itemsize)
+    for order in '<>':
+        header = np.frombuffer(buffer, dtype=header_2_dtype.newbyteorder(order)).reshape(())
+        if header['hdr_size'] == header_2_dtype.itemsize:
+            return header.copy()
+
+    raise ValueError(filename + ' is not a valid .trk file')
+
+
+def record_ends(data, nb_scalars=0, nb_properties=0, count=0):
+    """Finds the end of each record in the data of a .trk file.
+
+    When the header gives the number of streamlines (`count`) and all the
+    records have the same size (e.g. streamlines resampled to a fixed
+    number of points), the ends are computed directly from that size.
+    Otherwise, the records are walked one at a time, reading the point
+    count of each of them from `data` (an int32 view of the data following
+    the header): this is a Python loop over the streamlines, which is why
+    its result is saved in the index of the tractogram.
+    """
+
+    values_per_point = 3 + nb_scalars
+    if count > 0 and len(data) and len(data) % count == 0:
+        size = len(data) // count
+        nb_points = (size - 1 - nb_properties) // values_per_point
+        if (1 + nb_points * values_per_point + nb_properties == size and
+                np.all(data[::size] == nb_points)):
+            return size * np.arange(1, count + 1, dtype=np.int64)
+
+    ends = []
+    pos = 0
+    while pos < len(data):
+        pos += 1 + int(data[pos]) * values_per_point + nb_properties
+        ends.append(pos)
+
+    return np.array(ends, dtype=np.int64)
+
+
+def pack_records(points, lengths):
+    """Packs streamlines into TRK records (point count followed by points).
+
+    The points are expected in voxmm space and are laid out in a single
+    float32 buffer, where the point counts are stored as int32 values.
+    """
+
+    lengths = np.asarray(lengths, dtype=np.int64)
+    nb_streamlines = len(lengths)
+    buffer = np.empty(nb_streamlines + 3 * len(points), dtype='<f4')
+
+    # Streamline k starts after the k previous counts and their points
+    starts = np.arange(nb_streamlines) + 3 * (np.cumsum(lengths) - lengths)
+    buffer.view('<i4')[starts] = lengths
+
+    owner = np.repeat(np.arange(nb_streamlines), lengths)
+    rows = 3 * np.arange(len(points)) + owner + 1
+    buffer[rows[:, None] + np.arange(3)] = points
+
+    return buffer
+
+
+class TrkWriter(object):
+    """Writes a .trk file incrementally.
+
+    The header is written once when the file is opened, streamlines (in
+    RAS+ mm) are appended in batches and the streamline count is updated
+    when the file is closed. Each batch is brought to voxmm space with a
+    single affine transform over all its points, computed in `dtype`.
+    """
+
+    def __init__(self, filename, header, dtype=np.float32):
+        self.filename = filename
+        self.header = create_header(header)
+        self.affine = get_affine_rasmm_to_trackvis(self.header)
+        self.dtype = np.dtype(dtype)
+        self.nb_streamlines = 0
+        self._file = open(filename, 'wb')
+        self._file.write(self.header.tobytes())
+
+    def append(self, points, lengths, inplace=False):
+        out = None
+        if inplace and points.dtype == self.dtype and points.flags.writeable:
+            out = points
+        points = transform_points(points, self.affine, out=out, dtype=self.dtype)
+        self._file.write(pack_records(points, lengths).tobytes())
+        self.nb_streamlines += len(lengths)
+
+    def close(self):
+        self.header[Field.NB_STREAMLINES] = self.nb_streamlines
+        self._file.seek(0)
+        self._file.write(self.header.tobytes())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrkReader(object):
+    """Memory-mapped reader for .trk files.
+
+    The records are located once (walking their point counts), then the
+    points of consecutive chunks of streamlines are gathered with array
+    indexing and brought to RAS+ mm with a single affine transform.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = read_header(filename)
+        self.nb_scalars = int(self.header[Field.NB_SCALARS_PER_POINT])
+        self.nb_properties = int(self.header[Field.NB_PROPERTIES_PER_STREAMLINE])
+        self.data = np.memmap(filename, dtype=self.header.dtype['hdr_size'].str, mode='r',
+                              offset=self.header.dtype.itemsize)
+        self.ends = record_ends(self.data, self.nb_scalars, self.nb_properties,
+                                int(self.header[Field.NB_STREAMLINES]))
+        self.starts = np.concatenate([[0], self.ends[:-1]]).astype(np.int64)
+        self.lengths = ((self.ends - self.starts - 1 - self.nb_properties) //
+                        (3 + self.nb_scalars))
+        self.affine = np.linalg.inv(get_affine_rasmm_to_trackvis(self.header))
+
+    @property
+    def nb_streamlines(self):
+        return len(self.lengths)
+
+    @property
+    def nb_points(self):
+        return int(self.lengths.sum())
+
+    def points(self, start=0, stop=None):
+        """Returns the points (in RAS+ mm) of a range of streamlines."""
+
+        stop = self.nb_streamlines if stop is None else min(stop, self.nb_streamlines)
+        lengths = self.lengths[start:stop]
+        if not len(lengths):
+            return np.zeros((0, 3), dtype=np.float32)
+        first = self.starts[start]
+        block = np.asarray(self.data[first:self.ends[stop - 1]])
+        block = block.view(block.dtype.str.replace('i', 'f'))
+        # position of the first coordinate of each point within the block
+        owner = np.repeat(np.arange(len(lengths)), lengths)
+        rank = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = self.starts[start:stop][owner] - first + 1 + rank * (3 + self.nb_scalars)
+        points = block[rows[:, None] + np.arange(3)].astype(np.float32)
+        return transform_points(points, self.affine, out=points)
+
+    def iter_chunks(self, chunk_size):
+        """Yields the points and lengths of consecutive chunks of streamlines."""
+
+        for start in range(0, self.nb_streamlines, chunk_size):
+            yield (self.points(start, start + chunk_size),
+                   self.lengths[start:start + chunk_size])
@@ -1,6 +1,7 @@
 from nipype.interfaces import utility as util
 from nipype.pipeline import engine as pe
 from .interfaces import mrtrix3 as mrtrix3
+from ..utils.cache import CachedNode
 import os.path
 
 
@@ -10,7 +11,8 @@ def create_pipeline(name="msmt_csd", opt=""):
                   'no_bias': False,
                   'preproc': False,
                   'bthres': False,
-                  'mask': 'dwi2mask'}
+                  'mask': 'dwi2mask',
+                  'nthreads': None}
 
     inputnode = pe.Node(
         interface=util.IdentityInterface(fields=["dwi", "bvecs", "bvals", "t1_dw"]),
@@ -25,35 +27,41 @@ def create_pipeline(name="msmt_csd", opt=""):
             except ValueError:
                 print(o+': irregular format, skipping')
 
-    mrconvert = pe.Node(interface=mrtrix3.MRConvert(), name='convert')
+    mrconvert = CachedNode(interface=mrtrix3.MRConvert(), name='convert')
 
-    bias_correct = pe.Node(interface=mrtrix3.DWIBiasCorrect(), name='bias_correct')
+    bias_correct = CachedNode(interface=mrtrix3.DWIBiasCorrect(), name='bias_correct',
+                              mem_gb=2)
     bias_correct.inputs.out_file = 'dwi_bias_corrected.mif'
     bias_correct.inputs.use_ants = True
 
-    mask = pe.Node(interface=mrtrix3.BrainMask(), name='dwi_mask')
+    mask = CachedNode(interface=mrtrix3.BrainMask(), name='dwi_mask')
 
-    gen5tt = pe.Node(interface=mrtrix3.Generate5tt(), name='gen5tt')
+    gen5tt = CachedNode(interface=mrtrix3.Generate5tt(), name='gen5tt')
     gen5tt.inputs.algorithm = 'fsl'
     gen5tt.inputs.out_file = '5tt.mif'
 
-    dwiextract = pe.Node(interface=mrtrix3.DWIExtract(), name='dwiextract')
+    dwiextract = CachedNode(interface=mrtrix3.DWIExtract(), name='dwiextract')
     dwiextract.inputs.out_file = 'dwi_nobzero.mif'
 
-    bval = pe.Node(name='bval', interface=util.Function(
+    bval = CachedNode(name='bval', interface=util.Function(
         input_names=['bval_file', 'thres'], output_names=['bval_list'],
         function=generate_bval_list))
 
-    resp = pe.Node(interface=mrtrix3.ResponseSD(), name='response')
+    resp = CachedNode(interface=mrtrix3.ResponseSD(), name='response')
     resp.inputs.algorithm = parameters['algorithm']
     resp.inputs.gm_file = 'gm.txt'
     resp.inputs.csf_file = 'csf.txt'
 
-    dwi2fod = pe.Node(interface=mrtrix3.EstimateFOD(), name='FOD')
+    dwi2fod = CachedNode(interface=mrtrix3.EstimateFOD(), name='FOD', mem_gb=2)
     dwi2fod.inputs.algorithm = 'msmt_csd'
     dwi2fod.inputs.gm_odf = 'gm.mif'
     dwi2fod.inputs.csf_odf = 'csf.mif'
 
+    if parameters['nthreads'] is not None:
+        for node in [bias_correct, dwi2fod]:
+            node.inputs.nthreads = int(parameters['nthreads'])
+            node.n_procs = int(parameters['nthreads'])
+
     workflow = pe.Workflow(name=name)
     workflow.base_output_dir = name
 
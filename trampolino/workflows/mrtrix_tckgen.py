@@ -1,6 +1,9 @@
 from nipype.interfaces import utility as util
 from nipype.pipeline import engine as pe
 from .interfaces import mrtrix3 as mrtrix3
+from .interfaces import nibabel as nba
+from ..utils.streaming import create_member_node, connect_streaming_merge
+from ..utils.connectomes import connect_member_connectomes
 import os.path
 
 
@@ -8,7 +11,13 @@ def create_pipeline(name="tckgen", opt="", ensemble=""):
 
     parameters = {'nos': 5000,
                   'include': None,
-                  'exclude': None}
+                  'exclude': None,
+                  'shards': 1,
+                  'rng_seed': None,
+                  'nthreads': None,
+                  'tag_members': 0,
+                  'stream_merge': 0,
+                  'parc': None}
 
     inputnode = pe.Node(
         interface=util.IdentityInterface(
@@ -24,22 +33,62 @@ def create_pipeline(name="tckgen", opt="", ensemble=""):
             except ValueError:
                 print(o+': irregular format, skipping')
 
-    if ensemble:
+    # no more shards than streamlines (tckgen -select 0 means no limit)
+    shards = max(1, min(int(parameters['shards']), int(parameters['nos'])))
+    # the members are tracked by separate nodes, each appended to the output when done
+    stream = bool(ensemble) and shards == 1 and bool(int(parameters['stream_merge']))
+
+    iterfield = []
+    if ensemble and not stream:
+        iterfield.append(ensemble)
+    if shards > 1:
+        iterfield.extend(['select', 'rng_seed'])
+
+    if iterfield:
         tckgen = pe.MapNode(mrtrix3.Tractography(),
-                         name='track', iterfield=ensemble)
+                         name='track', iterfield=iterfield, mem_gb=1)
     else:
         tckgen = pe.Node(mrtrix3.Tractography(),
-                         name='track')
-    tckgen.inputs.select = int(parameters['nos'])
+                         name='track', mem_gb=1)
+
+    if parameters['nthreads'] is not None:
+        tckgen.inputs.nthreads = int(parameters['nthreads'])
+        tckgen.n_procs = int(parameters['nthreads'])
+
+    # each shard tracks a share of the streamlines with its own random seed
+    rng_seed = parameters['rng_seed']
+    if shards > 1 and ensemble:
+        shard = pe.Node(name='shard', interface=util.Function(
+            input_names=['values', 'nos', 'shards', 'rng_seed'],
+            output_names=['values', 'select', 'rng_seed'],
+            function=shard_parameters))
+        shard.inputs.nos = int(parameters['nos'])
+        shard.inputs.shards = shards
+        shard.inputs.rng_seed = int(rng_seed or 0)
+    elif shards > 1:
+        _, tckgen.inputs.select, tckgen.inputs.rng_seed = shard_parameters(
+            [None], int(parameters['nos']), shards, int(rng_seed or 0))
+    else:
+        tckgen.inputs.select = int(parameters['nos'])
+        if rng_seed is not None:
+            tckgen.inputs.rng_seed = int(rng_seed)
+
     if parameters['include'] is not None:
         tckgen.inputs.roi_incl = os.path.abspath(parameters['include'])
 
     if parameters['exclude'] is not None:
         tckgen.inputs.roi_excl = os.path.abspath(parameters['exclude'])
 
-    tckmerge = pe.Node(interface=mrtrix3.TckEdit(), name="merge")
+    tckmerge = pe.Node(interface=nba.MergeTractograms(), name="merge")
+    tckmerge.inputs.tag_members = bool(int(parameters['tag_members']))
+    # the shards of a member are consecutive inputs of the merge
+    tckmerge.inputs.shards = shards
 
     output_fields = ["tck"]
+    if tckmerge.inputs.tag_members and ensemble:
+        output_fields.append("members")
+    if parameters['parc'] is not None:
+        output_fields.append("connectomes")
     outputnode = pe.Node(
         interface=util.IdentityInterface(fields=output_fields),
         name="outputnode")
@@ -48,21 +97,53 @@ def create_pipeline(name="tckgen", opt="", ensemble=""):
     workflow.base_output_dir = name
 
     workflow.connect([(inputnode, tckgen, [("odf", "in_file"),
-                                           ("seed", "seed_image"),
-                                           ("algorithm", "algorithm"),
-                                           ("angle", "angle"),
-                                           ("min_length", "min_length")])])
+                                           ("seed", "seed_image")])])
+
+    if stream:
+        member = create_member_node(ensemble)
 
-    if ensemble:
+    for param in ["algorithm", "angle", "min_length"]:
+        if stream and param == ensemble:
+            workflow.connect([(member, tckgen, [(param, param)])])
+        elif shards > 1 and param == ensemble:
+            workflow.connect([(inputnode, shard, [(param, "values")]),
+                              (shard, tckgen, [("values", param),
+                                               ("select", "select"),
+                                               ("rng_seed", "rng_seed")])])
+        else:
+            workflow.connect([(inputnode, tckgen, [(param, param)])])
+
+    if stream:
+        connect_streaming_merge(workflow, member, tckgen, "out_file", outputnode,
+                                '.tck', tckmerge.inputs.tag_members,
+                                inputnode)
+    elif iterfield:
         workflow.connect([
             (tckgen, tckmerge, [("out_file", "in_files")]),
             (tckmerge, outputnode, [("out_file", "tck")])
         ])
+        if "members" in output_fields:
+            workflow.connect([(tckmerge, outputnode, [("members_file", "members")])])
     else:
         workflow.connect([(tckgen, outputnode, [("out_file", "tck")])])
 
+    # a connectome for each member, as soon as its tractogram is done
+    if parameters['parc'] is not None:
+        connect_member_connectomes(workflow, tckgen, "out_file", outputnode,
+                                   os.path.abspath(parameters['parc']),
+                                   member if stream else None, ensemble, inputnode, shards)
+
     return workflow
 
 
 def get_parent():
     return "mrtrix_msmt_csd"
+
+
+def shard_parameters(values, nos, shards, rng_seed):
+
+    counts = [nos // shards + (i < nos % shards) for i in range(shards)]
+    sharded_values = [v for v in values for _ in range(shards)]
+    seeds = [rng_seed + i for i in range(len(sharded_values))]
+
+    return sharded_values, counts * len(values), seeds
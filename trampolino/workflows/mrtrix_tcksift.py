@@ -5,7 +5,8 @@ from .interfaces import mrtrix3 as mrtrix3
 
 def create_pipeline(name="tcksift", opt=""):
 
-    parameters = {'term_n': None}
+    parameters = {'term_n': None,
+                  'nthreads': None}
 
     inputnode = pe.Node(
         interface=util.IdentityInterface(fields=["tck", "odf"]),
@@ -20,10 +21,14 @@ def create_pipeline(name="tcksift", opt=""):
             except ValueError:
                 print(o+': irregular format, skipping')
 
-    tcksift = pe.Node(mrtrix3.TckSIFT(), name='SIFT')
+    tcksift = pe.Node(mrtrix3.TckSIFT(), name='SIFT', mem_gb=4)
     if parameters['term_n'] is not None:
         tcksift.inputs.term_number = int(parameters['term_n'])
 
+    if parameters['nthreads'] is not None:
+        tcksift.inputs.nthreads = int(parameters['nthreads'])
+        tcksift.n_procs = int(parameters['nthreads'])
+
     output_fields = ["tck_post"]
     outputnode = pe.Node(
         interface=util.IdentityInterface(fields=output_fields),
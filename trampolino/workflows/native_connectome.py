@@ -0,0 +1,58 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+import os.path
+
+
+def create_pipeline(name="native_connectome", opt=""):
+
+    parameters = {'parc': None,
+                  'weights': None,
+                  'lengths': None,
+                  'chunk_size': 100000}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf", "endpoints"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    if parameters['parc'] is None:
+        raise ValueError('A parcellation is required (parc option).')
+
+    connectome = pe.Node(nba.ComputeConnectome(), name='connectome')
+    connectome.inputs.in_parc = os.path.abspath(parameters['parc'])
+    if parameters['lengths'] is not None:
+        connectome.inputs.lengths = bool(int(parameters['lengths']))
+    connectome.inputs.chunk_size = int(parameters['chunk_size'])
+    if parameters['weights'] is not None:
+        connectome.inputs.weights = os.path.abspath(parameters['weights'])
+
+    output_fields = ["tck_post", "connectome"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([(inputnode, connectome, [("tck", "in_file"),
+                                               ("endpoints", "endpoints")])])
+
+    workflow.connect([
+        (inputnode, outputnode, [("tck", "tck_post")]),
+        (connectome, outputnode, [("out_file", "connectome")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
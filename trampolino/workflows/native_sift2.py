@@ -0,0 +1,59 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+
+
+def create_pipeline(name="native_sift2", opt=""):
+
+    parameters = {'iterations': 100,
+                  'min_factor': 0.,
+                  'max_factor': None,
+                  'chunk_size': 100000,
+                  'nthreads': None}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    sift = pe.Node(nba.EstimateWeights(), name='sift2', mem_gb=4)
+    sift.inputs.iterations = int(parameters['iterations'])
+    sift.inputs.min_factor = float(parameters['min_factor'])
+    sift.inputs.chunk_size = int(parameters['chunk_size'])
+    if parameters['max_factor'] is not None:
+        sift.inputs.max_factor = float(parameters['max_factor'])
+
+    if parameters['nthreads'] is not None:
+        sift.inputs.workers = int(parameters['nthreads'])
+        sift.n_procs = int(parameters['nthreads'])
+
+    output_fields = ["tck_post", "weights"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([(inputnode, sift, [("tck", "in_file"),
+                                         ("odf", "in_fod")])])
+
+    # the streamlines are kept, each with its weight
+    workflow.connect([
+        (inputnode, outputnode, [("tck", "tck_post")]),
+        (sift, outputnode, [("out_weights", "weights")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
@@ -0,0 +1,62 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+import os.path
+
+
+def create_pipeline(name="native_tdi", opt=""):
+
+    parameters = {'ref': None,
+                  'contrast': 'count',
+                  'weights': None,
+                  'chunk_size': 100000,
+                  'nthreads': None}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    tdi = pe.Node(nba.TrackDensity(), name='tdi', mem_gb=2)
+    tdi.inputs.contrast = parameters['contrast']
+    tdi.inputs.chunk_size = int(parameters['chunk_size'])
+    if parameters['weights'] is not None:
+        tdi.inputs.weights = os.path.abspath(parameters['weights'])
+    if parameters['ref'] is not None:
+        tdi.inputs.reference = os.path.abspath(parameters['ref'])
+
+    if parameters['nthreads'] is not None:
+        tdi.inputs.workers = int(parameters['nthreads'])
+        tdi.n_procs = int(parameters['nthreads'])
+
+    output_fields = ["tck_post", "tdi"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([(inputnode, tdi, [("tck", "in_file")])])
+    # by default, the map is on the grid of the FOD
+    if parameters['ref'] is None:
+        workflow.connect([(inputnode, tdi, [("odf", "reference")])])
+
+    workflow.connect([
+        (inputnode, outputnode, [("tck", "tck_post")]),
+        (tdi, outputnode, [("out_file", "tdi")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
@@ -0,0 +1,57 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+
+
+def create_pipeline(name="resample", opt=""):
+
+    parameters = {'step': None,
+                  'nb_points': None,
+                  'tolerance': None,
+                  'max_segment': 10.,
+                  'chunk_size': 100000}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    resample = pe.Node(nba.ResampleStreamlines(), name='resample')
+    resample.inputs.max_segment = float(parameters['max_segment'])
+    resample.inputs.chunk_size = int(parameters['chunk_size'])
+    if parameters['step'] is not None:
+        resample.inputs.step = float(parameters['step'])
+    if parameters['nb_points'] is not None:
+        resample.inputs.nb_points = int(parameters['nb_points'])
+    if parameters['tolerance'] is not None:
+        resample.inputs.tolerance = float(parameters['tolerance'])
+
+    output_fields = ["tck_post"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([
+        (inputnode, resample, [("tck", "in_file")])
+    ])
+
+    workflow.connect([
+        (resample, outputnode, [("out_file", "tck_post")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
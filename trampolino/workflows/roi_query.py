@@ -0,0 +1,59 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+import os.path
+
+
+def create_pipeline(name="roi_query", opt=""):
+
+    parameters = {'ref': None,
+                  'include': None,
+                  'exclude': None,
+                  'ends_in': None,
+                  'index': None,
+                  'chunk_size': 100000}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    query = pe.Node(nba.QueryTractogram(), name='query')
+    query.inputs.chunk_size = int(parameters['chunk_size'])
+    if parameters['ref'] is not None:
+        query.inputs.ref = os.path.abspath(parameters['ref'])
+    if parameters['index'] is not None:
+        query.inputs.index_file = os.path.abspath(parameters['index'])
+    for roi in ('include', 'exclude', 'ends_in'):
+        if parameters[roi] is not None:
+            setattr(query.inputs, roi, [os.path.abspath(f) for f in parameters[roi].split('+')])
+
+    output_fields = ["tck_post"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([
+        (inputnode, query, [("tck", "in_file")])
+    ])
+
+    workflow.connect([
+        (query, outputnode, [("out_file", "tck_post")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
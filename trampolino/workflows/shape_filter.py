@@ -0,0 +1,53 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+
+
+def create_pipeline(name="shape_filter", opt=""):
+
+    parameters = {'min_length': None,
+                  'max_length': None,
+                  'max_curvature': None,
+                  'max_tortuosity': None,
+                  'chunk_size': 100000}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    shape = pe.Node(nba.FilterStreamlines(), name='shape')
+    shape.inputs.chunk_size = int(parameters['chunk_size'])
+    for bound in ('min_length', 'max_length', 'max_curvature', 'max_tortuosity'):
+        if parameters[bound] is not None:
+            setattr(shape.inputs, bound, float(parameters[bound]))
+
+    output_fields = ["tck_post"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([
+        (inputnode, shape, [("tck", "in_file")])
+    ])
+
+    workflow.connect([
+        (shape, outputnode, [("out_file", "tck_post")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
@@ -0,0 +1,49 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+
+
+def create_pipeline(name="subsample", opt=""):
+
+    parameters = {'nb_streamlines': 10000,
+                  'seed': None}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "odf"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    sample = pe.Node(nba.SampleTractogram(), name='sample')
+    sample.inputs.nb_streamlines = int(parameters['nb_streamlines'])
+    if parameters['seed'] is not None:
+        sample.inputs.seed = int(parameters['seed'])
+
+    output_fields = ["tck_post"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([
+        (inputnode, sample, [("tck", "in_file")])
+    ])
+
+    workflow.connect([
+        (sample, outputnode, [("out_file", "tck_post")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return "mrtrix_tckgen"
@@ -0,0 +1,48 @@
+from nipype.interfaces import utility as util
+from nipype.pipeline import engine as pe
+from .interfaces import nibabel as nba
+
+
+def create_pipeline(name="tck2tcz", opt=""):
+
+    parameters = {'precision': 0.01,
+                  'chunk_size': 0}
+
+    inputnode = pe.Node(
+        interface=util.IdentityInterface(fields=["tck", "ref"]),
+        name="inputnode")
+
+    if opt is not None:
+        opt_list = opt.split(',')
+        for o in opt_list:
+            try:
+                [key, value] = o.split(':')
+                parameters[key] = value
+            except ValueError:
+                print(o+': irregular format, skipping')
+
+    conversion = pe.Node(nba.conversion.Tck2Tcz(), name='tck2tcz')
+    conversion.inputs.precision = float(parameters['precision'])
+    conversion.inputs.chunk_size = int(parameters['chunk_size'])
+
+    output_fields = ["trk"]
+    outputnode = pe.Node(
+        interface=util.IdentityInterface(fields=output_fields),
+        name="outputnode")
+
+    workflow = pe.Workflow(name=name)
+    workflow.base_output_dir = name
+
+    workflow.connect([
+        (inputnode, conversion, [("tck", "input_tck")])
+    ])
+
+    workflow.connect([
+        (conversion, outputnode, [("output_tcz", "trk")])
+    ])
+
+    return workflow
+
+
+def get_parent():
+    return None
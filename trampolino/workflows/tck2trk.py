@@ -6,7 +6,8 @@ import os.path
 
 def create_pipeline(name="tck2trk", opt=""):
 
-    parameters = {}
+    parameters = {'chunk_size': 0,
+                  'precision': 'single'}
 
     inputnode = pe.Node(
         interface=util.IdentityInterface(fields=["tck", "ref"]),
@@ -22,6 +23,8 @@ def create_pipeline(name="tck2trk", opt=""):
                 print(o+': irregular format, skipping')
 
     conversion = pe.Node(nba.conversion.Tck2Trk(), name='tck2trk')
+    conversion.inputs.chunk_size = int(parameters['chunk_size'])
+    conversion.inputs.single_precision = parameters['precision'] == 'single'
 
     output_fields = ["trk"]
     outputnode = pe.Node(